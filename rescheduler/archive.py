@@ -0,0 +1,185 @@
+"""
+Module for archiving the schedules of closed months by year
+
+The calendar only edits schedules of the current and coming months, yet
+every schedule since the store opened is kept. Archiving moves the
+schedules of months before a given month out of the live database into a
+database file of their year next to it, e.g. 35_archive_2016.db, with the
+same schema. The live database stays small, so its pages and indexes stay
+in sqlite's cache.
+
+Archives are read by attaching them to the connection of a session. Reads
+through core_reads.select_schedules given a range of dates attach the
+archives of the years in the range and read them along with the live
+database. For example, to archive every month before 2017 then compare the
+cost of each month of 2017 with 2016:
+
+    python archive.py 35 archive 2017-01
+    python archive.py 35 compare 2017
+"""
+
+import argparse
+import datetime
+import os
+from sqlalchemy import (create_engine, select, and_, MetaData, Table, 
+                        Column)
+from orm_models import (Base, Schedule, SCHEMA_VERSION, create_indexes,
+                        set_schema_version, start_db)
+
+SCHEDULES = Schedule.__table__
+
+
+def get_archive_path(db_path, year):
+    """Return path of the archive of a year of a database."""
+    return "%s_archive_%s.db" % (os.path.splitext(db_path)[0], year)
+
+
+def get_archive_schema(year):
+    """Return name an archive of a year is attached with."""
+    return "archive_%s" % year
+
+
+def get_archive_table(schema):
+    """Return the schedules table of an attached archive.
+
+    The table has the columns of the live table without their foreign keys,
+    as the employee table they refer to is not in the archive.
+    """
+
+    return Table(SCHEDULES.name, MetaData(),
+                 *[Column(c.name, c.type, primary_key=c.primary_key)
+                   for c in SCHEDULES.c],
+                 schema=schema)
+
+
+def create_archive(path):
+    """Create an archive database with the schema of the live database."""
+    engine = create_engine('sqlite:///' + path)
+    Base.metadata.create_all(engine)
+    create_indexes(engine)
+    set_schema_version(engine, SCHEMA_VERSION)
+    engine.dispose()
+
+
+def attach_archives(connection, db_path, start_date, end_date):
+    """Attach the archives of the years of a date range to a connection.
+
+    Archives already attached and years without an archive are skipped.
+    Attaching ends any transaction of the connection, so this should be
+    called before it makes changes. Sqlite attaches at most 10 databases to
+    a connection.
+
+    Args:
+        connection: An sqlalchemy connection to the live database.
+        db_path: String path of the live database file.
+        start_date: datetime.date of the first day of the range.
+        end_date: datetime.date of the last day of the range.
+    Returns:
+        A list of the schema names of the archives of the range.
+    """
+
+    attached = set(row[1] for row in
+                   connection.execute("PRAGMA database_list"))
+    schemas = []
+    for year in range(start_date.year, end_date.year + 1):
+        path = get_archive_path(db_path, year)
+        schema = get_archive_schema(year)
+        if schema not in attached:
+            if not os.path.exists(path):
+                continue
+            connection.execute("ATTACH DATABASE ? AS %s" % schema, (path,))
+        schemas.append(schema)
+    return schemas
+
+
+def archive_months(session, before):
+    """Move the schedules of every month before a month to their archives.
+
+    The rows of each year are copied into its archive and deleted from the
+    live database in one transaction. In WAL mode sqlite commits each 
+    attached database on its own, so a crash while committing may still 
+    leave rows in both. Copies replace rows of the same primary key, so 
+    archiving again afterwards is safe. Schedule keys are never reused, 
+    so a new schedule is not given the key of an archived one.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        before: datetime.date of the first month to keep live.
+    Returns:
+        A dict of each year archived to the number of schedules moved.
+    """
+
+    before = datetime.date(before.year, before.month, 1)
+    db_path = session.bind.url.database
+    years = set(row[0].year for row in session.execute(
+                    select([SCHEDULES.c.calendar_date])
+                    .where(SCHEDULES.c.calendar_date < before)
+                    .distinct()))
+    session.close()
+    moved = {}
+    connection = session.bind.connect()
+    try:
+        for year in sorted(years):
+            path = get_archive_path(db_path, year)
+            if not os.path.exists(path):
+                create_archive(path)
+            schema = attach_archives(connection, db_path,
+                                     datetime.date(year, 1, 1),
+                                     datetime.date(year, 1, 1))[0]
+            criteria = and_(SCHEDULES.c.calendar_date
+                            >= datetime.date(year, 1, 1),
+                            SCHEDULES.c.calendar_date
+                            < min(datetime.date(year + 1, 1, 1), before))
+            archive = get_archive_table(schema)
+            with connection.begin():
+                connection.execute(archive.insert()
+                                          .prefix_with('OR REPLACE')
+                                          .from_select(SCHEDULES.c.keys(),
+                                                       select([SCHEDULES])
+                                                       .where(criteria)))
+                result = connection.execute(SCHEDULES.delete()
+                                                     .where(criteria))
+            moved[year] = result.rowcount
+    finally:
+        connection.close()
+    return moved
+
+
+def main():
+    """Archive closed months or compare costs of a year with the last."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('db_name', help="Database name without .db, e.g. 35")
+    subparsers = parser.add_subparsers(dest='command')
+    archive_parser = subparsers.add_parser('archive',
+                                           help="archive closed months")
+    archive_parser.add_argument('before',
+                                help="first month to keep live, YYYY-MM")
+    compare_parser = subparsers.add_parser('compare',
+                                           help="compare monthly costs of "
+                                                "a year with the year before")
+    compare_parser.add_argument('year', type=int)
+    compare_parser.add_argument('--department', default=None)
+    args = parser.parse_args()
+
+    # Imported here as schedule_metrics reads through core_reads, which
+    # imports this module
+    from schedule_metrics import get_monthly_costs
+    session = start_db(args.db_name)
+    if args.command == 'archive':
+        before = datetime.datetime.strptime(args.before, "%Y-%m").date()
+        moved = archive_months(session, before)
+        for year in sorted(moved):
+            print("%s: %s schedules archived." % (year, moved[year]))
+        print("%s schedules archived." % sum(moved.values()))
+    else:
+        costs = get_monthly_costs(session, args.year, args.department)
+        last_costs = get_monthly_costs(session, args.year - 1,
+                                       args.department)
+        print("%-5s %10s %10s" % ("month", args.year - 1, args.year))
+        for month in range(12):
+            print("%-5s %10s %10s" % (month + 1, last_costs[month],
+                                      costs[month]))
+
+
+if __name__ == '__main__':
+    main()
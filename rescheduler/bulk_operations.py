@@ -0,0 +1,434 @@
+"""
+Module for creating and changing many schedules in a single transaction
+
+These functions work on the database directly and so can be used by the
+calendar as well as from scripts without the GUI.
+"""
+
+import datetime
+from sqlalchemy import func, select, literal, null, case, or_
+from orm_models import (Schedule, Employee, Vacation, UnavailableTime, 
+                        Department, StaffingRequirement, ShiftTemplate, 
+                        ShiftOverride, TemplateExpansion)
+from conflict_report import MAX_SCHEDULE_LENGTH, find_conflicts
+from unit_of_work import (commit, transaction, expire_employee_schedules, 
+                          expunge_schedules, expunge_employee, 
+                          expunge_department, DEPARTMENT_COLUMNS)
+
+
+def get_schedule_row(start, end, s_hide, e_hide, department):
+    """Return dict of column values of a new schedule for an insert.
+
+    The derived columns, such as the schedule date, are set exactly as they
+    are when a Schedule object is created.
+
+    Args:
+        start: datetime.datetime object for start datetime of schedule.
+        end: datetime.datetime object for end datetime of schedule.
+        s_hide: Boolean to determine to hide start time string in the view.
+        e_hide: Boolean to determine to hide end time string in the view.
+        department: String to determine department the schedule belongs to.
+    """
+
+    schedule = Schedule(start, end, s_hide, e_hide, department)
+    return {c.name: getattr(schedule, c.name)
+            for c in Schedule.__table__.columns
+            if c.name not in ('id', 'employee_id')}
+
+
+def validate_schedules(schedule_tuples):
+    """Raise ValueError if any of the schedules to create are invalid.
+
+    Args:
+        schedule_tuples: list of (start, end, s_hide, e_hide, department)
+            tuples as taken by create_schedules.
+    """
+
+    errors = []
+    for i, schedule_tuple in enumerate(schedule_tuples):
+        start, end, s_hide, e_hide, department = schedule_tuple
+        if not start < end:
+            errors.append("%s: start time %s is not before end time %s"
+                          % (i, start, end))
+        elif end - start > MAX_SCHEDULE_LENGTH:
+            errors.append("%s: schedule from %s to %s is longer than a day"
+                          % (i, start, end))
+        if not department:
+            errors.append("%s: schedule has no department" % i)
+    if errors:
+        raise ValueError("Invalid schedules:\n" + "\n".join(errors))
+
+
+def create_schedules(session, schedule_tuples):
+    """Create many schedules in one transaction and return them.
+
+    All schedules are validated before any are inserted, so either every
+    schedule is created or, if any is invalid, none are. The rows are
+    inserted with a single executemany and committed once.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        schedule_tuples: list of (start, end, s_hide, e_hide, department)
+            tuples as taken by insert_schedules.
+    Returns:
+        A list of the created schedule objects in the same order as 
+        schedule_tuples.
+    Raises:
+        ValueError: If any schedule is invalid.
+    """
+
+    schedules = insert_schedules(session, schedule_tuples)
+    commit(session)
+    return schedules
+
+
+def insert_schedules(session, schedule_tuples):
+    """Insert many schedules in the session's transaction without commit.
+
+    This allows other changes to be committed together with the schedules.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        schedule_tuples: list of (start, end, s_hide, e_hide, department)
+            tuples where start and end are datetime.datetime objects, s_hide
+            and e_hide are Booleans to hide the start and end times in the
+            view and department is the string name of the department.
+    Returns:
+        A list of the created schedule objects sorted by primary key, in the
+        same order as schedule_tuples.
+    Raises:
+        ValueError: If any schedule is invalid.
+    """
+
+    validate_schedules(schedule_tuples)
+    if not schedule_tuples:
+        return []
+    rows = [get_schedule_row(*t) for t in schedule_tuples]
+    session.execute(Schedule.__table__.insert(), rows)
+    return get_inserted_schedules(session, len(rows))
+
+
+def get_inserted_schedules(session, count):
+    """Return the schedules just inserted in the session's transaction.
+
+    The insert took the write lock of the database, which is held until the
+    transaction ends, so no other connection can have inserted a schedule
+    since. The ids of the inserted rows are thus the greatest count ids.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        count: Integer number of schedules inserted by the last statement.
+    Returns:
+        A list of the inserted schedule objects sorted by primary key.
+    """
+
+    if not count:
+        return []
+    ids = [i for (i,) in session.query(Schedule.id)
+                                .order_by(Schedule.id.desc())
+                                .limit(count)]
+    return (session.query(Schedule)
+                   .filter(Schedule.id >= min(ids))
+                   .order_by(Schedule.id)
+                   .all())
+
+
+def get_aligned_offset(start_date, target_date):
+    """Return days to shift dates by to move start_date near target_date.
+    
+    The offset is a whole number of weeks so every date keeps its weekday,
+    rounded to whichever number of weeks lands nearest to target_date.
+    
+    Args:
+        start_date: datetime.date of the first day of the range to move.
+        target_date: datetime.date of the day to move the range to.
+    """
+    
+    offset = (target_date - start_date).days
+    return offset - ((offset + 3) % 7 - 3)
+
+
+def get_day_shifts(start_date, end_date, target_date):
+    """Return the number of days to move each day of a range by.
+
+    Each day is moved by the offset of get_aligned_offset. A day whose copy
+    would land before the target range, which is as long as the source
+    range and starts at target_date, is moved a week later instead, and one
+    whose copy would land after it a week earlier. So every day keeps its
+    weekday and, if the range is at least a week long, lands in the target
+    range.
+
+    Args:
+        start_date: datetime.date of the first day of the range to move.
+        end_date: datetime.date of the last day of the range to move.
+        target_date: datetime.date of the first day to move the range to.
+    Returns:
+        A list of (first_day, last_day, days) tuples of consecutive days of
+        the range moved by the same number of days, sorted by first_day.
+        Days that cannot be moved into the target range are left out.
+    """
+
+    offset = get_aligned_offset(start_date, target_date)
+    target_end = target_date + (end_date - start_date)
+    one_day = datetime.timedelta(days=1)
+    shifts = []
+    day = start_date
+    while day <= end_date:
+        for days in (offset, offset + 7, offset - 7):
+            target_day = day + datetime.timedelta(days=days)
+            if target_date <= target_day <= target_end:
+                if (shifts and shifts[-1][2] == days 
+                    and shifts[-1][1] == day - one_day):
+                    shifts[-1] = (shifts[-1][0], day, days)
+                else:
+                    shifts.append((day, day, days))
+                break
+        day += one_day
+    return shifts
+
+
+def clone_schedules(session, department, start_date, end_date, target_date,
+                    keep_assignments=False):
+    """Copy the schedules of a department in a date range to a later range.
+
+    The schedules are shifted by a whole number of weeks into the target
+    range, which is as long as the source range and starts at target_date,
+    see get_day_shifts. The copy is a single INSERT ... SELECT so no 
+    schedule is loaded into python. When assignments are kept the conflicts
+    of the target range are found in bulk afterwards.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        department: String name of the department of schedules to copy.
+        start_date: datetime.date of the first day of schedules to copy.
+        end_date: datetime.date of the last day of schedules to copy.
+        target_date: datetime.date of the first day to copy schedules to.
+        keep_assignments: Boolean to copy the employee of each schedule,
+            otherwise the copies are unassigned.
+    Returns:
+        A tuple of the list of created schedule objects sorted by start and
+        the list of conflict_report.Conflict of the created schedules.
+    """
+
+    target_end = target_date + (end_date - start_date)
+    day_shifts = [(Schedule.schedule_date.between(first_day, last_day), 
+                   literal('%+d days' % days))
+                  for first_day, last_day, days 
+                  in get_day_shifts(start_date, end_date, target_date)]
+    if not day_shifts:
+        return [], []
+    shift = case(day_shifts)
+
+    # SQLite's datetime() drops microseconds, append those of the original
+    def shift_datetime(column):
+        return func.datetime(column, shift).op('||')(func.substr(column, 20))
+
+    employee_id = Schedule.employee_id if keep_assignments else null()
+    columns = ['calendar_date', 'schedule_date', 'start_datetime', 
+               'end_datetime', 'start_time', 'end_time', 'department', 
+               's_undetermined_time', 'e_undetermined_time', 'employee_id']
+    source = (select([func.date(Schedule.schedule_date, shift, 
+                                'start of month'),
+                      func.date(Schedule.schedule_date, shift),
+                      shift_datetime(Schedule.start_datetime),
+                      shift_datetime(Schedule.end_datetime),
+                      Schedule.start_time,
+                      Schedule.end_time,
+                      Schedule.department,
+                      Schedule.s_undetermined_time,
+                      Schedule.e_undetermined_time,
+                      employee_id])
+              .where(Schedule.department == department)
+              .where(or_(*[day for day, days in day_shifts]))
+              .order_by(Schedule.start_datetime))
+    result = session.execute(Schedule.__table__.insert()
+                                              .from_select(columns, source))
+    schedules = get_inserted_schedules(session, result.rowcount)
+    commit(session)
+    schedules.sort(key=lambda s: s.start_datetime)
+    if keep_assignments:
+        expire_employee_schedules(session, set(s.employee_id 
+                                               for s in schedules))
+    conflicts = []
+    if keep_assignments and schedules:
+        new_ids = set(s.id for s in schedules)
+        conflicts = [c for c in find_conflicts(session, target_date, 
+                                               target_end)
+                     if c.schedule_id in new_ids]
+    return schedules, conflicts
+
+
+def delete_schedules(session, department, start_date, end_date,
+                     unassigned_only=False):
+    """Delete the schedules of a department in a date range.
+
+    The schedules are deleted by a single DELETE statement without loading
+    them as objects. Only their ids and dates are read beforehand so that
+    cached models of the schedules can be updated.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        department: String name of the department of schedules to delete.
+        start_date: datetime.date of the first day of schedules to delete.
+        end_date: datetime.date of the last day of schedules to delete.
+        unassigned_only: Boolean to only delete schedules with no employee.
+    Returns:
+        A list of (id, schedule_date, department, employee_id) of the 
+        deleted schedules.
+    """
+
+    query = (session.query(Schedule)
+                    .filter(Schedule.department == department,
+                            Schedule.schedule_date >= start_date,
+                            Schedule.schedule_date <= end_date))
+    if unassigned_only:
+        query = query.filter(Schedule.employee_id == None)
+    deleted = query.with_entities(Schedule.id, Schedule.schedule_date,
+                                  Schedule.department, 
+                                  Schedule.employee_id).all()
+    if deleted:
+        query.delete(synchronize_session=False)
+        commit(session)
+        expunge_schedules(session, set(d.id for d in deleted))
+        expire_employee_schedules(session, set(d.employee_id 
+                                               for d in deleted))
+    return deleted
+
+
+def remove_employee(session, employee_id):
+    """Delete an employee and every row that refers to it.
+
+    The employee's schedules are unassigned and its vacations and repeating
+    unavailability deleted, with one statement for each table in a single
+    transaction. No row is loaded as an object, only the schedules' ids and
+    dates are read beforehand so that cached models of them can be updated.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        employee_id: Primary key of the employee.
+    Returns:
+        A list of (id, schedule_date, department) of the unassigned 
+        schedules.
+    """
+
+    schedules = session.query(Schedule).filter(Schedule.employee_id 
+                                               == employee_id)
+    unassigned = schedules.with_entities(Schedule.id, Schedule.schedule_date,
+                                         Schedule.department).all()
+    with transaction(session):
+        schedules.update({'employee_id': None}, synchronize_session=False)
+        for model in [Vacation, UnavailableTime]:
+            (session.query(model)
+                    .filter(model.employee_id == employee_id)
+                    .delete(synchronize_session=False))
+        (session.query(Employee)
+                .filter(Employee.id == employee_id)
+                .delete(synchronize_session=False))
+    expunge_employee(session, employee_id)
+    return unassigned
+
+
+def get_unshared_name(session, department_id):
+    """Return the name of a department, None if another department has it.
+
+    Rows refer to a department by its name, so they are only removed with
+    the department if no other department has the same name.
+    """
+
+    name = (session.query(Department.name)
+                   .filter(Department.id == department_id)
+                   .scalar())
+    same_name = (session.query(Department)
+                        .filter(Department.name == name,
+                                Department.id != department_id)
+                        .count())
+    return None if same_name else name
+
+
+def count_department_rows(session, department_id):
+    """Return how many rows remove_department would delete with a department.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        department_id: Primary key of the department.
+    Returns:
+        A tuple of the number of live schedules, staffing requirements and
+        shift templates of the department.
+    """
+
+    name = get_unshared_name(session, department_id)
+    if name is None:
+        return (0, 0, 0)
+    return tuple(session.query(model)
+                        .filter(model.department == name)
+                        .count()
+                 for model in [Schedule, StaffingRequirement, ShiftTemplate])
+
+
+def remove_department(session, department_id):
+    """Delete a department and every row that refers to it.
+
+    The department's schedules, staffing requirements and shift templates
+    are deleted, and employees stop working in it, with one statement for
+    each table in a single transaction. Archived schedules are kept. If 
+    another department has the same name only the department is deleted.
+    See count_department_rows for how many rows this deletes.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        department_id: Primary key of the department.
+    Returns:
+        A list of (id, schedule_date, department, employee_id) of the 
+        deleted schedules.
+    """
+
+    name = get_unshared_name(session, department_id)
+    same_name = name is None
+    schedules = session.query(Schedule).filter(Schedule.department == name)
+    deleted = []
+    if not same_name:
+        deleted = schedules.with_entities(Schedule.id, Schedule.schedule_date,
+                                          Schedule.department,
+                                          Schedule.employee_id).all()
+    with transaction(session):
+        (session.query(Department)
+                .filter(Department.id == department_id)
+                .delete(synchronize_session=False))
+        if not same_name:
+            schedules.delete(synchronize_session=False)
+            (session.query(StaffingRequirement)
+                    .filter(StaffingRequirement.department == name)
+                    .delete(synchronize_session=False))
+            template_ids = (select([ShiftTemplate.id])
+                            .where(ShiftTemplate.department == name))
+            for model in [ShiftOverride, TemplateExpansion]:
+                (session.query(model)
+                        .filter(model.template_id.in_(template_ids))
+                        .delete(synchronize_session=False))
+            (session.query(ShiftTemplate)
+                    .filter(ShiftTemplate.department == name)
+                    .delete(synchronize_session=False))
+            columns = [getattr(Employee, c) for c in DEPARTMENT_COLUMNS]
+            (session.query(Employee)
+                    .filter(or_(*[c == name for c in columns]))
+                    .update(dict((c.key, case([(c == name, "None")], 
+                                              else_=c))
+                                 for c in columns),
+                            synchronize_session=False))
+    if same_name:
+        expunge_department(session, department_id)
+    else:
+        expunge_department(session, department_id, name)
+        expire_employee_schedules(session, set(d.employee_id 
+                                               for d in deleted))
+    return deleted
+
+
+def get_affected_days(schedules):
+    """Return set of (date, department) of the days a list of schedules is on.
+
+    Args:
+        schedules: list of schedule objects.
+    """
+
+    return set((s.schedule_date, s.department) for s in schedules)
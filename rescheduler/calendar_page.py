@@ -17,10 +17,27 @@ from employee_page import (EmployeePage, EmployeeList, DepartmentList,
                            EmployeeInfoForm, EmployeeRepeatUnavailable, 
                            EmployeeVacations)
 from sales_page import SalesPage
+from staffing_page import StaffingPage
+from template_page import TemplatePage
 from datetime_widgets import TimeEntry, DateEntry, yearify
-from orm_models import Schedule, Employee, Department, MonthSales
+from orm_models import (Schedule, Employee, Department, MonthSales, 
+                        SLOTS_PER_DAY)
+from schedule_metrics import (MonthCoverage, get_staffing_gaps, 
+                              get_gap_overlaps, get_day_percentages)
+from bulk_operations import (create_schedules, get_affected_days, 
+                             clone_schedules, delete_schedules,
+                             validate_schedules)
+from shift_templates import expand_templates, has_unexpanded_templates
+from unit_of_work import (transaction, close_idle_session, 
+                          expunge_schedules, expire_employee_schedules)
+from write_queue import WriteQueue
+from read_cache import ReadModelCache
+from month_file import (load_month_file, save_month_file, 
+                        remove_month_file, load_read_models)
+from snapshots import MonthSnapshot, get_schedule_snapshot
 
 from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 
 from openpyxl import Workbook, load_workbook, cell
@@ -41,59 +58,105 @@ class ReScheduler(object):
     browse different pages of the program.
     """
     
-    def __init__(self, parent, session):
+    def __init__(self, parent, session_factory):
         """Initiate tabs for user to browse between GUI pages in program.
     
-        There are three pages that this init method creates. The first is the
+        There are five pages that this init method creates. The first is the
         calendar page which displays the calendar, schedule editor and costs
         of calendars relative to average total monthly sales. The second page
         is the employee/department page where employees are added, edited, 
-        and removed, and a monthly sales page where total monthly sales can be 
-        added and removed by the user.
+        and removed, a monthly sales page where total monthly sales can be 
+        added and removed by the user, a staffing page where minimum
+        staffing requirements of departments are added and removed, and a
+        template page where shifts that repeat every week are added and
+        removed.
+        
+        Every page writes through one write queue, committed by its worker
+        thread, so the window does not freeze while the database commits 
+        and the session the pages share only reads. Autofill is the one 
+        exception, its assignments are a single transaction of the shared
+        session, see WriteQueue.submit. The session is closed whenever the
+        calendar changes month, and a cache of the read models stays 
+        resident. The read models are taken from the month file if the 
+        database has not changed since it was saved.
         
         Args:
             parent: A parent tkinter frame object.
-            session: An sqlalchemy session object using sqlite3.
+            session_factory: sessionmaker from create_session_factory.
         """
         
+        session = session_factory()
+        self.session = session
+        self.read_cache = ReadModelCache(session_factory)
+        self.write_queue = WriteQueue(session, parent, session_factory)
+        load_read_models(session, self.read_cache)
         n = ttk.Notebook(parent)
         n.pack()
         
-        dep_list = [d.name for d in session.query(Department).all()]
+        dep_list = self.read_cache.get('departments')
         now = datetime.datetime.now()
         month, year = int(now.strftime("%m")), int(now.strftime("%Y"))
         date = datetime.date(year, month, 1)
         
         # Calendar page
         calendar_frame = ttk.Frame(n)
-        calendar = CalendarPage(calendar_frame, session, date, dep_list)
+        calendar = CalendarPage(calendar_frame, session, date, dep_list,
+                                self.write_queue, self.read_cache)
+        self.calendar_page = calendar
         # Employee page                   
         employee_page_frame = ttk.Frame(n)
-        employee_page = EmployeePage(employee_page_frame, session)
+        employee_page = EmployeePage(employee_page_frame, session, 
+                                     self.write_queue, self.read_cache,
+                                     calendar)
         employee_page.pack()
         # Sales page
         sales_page_frame = ttk.Frame(n)
         sales_page = SalesPage(sales_page_frame, session, calendar)
+        # Staffing page
+        staffing_page_frame = ttk.Frame(n)
+        staffing_page = StaffingPage(staffing_page_frame, session, calendar)
+        # Shift template page
+        template_page_frame = ttk.Frame(n)
+        template_page = TemplatePage(template_page_frame, session, calendar)
                                     
         n.add(calendar_frame, text="Calendar")
         n.add(employee_page_frame, text="Employees And Departments")
         n.add(sales_page_frame, text="Monthly Revenue Data")
+        n.add(staffing_page_frame, text="Staffing Requirements")
+        n.add(template_page_frame, text="Shift Templates")
+        
+        
+    def close(self):
+        """Finish queued writes and save the displayed month to a file.
+        
+        The month is only saved if the callback of every write has been 
+        called, as until then the calendar may not show what was written.
+        """
+        
+        self.write_queue.close()
+        self.session.close()
+        snapshot = self.calendar_page.calendar_display.snapshot
+        if snapshot and self.write_queue.results.empty():
+            save_month_file(snapshot)
                                             
                 
         
 class CalendarPage(tk.Frame):
     """Container page for all collection of widgets for the calendar.
     
-    The calendar page consists of 4 collections of widgets: the calendar_menu
+    The calendar page consists of 5 collections of widgets: the calendar_menu
     that instantiates the calendar via user selection and also exports the
     current displayed calendar to excel. The calendar_display which displays
     an interactive calendar. The schedule_editor that allows the user to
-    add/edit/remove schedules. And a calendar_calc that calculates the net cost
+    add/edit/remove schedules. A calendar_calc that calculates the net cost
     of schedules for that calendar relative to the average monthly revenue
-    for that month.
+    for that month. And staffing_gaps that lists every time the calendar's
+    department is below its minimum staffing requirements.
     
     Attributes:
         session: An sqlalchemy session object using sqlite3.
+        write_queue: WriteQueue to write to the database without blocking.
+        read_cache: ReadModelCache of read models shared by the pages.
         dep_list: A string list of all department names.
         side_info_frame: tk.Frame that contains schedule_editor and 
             calendar_calc.
@@ -101,9 +164,12 @@ class CalendarPage(tk.Frame):
         calendar_display: Collection of widgets for interactive calendar.
         calendar_calc: Collection of widgets to display cost of calendar
             relative to average monthly revenue.
+        staffing_gaps: Collection of widgets to display understaffed times 
+            of calendar.
     """
     
-    def __init__(self, parent, session, date, dep_list):
+    def __init__(self, parent, session, date, dep_list, write_queue,
+                 read_cache):
         """Inits CalendarPage with a date and a department list.
         
         Upon the opening of the program, the init method instantiates the
@@ -116,8 +182,12 @@ class CalendarPage(tk.Frame):
             session: An sqlalchemy session object using sqlite3.
             date: datetime.date object containing present month and year.
             dep_list: A string list of all department variables.
+            write_queue: WriteQueue to write to the database with.
+            read_cache: ReadModelCache of read models shared by the pages.
         """
         self.session = session
+        self.write_queue = write_queue
+        self.read_cache = read_cache
         self.dep_list = dep_list
         self.side_info_frame = tk.Frame(parent)
         self.schedule_editor = ScheduleEditor(self.side_info_frame, self)
@@ -132,11 +202,19 @@ class CalendarPage(tk.Frame):
                                                 session,
                                                 self.calendar_display,
                                                 dep_list)
+        self.staffing_gaps = StaffingGapList(self.side_info_frame,
+                                             session,
+                                             self.calendar_display)
 
                                                 
     def update_costs(self):
         """Update the renvenue calculator widgets."""
         self.calendar_calc.update_costs()
+        
+        
+    def update_staffing_gaps(self):
+        """Update the list of understaffed times of the calendar."""
+        self.staffing_gaps.update_gaps()
                 
                 
     def create_calendar(self, dep, date):
@@ -149,6 +227,40 @@ class CalendarPage(tk.Frame):
         self.calendar_display.create_calendar(dep, date)
         
         
+    def remove_employee(self, employee_id):
+        """Show the schedules of a deleted employee as unassigned."""
+        self.calendar_display.remove_employee(employee_id)
+        
+        
+    def remove_department(self, department):
+        """Remove the schedules of a deleted department from the calendar."""
+        self.calendar_display.remove_department(department)
+        
+        
+    def set_employee_wage(self, employee_id, wage):
+        """Update the calendar's costs for an employee's new wage."""
+        self.calendar_display.set_employee_wage(employee_id, wage)
+        
+        
+    def reload_calendar(self):
+        """Create the calendar again for its current department and date."""
+        self.calendar_display.create_calendar(self.calendar_display.dep,
+                                              self.calendar_display.date)
+        self.update_costs()
+        self.update_staffing_gaps()
+        
+        
+    def write_failed(self, error):
+        """Tell the user a queued write failed and show the calendar as saved.
+        
+        Args:
+            error: The exception the write raised, or a String message.
+        """
+        
+        tkMessageBox.showerror("Could Not Save Changes", str(error))
+        self.reload_calendar()
+        
+        
     def save_calendar_to_excel(self, version):
         """Call calendar_display to save calendar to an excel template.
         
@@ -163,6 +275,16 @@ class CalendarPage(tk.Frame):
         """Call calendar_display to execute autofill_calendar method."""
         self.calendar_display.autofill_calendar()
         
+        
+    def show_coverage_heatmap(self):
+        """Call calendar_display to open the staffing coverage heatmap."""
+        self.calendar_display.show_coverage_heatmap()
+        
+        
+    def copy_to_next_month(self):
+        """Call calendar_display to copy its schedules to the next month."""
+        self.calendar_display.copy_to_next_month()
+        
                    
                                             
 class CalendarMenu(tk.Frame):
@@ -285,8 +407,24 @@ class CalendarMenu(tk.Frame):
                                          command=self.autofill_calendar)
         autofill_button.grid(row=0, column=12)
         
+        # Widgets for displaying staffing coverage of the calendar's month
+        spacing_frame_3 = tk.Frame(calendar_menu_frame)
+        spacing_frame_3.grid(row=0, column=13, padx=28)
+        coverage_button = ttk.Button(calendar_menu_frame, 
+                                     text='Staff Coverage', 
+                                     command=self.show_coverage_heatmap)
+        coverage_button.grid(row=0, column=14)
+        
+        # Widgets for copying the calendar's schedules to the next month
+        spacing_frame_4 = tk.Frame(calendar_menu_frame)
+        spacing_frame_4.grid(row=0, column=15, padx=28)
+        copy_button = ttk.Button(calendar_menu_frame, 
+                                 text='Copy To Next Month', 
+                                 command=self.copy_to_next_month)
+        copy_button.grid(row=0, column=16)
+        
         sep_bottom = ttk.Separator(calendar_menu_frame, orient=tk.HORIZONTAL)
-        sep_bottom.grid(row=1, column=0, columnspan=13, sticky="ew")
+        sep_bottom.grid(row=1, column=0, columnspan=17, sticky="ew")
         
         
     def create_cal_click(self):
@@ -297,6 +435,7 @@ class CalendarMenu(tk.Frame):
         date = datetime.date(year, month, 1)
         self.controller.create_calendar(dep, date)
         self.controller.update_costs()
+        self.controller.update_staffing_gaps()
         
         
     def save_calendar_to_excel(self):
@@ -310,6 +449,16 @@ class CalendarMenu(tk.Frame):
         self.controller.autofill_calendar()
         
         
+    def show_coverage_heatmap(self):
+        """Call show_coverage_heatmap method."""
+        self.controller.show_coverage_heatmap()
+        
+        
+    def copy_to_next_month(self):
+        """Call copy_to_next_month method."""
+        self.controller.copy_to_next_month()
+        
+        
 		
 class CalendarDisplay(tk.Frame):
     """Create day and title widgets responsible for displaying calendar.
@@ -327,6 +476,14 @@ class CalendarDisplay(tk.Frame):
         day_vc_list: A list of day_vc objects that display corresponding
             information about that day: day number and schedules.
         current_clicked_day: Current active day for user interaction.
+        snapshot: MonthSnapshot of the schedules of the current selected
+            calendar's month, its columns have the cost of every schedule of
+            the month for all departments.
+        coverage: MonthCoverage of the number of schedules in each time slot
+            of the current selected calendar's month and department.
+        heatmap: CoverageHeatmap window displaying coverage, None if closed.
+        autofill_errors: list of the exceptions of the writes of an autofill
+            in progress, None when not autofilling.
         canvas: tk.Canvas container to display scrollbars.
         calendar_frame: tk.Frame container for the day_vc objects.
         calendar_title: tk.Frame container for day headers, ie Sunday, Tuesday.
@@ -359,6 +516,10 @@ class CalendarDisplay(tk.Frame):
         self.date = date
         self.day_vc_list = []
         self.current_clicked_day = None 
+        self.snapshot = None
+        self.coverage = None
+        self.heatmap = None
+        self.autofill_errors = None
         
         # Container and scrollbar widgets
         calendar_holder = tk.Frame(self.parent)
@@ -418,6 +579,17 @@ class CalendarDisplay(tk.Frame):
         When a day in the calendar is clicked it is highlighted, which then
         schedules can be added or removed in the schedule editor.
         
+        The schedules are read from the month file saved when the program 
+        last closed if it is of this month and the database has not changed,
+        otherwise from the database, and shift templates of the department 
+        not yet expanded for the month are then expanded by the write queue,
+        see expand_templates. The coverage is counted from the month's 
+        columns either way.
+        
+        The session is closed first, so the objects loaded for the previous
+        calendar are released and the identity map only ever holds about a
+        month of objects.
+        
         Args:
             department: String object to determine which department for the 
                 calendar.
@@ -425,8 +597,21 @@ class CalendarDisplay(tk.Frame):
         """
         
         self.clear_calendar()
+        close_idle_session(self.controller.session)
         self.date = date
         self.dep = department
+        self.snapshot = load_month_file(self.controller.session, 
+                                        self.controller.read_cache,
+                                        self.date, self.dep)
+        from_file = self.snapshot is not None
+        if not from_file:
+            self.snapshot = MonthSnapshot(self.controller.session,
+                                          self.controller.read_cache,
+                                          self.date, self.dep)
+        self.coverage = MonthCoverage(self.controller.session, self.date,
+                                      self.dep, self.snapshot.columns)
+        if self.heatmap:
+            self.heatmap.draw()
         calendar_array = self.get_cal_array(self.date.year, self.date.month)
         title = "%s Calendar For %s, %s" % (self.dep, 
                                             calendar.month_name[self.date.month],
@@ -454,6 +639,36 @@ class CalendarDisplay(tk.Frame):
                 self.day_vc_list.append(day_vc)
         # Display schedules and click first day of that month
         self.click_reset()
+        # A current month file was saved after the month was expanded
+        if not from_file:
+            self.expand_templates()
+        
+        
+    def expand_templates(self):
+        """Queue the expansion of shift templates of the calendar's month.
+        
+        The calendar is drawn again once the schedules are inserted, if it
+        still shows the month. Nothing is queued if every template of the 
+        month is already expanded, so drawing again does not expand again.
+        """
+        
+        dep, date = self.dep, self.date
+        if not has_unexpanded_templates(self.controller.session, date, dep):
+            return
+        
+        def write(session):
+            return len(expand_templates(session, date, dep))
+            
+        def on_success(count):
+            if count and (self.dep, self.date) == (dep, date):
+                self.controller.reload_calendar()
+                
+        def on_error(error):
+            # Not write_failed, as drawing again would queue it again
+            tkMessageBox.showerror("Could Not Expand Shift Templates", 
+                                   str(error))
+            
+        self.controller.write_queue.submit(write, on_success, on_error)
         
         
     def click_reset(self):
@@ -520,22 +735,53 @@ class CalendarDisplay(tk.Frame):
     def autofill_calendar(self):
         """Fill all unassaigned schedules with most eligable employee
     
-        In chronological order of days in calendar, iterate through all 
-        schedules and pick the first available (most eligable according to 
-        algorithm) employee and set as that schedule's assign employee via the
-        auto_assign_schedule method.
+        Iterate through all schedules and pick the first available (most 
+        eligable according to algorithm) employee and set as that schedule's
+        assign employee via the auto_assign_schedule method. Schedules that 
+        cover times where the department is below its minimum staffing 
+        requirements are filled first, so that the most eligable employees 
+        go to the most understaffed times. The rest of the schedules are
+        filled in chronological order of days in calendar.
+        
+        Autofill is one transaction, each assignment in a savepoint, so an
+        assignment that fails is rolled back without undoing the others. The
+        failures are collected and the user told of them once autofill ends.
         """
+        session = self.controller.session
+        gaps = self.get_staffing_gaps()
+        gap_overlaps = get_gap_overlaps(session, self.date, self.dep, gaps)
+        schedule_order = []
         for day_vc in self.day_vc_list:
-            day_vc.set_to_clicked('<Button-1>')
-            schedule_list = day_vc.day_model.schedules
-            for s in schedule_list:
-                s_widget = day_vc.schedule_widgets[s]
-                day_vc.schedule_widget_click('<Button-1>', s_widget)
-                e_vc = day_vc.eligable_vc[s_widget.pk]
-                e_model = e_vc.e_model
-                # -1 means no employee is assigned to schedule yet
-                if e_model.get_assigned_employee() == -1:
-                    self.auto_assign_schedule(e_vc, e_model)
+            for s in day_vc.day_model.schedules:
+                schedule_order.append((day_vc, s))
+        # Sort is stable so schedules covering no gaps stay chronological
+        schedule_order.sort(key=lambda d: -gap_overlaps.get(d[1], 0))
+        errors = []
+        # Failed writes are added to errors rather than reported each
+        self.autofill_errors = errors
+        try:
+            with transaction(session):
+                for day_vc, s in schedule_order:
+                    day_vc.set_to_clicked('<Button-1>')
+                    s_widget = day_vc.schedule_widgets[s]
+                    day_vc.schedule_widget_click('<Button-1>', s_widget)
+                    e_vc = day_vc.eligable_vc[s_widget.pk]
+                    e_model = e_vc.e_model
+                    # -1 means no employee is assigned to schedule yet
+                    if e_model.get_assigned_employee() == -1:
+                        try:
+                            with transaction(session):
+                                self.auto_assign_schedule(e_vc, e_model)
+                        except SQLAlchemyError as error:
+                            errors.append(error)
+        except SQLAlchemyError as error:
+            errors.append(error)
+        finally:
+            self.autofill_errors = None
+        if errors:
+            message = "\n".join(str(e) for e in errors)
+            self.controller.write_failed("Could not assign %s schedules:\n%s"
+                                         % (len(errors), message))
         
                 
     def auto_assign_schedule(self, e_vc, e_model):
@@ -559,9 +805,407 @@ class CalendarDisplay(tk.Frame):
 
     def update_costs(self):
         self.controller.update_costs()
+        
+        
+    def add_schedules(self, schedule_tuples, on_added=None):
+        """Queue many schedules to create at once, then refresh their days.
+        
+        The schedules are validated straight away and inserted in one 
+        transaction by the write queue. Once inserted they are added to the
+        month's snapshot, then each displayed day with new schedules is 
+        drawn again once, however many were added, without reading the day
+        from the database.
+        
+        Args:
+            schedule_tuples: list of (start, end, s_hide, e_hide, department)
+                tuples of the schedules to create.
+            on_added: Function called with the list of ScheduleSnapshot of 
+                the created schedules once the days are drawn, or None.
+        Raises:
+            ValueError: If any schedule is invalid, then none are created.
+        """
+        
+        validate_schedules(schedule_tuples)
+        snapshot = self.snapshot
+        
+        def write(session):
+            return [get_schedule_snapshot(s) 
+                    for s in create_schedules(session, schedule_tuples)]
+        
+        def on_success(schedules):
+            # The calendar may have been read again with them since
+            added = [s for s in schedules 
+                     if s.id not in self.snapshot.schedules]
+            affected_days = get_affected_days(added)
+            coverage_days = set()
+            for s in added:
+                self.snapshot.set_schedule(s)
+                coverage_days.update(self.coverage.add_schedule(s))
+            for day_vc in self.day_vc_list:
+                day_model = day_vc.day_model
+                if (day_model.date, day_model.dep) in affected_days:
+                    day_model.refresh(reload=False)
+                    day_vc.create_schedules_and_eligable_vc()
+            self.update_heatmap(coverage_days)
+            self.controller.update_staffing_gaps()
+            # Otherwise the days on_added was given are no longer displayed
+            if on_added and self.snapshot is snapshot:
+                on_added(schedules)
+                
+        self.controller.write_queue.submit(write, on_success, 
+                                           self.controller.write_failed)
+        
+        
+    def remove_schedules(self, start_date, end_date, unassigned_only=False):
+        """Delete the calendar's schedules in a date range at once.
+        
+        The schedules are deleted by a single statement queued to the write
+        queue, then the ids it returns are removed from the month's snapshot
+        and coverage in one pass and each displayed day that had schedules 
+        deleted is drawn again once, without reading the day from the 
+        database.
+        
+        Args:
+            start_date: datetime.date of the first day of schedules to delete.
+            end_date: datetime.date of the last day of schedules to delete.
+            unassigned_only: Boolean to only delete schedules with no employee.
+        """
+        
+        dep = self.dep
+        
+        def write(session):
+            return delete_schedules(session, dep, start_date, end_date, 
+                                    unassigned_only)
+            
+        def on_success(deleted):
+            session = self.controller.session
+            expunge_schedules(session, set(d.id for d in deleted))
+            expire_employee_schedules(session, set(d.employee_id 
+                                                   for d in deleted))
+            # Removing is a no-op for schedules the snapshot does not have
+            affected_days = get_affected_days(deleted)
+            coverage_days = set()
+            for d in deleted:
+                self.snapshot.remove_schedule(d.id)
+                coverage_days.update(self.coverage.remove_schedule(d.id))
+            for day_vc in self.day_vc_list:
+                day_model = day_vc.day_model
+                if (day_model.date, day_model.dep) in affected_days:
+                    day_model.refresh(reload=False)
+                    day_vc.create_schedules_and_eligable_vc()
+            self.update_heatmap(coverage_days)
+            self.controller.update_staffing_gaps()
+            self.update_costs()
+            
+        self.controller.write_queue.submit(write, on_success, 
+                                           self.controller.write_failed)
+        
+        
+    def remove_employee(self, employee_id):
+        """Show the schedules of a deleted employee as unassigned.
+        
+        The month's snapshot and costs are updated in one pass over its 
+        columns, then each displayed day with schedules of the employee is
+        drawn again once, without reading the day from the database.
+        
+        Args:
+            employee_id: Primary key of the deleted employee.
+        """
+        
+        if self.snapshot is None:
+            return
+        unassigned = self.snapshot.remove_employee(employee_id)
+        affected_days = set()
+        coverage_days = set()
+        for s in unassigned:
+            coverage_days.update(self.coverage.update_schedule(s))
+            affected_days.add(s.schedule_date)
+        for day_vc in self.day_vc_list:
+            day_model = day_vc.day_model
+            if day_model.date in affected_days:
+                day_model.refresh(reload=False)
+                day_vc.create_schedules_and_eligable_vc()
+        self.update_heatmap(coverage_days)
+        self.controller.update_staffing_gaps()
+        self.update_costs()
+        
+        
+    def set_employee_wage(self, employee_id, wage):
+        """Price the schedules of an employee at a new wage.
+        
+        Args:
+            employee_id: Primary key of the employee.
+            wage: Number new wage of the employee.
+        """
+        
+        if self.snapshot is None:
+            return
+        self.snapshot.set_employee_wage(employee_id, wage)
+        self.update_costs()
+        
+        
+    def remove_department(self, department):
+        """Remove the schedules of a deleted department from the calendar.
+        
+        Args:
+            department: String name of the deleted department.
+        """
+        
+        if self.snapshot is None:
+            return
+        self.snapshot.remove_department(department)
+        if department == self.dep:
+            self.controller.reload_calendar()
+        else:
+            self.update_costs()
+        
+        
+    def add_schedule_metrics(self, schedule):
+        """Add a new db schedule to the month's coverage."""
+        self.update_heatmap(self.coverage.add_schedule(schedule))
+        self.controller.update_staffing_gaps()
+        
+        
+    def remove_schedule_metrics(self, id):
+        """Remove a deleted schedule from the month's coverage."""
+        self.update_heatmap(self.coverage.remove_schedule(id))
+        self.controller.update_staffing_gaps()
+        
+        
+    def update_schedule_metrics(self, schedule):
+        """Update coverage of a db schedule with a new employee."""
+        self.update_heatmap(self.coverage.update_schedule(schedule))
+        self.controller.update_staffing_gaps()
+        
+        
+    def copy_to_next_month(self):
+        """Copy the schedules of the calendar's month to the next month.
+        
+        The user is asked whether to keep the employees assigned to the 
+        schedules, and if so is told how many of the copies conflict with 
+        the employee's other schedules, vacations or unavailability.
+        
+        The copy is written by the write queue. Once it is committed the 
+        copies on the 1st of next month are added to the month's columns, 
+        and the hours of each week and a month file of next month, which do 
+        not include the copies, are dropped.
+        """
+        
+        days_in_month = calendar.monthrange(self.date.year, 
+                                            self.date.month)[1]
+        end_date = datetime.date(self.date.year, self.date.month, 
+                                 days_in_month)
+        next_month = end_date + datetime.timedelta(days=1)
+        msg = tkMessageBox.askquestion("Copy To Next Month",
+                                       "Keep the employees assigned to "
+                                       "the copied schedules?")
+        keep_assignments = msg == 'yes'
+        snapshot = self.snapshot
+        dep, date = self.dep, self.date
+        
+        def write(session):
+            schedules, conflicts = clone_schedules(session, dep, date, 
+                                                   end_date, next_month,
+                                                   keep_assignments)
+            first_day = [get_schedule_snapshot(s) for s in schedules
+                         if s.schedule_date == next_month]
+            return (len(schedules), len(set(c.schedule_id 
+                                            for c in conflicts)), first_day)
+            
+        def on_success(result):
+            count, conflict_count, first_day = result
+            directory = snapshot.get_directory()
+            for s in first_day:
+                employee = directory.get(s.employee_id)
+                wage = employee.wage if employee else None
+                snapshot.columns.append(s.replace(wage=wage))
+            snapshot.clear_week_minutes()
+            remove_month_file(snapshot.session, next_month)
+            info = "%s schedules copied to %s %s." % (count,
+                                                     calendar.month_name[next_month.month],
+                                                     next_month.year)
+            if conflict_count:
+                info += (" %s copied schedules have a conflict with their "
+                         "assigned employee." % conflict_count)
+            tkMessageBox.showinfo("Copy To Next Month", info)
+            
+        self.controller.write_queue.submit(write, on_success, 
+                                           self.controller.write_failed)
+        
+        
+    def get_staffing_gaps(self):
+        """Return list of StaffingGap of the calendar's month.
+        
+        The gaps are found from the schedules of the snapshot rather than 
+        the database, so they include changes whose writes are still queued.
+        """
+        
+        if self.snapshot is None:
+            return []
+        read_cache = self.controller.read_cache
+        requirements = read_cache.get('staffing_requirements').get(self.dep)
+        if not requirements:
+            return []
+        day_intervals = self.snapshot.columns.get_day_intervals(self.dep)
+        return get_staffing_gaps(self.date, requirements, day_intervals)
+        
+        
+    def show_coverage_heatmap(self):
+        """Open the coverage heatmap window or raise it if already open."""
+        if self.heatmap:
+            self.heatmap.window.lift()
+        else:
+            self.heatmap = CoverageHeatmap(self.parent, self)
+            
+            
+    def update_heatmap(self, day_indexes):
+        """Redraw days of the coverage heatmap if the heatmap is open.
+        
+        Args:
+            day_indexes: Iterable of int indexes of the days in the month 
+                whose coverage has changed, the 1st is 0.
+        """
+        
+        if self.heatmap:
+            for day_index in day_indexes:
+                self.heatmap.draw_day(day_index)
+        
+        
+    def update_day_ratios(self, monthly_revenue):
+        """Display each day's cost relative to its share of monthly revenue.
+        
+        Args:
+            monthly_revenue: Average revenue for the month of the calendar,
+                None if there is no revenue data for the month.
+        """
+        
+        percentages = None
+        if monthly_revenue is not None:
+            days_in_month = calendar.monthrange(self.date.year, 
+                                                self.date.month)[1]
+            day_costs = self.snapshot.columns.get_day_costs(self.dep,
+                                                            days_in_month)
+            percentages = get_day_percentages(day_costs, monthly_revenue)
+        for day_vc in self.day_vc_list:
+            if day_vc.day_model.date:
+                if percentages is None:
+                    day_vc.set_cost_ratio(None)
+                else:
+                    day_index = day_vc.day_model.date.day - 1
+                    day_vc.set_cost_ratio(percentages[day_index])
+    
     
     
+class CoverageHeatmap(tk.Frame):
+    """Window to display staffing coverage of a calendar's month.
     
+    Each row of the heatmap is a day of the month and each column is a 15
+    minute time slot of the day. A cell is shaded darker the more schedules 
+    with an assigned employee cover that time slot, and is outlined in red if
+    any schedule without an assigned employee covers that time slot. The
+    counts are read from the coverage kept by the calendar display, so only
+    the row of a day is redrawn when a schedule of that day changes.
+    
+    Attributes:
+        COLORS: List of fill colors indexed by number of assigned schedules,
+            the last color is used for any greater number of schedules.
+        CELL_WIDTH: Int width in pixels of a time slot cell.
+        CELL_HEIGHT: Int height in pixels of a day row.
+        LABEL_WIDTH: Int width in pixels of the column of day numbers.
+        cal: Calendar display containing the coverage to display.
+        window: tk.Toplevel window containing the heatmap.
+        title_var: tk.StringVar for the department and month of the heatmap.
+        canvas: tk.Canvas the heatmap is drawn on.
+        cells: List for each day of the month of a list of the canvas ids of
+            the rectangles of each time slot.
+    """
+    
+    COLORS = ['white', '#ccebff', '#87cefa', '#1e90ff', '#0050a0']
+    CELL_WIDTH = 9
+    CELL_HEIGHT = 16
+    LABEL_WIDTH = 30
+    
+    def __init__(self, parent, calendar_display):
+        """Initialize heatmap window and draw coverage of calendar display.
+        
+        Args:
+            parent: tk.Frame parent of the heatmap window.
+            calendar_display: Calendar display containing the coverage.
+        """
+        
+        self.cal = calendar_display
+        self.cells = []
+        
+        self.window = tk.Toplevel(parent)
+        self.window.title("Staff Coverage")
+        self.window.protocol("WM_DELETE_WINDOW", self.destroy)
+        self.title_var = tk.StringVar(self.window)
+        title = ttk.Label(self.window, textvariable=self.title_var)
+        title.pack()
+        self.canvas = tk.Canvas(self.window, bg="white", 
+                                width=(self.LABEL_WIDTH 
+                                       + self.CELL_WIDTH * SLOTS_PER_DAY),
+                                height=self.CELL_HEIGHT * 32)
+        self.canvas.pack(padx=5, pady=5)
+        self.draw()
+        
+        
+    def draw(self):
+        """Draw hour and day labels and every time slot of every day."""
+        coverage = self.cal.coverage
+        title = "%s Coverage For %s, %s" % (coverage.dep, 
+                                            calendar.month_name[coverage.date.month],
+                                            str(coverage.date.year))
+        self.title_var.set(title)
+        self.canvas.delete(tk.ALL)
+        self.cells = []
+        # Label every other hour over its first time slot
+        for hour in range(0, 24, 2):
+            x = self.LABEL_WIDTH + hour * 4 * self.CELL_WIDTH
+            self.canvas.create_text(x, self.CELL_HEIGHT / 2, anchor=tk.W,
+                                    text=str(hour), font=SMALL_FONT)
+        for i in range(coverage.days_in_month):
+            y = (i + 1) * self.CELL_HEIGHT
+            self.canvas.create_text(self.LABEL_WIDTH - 4, 
+                                    y + self.CELL_HEIGHT / 2, 
+                                    anchor=tk.E, text=str(i + 1), 
+                                    font=SMALL_FONT)
+            row = []
+            for j in range(SLOTS_PER_DAY):
+                x = self.LABEL_WIDTH + j * self.CELL_WIDTH
+                cell = self.canvas.create_rectangle(x, y, 
+                                                    x + self.CELL_WIDTH, 
+                                                    y + self.CELL_HEIGHT,
+                                                    outline="#e0e0e0")
+                row.append(cell)
+            self.cells.append(row)
+            self.draw_day(i)
+            
+            
+    def draw_day(self, day_index):
+        """Color the time slot cells of a day by their schedule counts.
+        
+        Args:
+            day_index: int index of the day in the month, the 1st is 0.
+        """
+        
+        assigned, unassigned = self.cal.coverage.get_day_coverage(day_index)
+        row = self.cells[day_index]
+        for j in range(SLOTS_PER_DAY):
+            color = self.COLORS[min(assigned[j], len(self.COLORS) - 1)]
+            outline = "#e0e0e0"
+            if unassigned[j]:
+                outline = "red"
+            self.canvas.itemconfig(row[j], fill=color, outline=outline)
+            
+            
+    def destroy(self):
+        """Destroy heatmap window and inform calendar display it is closed."""
+        self.window.destroy()
+        self.cal.heatmap = None
+        
+        
+        
 class DayViewController(tk.Frame):
     """Create widgets to display day and update associated day model.
     
@@ -722,6 +1366,20 @@ class DayViewController(tk.Frame):
         self.schedule_display.pack_forget()
         
         
+    def set_cost_ratio(self, percent):
+        """Display payroll to revenue ratio of this day beside day number.
+        
+        Args:
+            percent: Int percentage of this day's cost relative to its
+                revenue, None to only display the day number.
+        """
+        
+        text = self.day_number
+        if percent is not None:
+            text = self.day_number.ljust(12) + str(percent) + "%"
+        self.number_label.config(text=text)
+        
+        
     def mouse_enter(self, event):
         """Highlights day_widgets to display mouse enter event.
         
@@ -967,6 +1625,7 @@ class DayModel(object):
     Attributes:
         session: An sqlalchemy session object using sqlite3.
         cal: The calendar_display that allows a callback to update costs.
+        write_queue: WriteQueue to write to the database with.
         date: datetime.date object to represent date of this day_model.
         week_number: int of week in the month.
         weekday: int of day in the month.
@@ -1001,6 +1660,7 @@ class DayModel(object):
         
         self.session = session
         self.cal = calendar_display
+        self.write_queue = calendar_display.controller.write_queue
         self.date = date
         self.week_number = week_number
         self.weekday = weekday
@@ -1017,15 +1677,7 @@ class DayModel(object):
         
     def get_schedule_id_and_str(self):
         """Set schedules sorted list and schedule_strings dict"""
-        date = datetime.date(self.date.year, self.date.month, 
-                             self.date.day)
-        db_schedules = (self.session
-                            .query(Schedule)
-                            .filter(Schedule.schedule_date == date)
-                            .all())
-                         
-        db_schedules = [s for s in db_schedules if s.department == self.dep]
-        db_schedules.sort(key=lambda schedule: schedule.start_time)
+        db_schedules = self.cal.snapshot.get_day_schedules(self.date)
         
         # List of sorted schedule id's
         self.schedules = [s.id for s in db_schedules]
@@ -1046,38 +1698,19 @@ class DayModel(object):
         """Get str displaying start and end times and employee if assigned.
         
         Args:
-            schedule: A schedule object.
+            schedule: A ScheduleSnapshot.
         
         Returns:
             str: A string representing the string version of the schedule to
             be displayed by the view.
         """
         
-        start_str, end_str = "", ""
-        if schedule.s_undetermined_time:
-            start_str = "?"
-        else:
-            start_str = schedule.start_datetime.strftime("%I:%M")
-            
-        if schedule.e_undetermined_time:
-            end_str = "?"
-        else:
-            end_str = schedule.end_datetime.strftime("%I:%M")    
-
-        str = start_str + " - " + end_str
-        if schedule.employee_id != None:
-            employee = (self.session
-                            .query(Employee)
-                            .filter(Employee.employee_id
-                                    == schedule.employee_id)
-                            .first())
-            str += "  " + employee.first_name
+        return self.cal.snapshot.get_schedule_str(schedule)
         
-        return str    
         
-        
-    def insert_new_schedule(self, start, end, s_hide, e_hide, dep):
-        """Create new db schdule, refresh model, then return id of schedule.
+    def insert_new_schedule(self, start, end, s_hide, e_hide, dep,
+                            on_inserted=None):
+        """Queue new db schdule, then refresh model once it is inserted.
         
         Args:
             start: datetime.datetime object for start datetime of schedule.
@@ -1085,25 +1718,55 @@ class DayModel(object):
             s_hide: Boolean to determine to hide start time string in the view.
             e_hide: Boolean to determine to hide end time string in the view.
             dep: String to determine department the schedule belongs to.
+            on_inserted: Function called with the primary key of the schedule
+                once it is inserted and the model refreshed, or None.
+        """
+        
+        def write(session):
+            db_schedule = Schedule(start, 
+                                   end,
+                                   s_hide,
+                                   e_hide,
+                                   dep)
+            session.add(db_schedule)
+            session.flush()
+            return db_schedule.id
             
-        Returns:
-            The primary key of the schedule for reference.
+        def on_success(id):
+            self.refresh()
+            self.cal.add_schedule_metrics(self.cal.snapshot.schedules[id])
+            if on_inserted:
+                on_inserted(id)
+                
+        self.write_queue.submit(write, on_success, self.write_failed)
+        
+        
+    def write_failed(self, error):
+        """Call calendar page to tell the user a queued write failed.
+        
+        During autofill the error is kept to be reported once it ends.
         """
         
-        db_schedule = Schedule(start, 
-                                  end,
-                                  s_hide,
-                                  e_hide,
-                                  dep)
-        self.session.add(db_schedule)
-        self.session.commit()
-    
+        if self.cal.autofill_errors is not None:
+            self.cal.autofill_errors.append(error)
+        else:
+            self.cal.controller.write_failed(error)
+        
+        
+    def refresh(self, reload=True):
+        """Reload schedule ids, schedule str, and eligable models from db.
+        
+        Args:
+            reload: Boolean to read the day's schedules from the database, 
+                False if the month's snapshot already has every change.
+        """
+        
+        if reload:
+            self.cal.snapshot.reload_day(self.date)
         self.reset_values()
         self.get_schedule_id_and_str()
         self.create_eligable_models()
         
-        return db_schedule.id
-        
         
     def reset_values(self):
         """Clear values of schedule ids, schedule str, and eligable models."""
@@ -1113,22 +1776,34 @@ class DayModel(object):
         
         
     def remove_schedule(self, id):
-        """Remove schedule from model and db.
+        """Remove schedule from model and queue its delete from the db.
+        
+        The schedule is removed from the model straight away. If the delete
+        fails the calendar is drawn again as saved.
         
         Args:
             id: The primary key of the schedule to be removed.
         """
         
-        db_schedule = (self.session.query(Schedule)
-                                   .filter(Schedule.id == id)
-                                   .first())
-        self.session.delete(db_schedule)
-        self.session.commit()
+        employee_id = self.cal.snapshot.schedules[id].employee_id
+        
+        def write(session):
+            (session.query(Schedule)
+                    .filter(Schedule.id == id)
+                    .delete(synchronize_session=False))
+                    
+        def on_success(result):
+            expunge_schedules(self.session, [id])
+            expire_employee_schedules(self.session, [employee_id])
+            
+        self.cal.snapshot.remove_schedule(id)
+        self.cal.remove_schedule_metrics(id)
         self.cal.update_costs()
         
         self.schedules.remove(id)
         del self.schedule_strings[id]
         del self.eligable_models[id]
+        self.write_queue.submit(write, on_success, self.write_failed)
         
         
     def update_costs(self):
@@ -1136,6 +1811,17 @@ class DayModel(object):
         self.cal.update_costs()
         
         
+    def update_schedule_metrics(self, schedule):
+        """Update costs and coverage for a schedule with a new employee.
+        
+        Args:
+            schedule: ScheduleSnapshot whose assigned employee has changed.
+        """
+        
+        self.cal.update_schedule_metrics(schedule)
+        self.update_costs()
+        
+        
         
 class EligableViewController(tk.Frame):
     """Create widgets to display sorted list of employees eligable for schedule.
@@ -1391,18 +2077,18 @@ class EligableModel(object):
         eligables = collections.OrderedDict([('(A)', []), ('(O)', []), ('(U)', []), ('(V)', []), ('(S)', [])])
         employee_list = []
         e_listbox_list = []
-        employees = self.session.query(Employee).all()
-        employees = [e for e in employees if (e.primary_department == self.dep
-                                              or e.alternate1_department == self.dep
-                                              or e.alternate2_department == self.dep)]
-        db_schedule = self.get_db_schedule(self.schedule_pk)
-        for e in employees:
-            availability = e.get_availability(db_schedule)
+        snapshot = self.day_model.cal.snapshot
+        employees = [e for e in snapshot.get_employees().itervalues() 
+                     if e.works_in(self.dep)]
+        schedule = self.get_schedule()
+        availabilities = snapshot.get_availabilities(employees, schedule)
+        for e, availability in zip(employees, availabilities):
             eligables[availability].append(e)
+        month_hours = snapshot.get_month_hours()
         # Sort in terms of scheduled hours, least hours at start of list
         # Then place employees with primary department at start of list 
         for key, e_list in eligables.iteritems():
-            e_list.sort(key=lambda e: e.scheduled_hours)
+            e_list.sort(key=lambda e: month_hours.get(e.id, 0))
             # We reverse the list for sorting accordin primary departments
             # because as we re-insert primary people it maintains the sorted
             # property with respect to primary department employees first,
@@ -1417,7 +2103,7 @@ class EligableModel(object):
                 else:
                     e_listbox_list.append(key + " " + e.first_name)
 
-            sorted_employee_ids = [e.employee_id for e in e_list]
+            sorted_employee_ids = [e.id for e in e_list]
             employee_list += sorted_employee_ids
         self.eligable_id_list = employee_list
         return e_listbox_list
@@ -1433,6 +2119,9 @@ class EligableModel(object):
         the corresponding id to the name clicked by user than assigns that 
         to the schedule.
         
+        The assignment is shown straight away and written to the database by
+        the write queue. If the write fails the assignment is undone.
+        
         Args:
             index: The index in the sorted list of employees
         Returns:
@@ -1441,31 +2130,30 @@ class EligableModel(object):
             employee to be assigned is already assigned (nothing to change).
         """
         
+        snapshot = self.day_model.cal.snapshot
         new_employee_id = self.eligable_id_list[index]
-        new_employee = self.get_db_employee(new_employee_id)
-        db_schedule = self.get_db_schedule(self.schedule_pk)
-        old_employee_id = db_schedule.employee_id
-        old_employee = self.get_db_employee(old_employee_id)
-        if old_employee and new_employee_id != old_employee_id:
-            old_employee.remove_schedule(db_schedule)
-            db_schedule.employee_id = new_employee.employee_id
-            new_employee.add_schedule(db_schedule)
-            self.session.commit()
-                
-            self.day_model.update_costs()
-            new_schedule_str = self.day_model.get_schedule_str(db_schedule)
-            return new_schedule_str
-        elif db_schedule.employee_id == None: 
-            db_schedule.employee_id = new_employee.employee_id
-            new_employee.add_schedule(db_schedule)
-            self.session.commit()
-            
-            self.day_model.update_costs()
-            new_schedule_str = self.day_model.get_schedule_str(db_schedule)
-            return new_schedule_str
+        old_employee_id = self.get_schedule().employee_id
         # Case where employee to be assigned is already assigned
-        else:
+        if new_employee_id == old_employee_id:
             return None
+            
+        schedule = snapshot.set_employee(self.schedule_pk, new_employee_id)
+        schedule_id = self.schedule_pk
+        
+        def write(session):
+            (session.query(Schedule)
+                    .filter(Schedule.id == schedule_id)
+                    .update({'employee_id': new_employee_id},
+                            synchronize_session=False))
+                    
+        def on_error(error):
+            snapshot.set_employee(schedule_id, old_employee_id)
+            self.day_model.write_failed(error)
+            
+        self.day_model.write_queue.submit(write, on_error=on_error)
+        self.day_model.update_schedule_metrics(schedule)
+        new_schedule_str = self.day_model.get_schedule_str(schedule)
+        return new_schedule_str
         
         
 
@@ -1484,51 +2172,17 @@ class EligableModel(object):
             schedule with respect to the sorted list of eligable employees.
             Returns -1 if no employee is assigned to the schedule.
         """
-        db_schedule = self.get_db_schedule(self.schedule_pk)
-        if db_schedule.employee_id:
-            employee = (self.session
-                            .query(Employee)
-                            .filter(Employee.employee_id 
-                                    == db_schedule.employee_id)
-                            .first())
-                            
-            index = self.eligable_id_list.index(employee.employee_id)
+        schedule = self.get_schedule()
+        if schedule.employee_id:
+            index = self.eligable_id_list.index(schedule.employee_id)
             return index
         else:
             return -1
             
             
-    def get_db_schedule(self, id):
-        """Get the database schedule given its primary key.
-        
-        Args:
-            id: primary key of the schedule to query from database.
-        
-        Returns:
-            The database schedule object corresponding to supplied primary key.
-        """
-        
-        db_schedule = (self.session.query(Schedule)
-                                   .filter(Schedule.id == id)
-                                   .first())
-        return db_schedule
-        
-        
-    def get_db_employee(self, id):
-        """Get the database employee given its primary key.
-        
-        Args:
-            id: primary key of the employee to query from database.
-        
-        Returns:
-            The database employee object corresponding to supplied primary key.
-        """
-        
-        employee = (self.session
-                        .query(Employee)
-                        .filter(Employee.employee_id == id)
-                        .first())    
-        return employee
+    def get_schedule(self):
+        """Return the ScheduleSnapshot of this model's schedule."""
+        return self.day_model.cal.snapshot.schedules[self.schedule_pk]
 
 
 
@@ -1683,7 +2337,7 @@ class ScheduleEditor(tk.Frame):
         self.add_schedule_button = ttk.Button(self.schedule_add_frame, 
                                              text='Add Schedule', 
                                              command=self.add_schedule)
-        self.add_schedule_button.grid(row=8, column=0, columnspan=5, pady=7)
+        self.add_schedule_button.grid(row=9, column=0, columnspan=5, pady=7)
         
         # Start time widgets
         self.start_label = tk.Label(self.schedule_add_frame, 
@@ -1712,6 +2366,35 @@ class ScheduleEditor(tk.Frame):
                                         text="Hide End Time")
         self.e_hide_cb.grid(row=7, column=1, columnspan=3, sticky=tk.W+tk.N)
         
+        # Add the schedule to every day of the selected day's week at once
+        self.whole_week = tk.BooleanVar(self.schedule_add_frame)
+        self.whole_week_cb = ttk.Checkbutton(self.schedule_add_frame, 
+                                            onvalue=True, 
+                                            offvalue=False, 
+                                            variable=self.whole_week, 
+                                            text="Add To Whole Week")
+        self.whole_week_cb.grid(row=8, column=1, columnspan=3, 
+                                sticky=tk.W+tk.N)
+        
+        # Widgets to clear all schedules of the selected day or month
+        self.clear_frame = tk.Frame(self.schedule_frame)
+        self.clear_frame.pack()
+        self.clear_day_button = ttk.Button(self.clear_frame, 
+                                           text='Clear Day', 
+                                           command=self.clear_day)
+        self.clear_day_button.grid(row=0, column=0, padx=4)
+        self.clear_month_button = ttk.Button(self.clear_frame, 
+                                             text='Clear Month', 
+                                             command=self.clear_month)
+        self.clear_month_button.grid(row=0, column=1, padx=4)
+        self.unassigned_only = tk.BooleanVar(self.clear_frame)
+        self.unassigned_only_cb = ttk.Checkbutton(self.clear_frame, 
+                                                 onvalue=True, 
+                                                 offvalue=False, 
+                                                 variable=self.unassigned_only, 
+                                                 text="Unassigned Only")
+        self.unassigned_only_cb.grid(row=0, column=2, padx=4)
+        
         # Frame to display interactive, clickable schedules for given day.
         self.schedule_widgets_frame = tk.Frame(self.schedule_frame)
         self.schedule_widgets_frame.pack(pady=6)
@@ -1754,16 +2437,87 @@ class ScheduleEditor(tk.Frame):
         end_datetime = datetime.datetime.strptime(end_time_str, 
                                               "%Y %m %d %I %M %p")
         # Ensure a valid begining and end time have been selected
-        if start_datetime < end_datetime:
-            id = day_model.insert_new_schedule(start_datetime, 
-                                               end_datetime,
-                                               self.s_hide.get(),
-                                               self.e_hide.get(),
-                                               cal.dep)
-            day_vc.highlight_new_schedule(id)
+        if start_datetime < end_datetime and self.whole_week.get():
+            self.add_week_schedules(start_datetime, end_datetime)
+        elif start_datetime < end_datetime:
+            day_model.insert_new_schedule(start_datetime, 
+                                          end_datetime,
+                                          self.s_hide.get(),
+                                          self.e_hide.get(),
+                                          cal.dep,
+                                          day_vc.highlight_new_schedule)
         else:
             print("Invalid Schedule time. " 
                   "Start time begins after end time. Beep. Boop. Bop.")
+                  
+                  
+    def clear_day(self):
+        """Delete the schedules of the selected day after asking the user."""
+        cal = self.controller.calendar_display
+        date = cal.current_clicked_day.day_model.date
+        self.clear_schedules(date, date, date.strftime("%B %d, %Y"))
+        
+        
+    def clear_month(self):
+        """Delete the schedules of the calendar's month after asking the user."""
+        cal = self.controller.calendar_display
+        days_in_month = calendar.monthrange(cal.date.year, cal.date.month)[1]
+        end_date = datetime.date(cal.date.year, cal.date.month, days_in_month)
+        self.clear_schedules(cal.date, end_date, cal.date.strftime("%B %Y"))
+        
+        
+    def clear_schedules(self, start_date, end_date, period_str):
+        """Delete the calendar's schedules in a date range if user confirms.
+        
+        Args:
+            start_date: datetime.date of the first day of schedules to delete.
+            end_date: datetime.date of the last day of schedules to delete.
+            period_str: String of the period to display to the user.
+        """
+        
+        cal = self.controller.calendar_display
+        unassigned_only = self.unassigned_only.get()
+        schedule_str = "unassigned schedules" if unassigned_only else "schedules"
+        msg = tkMessageBox.askquestion("Clear Schedules", 
+                                       "Delete all %s %s of %s?" 
+                                       % (cal.dep, schedule_str, period_str),
+                                       icon='warning')
+        if msg == 'yes':
+            cal.remove_schedules(start_date, end_date, unassigned_only)
+            
+            
+    def add_week_schedules(self, start_datetime, end_datetime):
+        """Add a schedule to each day in the week of the selected day.
+        
+        Args:
+            start_datetime: datetime.datetime of the start of the schedule on
+                the selected day.
+            end_datetime: datetime.datetime of the end of the schedule on
+                the selected day.
+        """
+        
+        cal = self.controller.calendar_display
+        day_vc = cal.current_clicked_day
+        week_number = day_vc.day_model.week_number
+        schedule_tuples = []
+        for d in cal.day_vc_list:
+            date = d.day_model.date
+            if date and d.day_model.week_number == week_number:
+                start = datetime.datetime.combine(date, start_datetime.time())
+                end = datetime.datetime.combine(date, end_datetime.time())
+                schedule_tuples.append((start, end, self.s_hide.get(), 
+                                        self.e_hide.get(), cal.dep))
+        
+        def on_added(schedules):
+            for s in schedules:
+                if s.schedule_date == day_vc.day_model.date:
+                    sw = day_vc.schedule_widgets[s.id]
+                    day_vc.schedule_widget_click("<Button-1>", sw)
+                    
+        try:
+            cal.add_schedules(schedule_tuples, on_added)
+        except ValueError as error:
+            tkMessageBox.showerror("Could Not Add Schedules", str(error))
             
    
             
@@ -1840,24 +2594,22 @@ class CalendarCalculator(tk.Frame):
         self.update_costs()
         
         
-    def get_percentage(self, schedules, total):
-        """Return percentage cost of schedules relative to total."""
-        sum = 0.0
-        for s in schedules:
-            sum += s.cost()
-        percent = int(round((sum / total) * 100, 0))
+    def get_percentage(self, cost, total):
+        """Return percentage of cost relative to total."""
+        percent = int(round((float(cost) / total) * 100, 0))
         
         return percent
 
         
     def get_monthly_total_avg(self):
         """Return average total revenue for month and year."""
-        monthly_sales = self.session.query(MonthSales).all()
-        monthly_sales = [s for s in monthly_sales if (s.month_and_year.month
-                                                      == self.cal.date.month)]
+        read_cache = self.cal.controller.read_cache
+        monthly_sales = [total_sales for month_and_year, total_sales 
+                         in read_cache.get('monthly_sales')
+                         if month_and_year.month == self.cal.date.month]
         average = 0
-        for month_sales in monthly_sales:
-            average += month_sales.total_sales
+        for total_sales in monthly_sales:
+            average += total_sales
         if len(monthly_sales) != 0:
             average = average / len(monthly_sales)
             return average
@@ -1873,41 +2625,69 @@ class CalendarCalculator(tk.Frame):
             for k in self.percentage_dict:
                 var = self.percentage_dict[k]
                 var.set('No Data')
+            self.cal.update_day_ratios(None)
             return
     
-        schedules = (self.session
-                         .query(Schedule)
-                         .filter(Schedule.calendar_date == self.cal.date)
-                         .all())
-        departments = (self.session
-                           .query(Department)
-                           .all())
-        dep_schedules = {}
-        for d in departments:
-            dep_schedules[d.name] = 0
-        # Split up schedules into sublist according to assigned department
-        for k in dep_schedules:
-            schedule_coll = [s for s in schedules if s.department == k]
-            dep_schedules[k] = schedule_coll
-        
-        # We find individual percentage costs for department and keep a
-        # running sum in order to also calculate total percentage cost of all
-        # departments.
+        departments = self.cal.controller.read_cache.get('departments')
+        # Costs of every department are summed in one pass over the month's
+        # columns kept by the calendar, so nothing is queried on an update.
+        costs = self.cal.snapshot.columns.get_department_costs()
         total = 0
-        for k in dep_schedules:
-            percent = self.get_percentage(dep_schedules[k], monthly_avg)
+        for k in departments:
+            percent = self.get_percentage(costs.get(k, 0), monthly_avg)
             total += percent
             var = self.percentage_dict[k]
             var.set((str(percent) + "%"))
         total_var = self.percentage_dict['Total']
         total_var.set((str(total) + "%"))
-       
-            
+        self.cal.update_day_ratios(monthly_avg)
         
-            
+        
+        
+class StaffingGapList(tk.Frame):
+    """Composite widget to display understaffed times of a calendar.
     
+    The StaffingGapList is a listbox of every time of the current selected
+    calendar's month where fewer employees of its department are assigned to
+    schedules than a minimum staffing requirement of the department needs. 
+    The list is recalculated whenever a schedule is added, removed or 
+    assigned an employee, or when a staffing requirement changes.
     
+    Attributes:
+        parent: tk.Frame container for the child widgets.   
+        session: An sqlalchemy session object using sqlite3.
+        cal: Calendar display of the month and department of the gaps.
+        gap_listbox: tk.Listbox of strings of each understaffed time.
+    """
+    
+    def __init__(self, parent, session, calendar_display):
+        """Initialize the display of understaffed times.
         
+        Args:
+            parent: tk.Frame container for the child widgets.   
+            session: An sqlalchemy session object using sqlite3.
+            calendar_display: Calendar display of the month and department
+                to list understaffed times for.
+        """
         
-
-        
\ No newline at end of file
+        self.parent = parent
+        self.session = session
+        self.cal = calendar_display
+        
+        gap_frame = ttk.LabelFrame(self.parent, 
+                                   text='Understaffed Times (Scheduled/Needed)')
+        gap_frame.pack(fill=tk.X, pady=12)
+        self.gap_listbox = tk.Listbox(gap_frame, 
+                                      width=36, height=6,
+                                      font=SMALL_FONT,
+                                      bg="white")
+        self.gap_listbox.pack()
+        
+        self.update_gaps()
+        
+        
+    def update_gaps(self):
+        """Recalculate and display understaffed times of the calendar."""
+        self.gap_listbox.delete(0, tk.END)
+        for g in self.cal.get_staffing_gaps():
+            self.gap_listbox.insert(tk.END, g.get_str())
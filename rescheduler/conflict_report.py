@@ -0,0 +1,328 @@
+"""
+Module for reporting scheduling conflicts of all employees over a date range
+
+The report can be run without the GUI, for example to check a whole year,
+including months that have been archived:
+
+    python conflict_report.py 35 2017-01-01 2017-12-31
+
+The report only reads the database, which must exist and be migrated to the
+current schema version, see migrations.
+"""
+
+import argparse
+import collections
+import datetime
+import heapq
+import itertools
+import os
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from orm_models import (Schedule, SCHEMA_VERSION, get_slot_mask, 
+                        get_day_slot_masks, get_schema_version)
+from core_reads import (select_schedules, select_vacations, 
+                        select_unavailable_times, select_employee_names)
+
+# Schedules end at the latest the day after they start, so a schedule that 
+# overlaps a time period must start less than a day before the period starts.
+MAX_SCHEDULE_LENGTH = datetime.timedelta(days=1)
+
+
+class Conflict(collections.namedtuple('Conflict', 
+                                      ['employee_id', 'flag', 'schedule_id',
+                                       'start_datetime', 'end_datetime',
+                                       'department', 'conflict_id'])):
+    """A schedule whose assigned employee is not available to work it.
+    
+    Attributes:
+        employee_id: Primary key of the employee assigned to the schedule.
+        flag: The availability flag of the conflict as used by 
+            Employee.get_availability: '(S)' if the employee is assigned to 
+            another overlapping schedule, '(V)' for an overlapping vacation and
+            '(U)' for an overlapping repeating unavailability.
+        schedule_id: Primary key of the schedule with the conflict.
+        start_datetime: datetime.datetime of the start of the schedule.
+        end_datetime: datetime.datetime of the end of the schedule.
+        department: String name of the department of the schedule.
+        conflict_id: Primary key of the schedule, vacation or repeating
+            unavailability the schedule conflicts with.
+    """
+    
+    __slots__ = ()
+    
+    FLAG_TO_STR = {'(S)': 'double-booked with schedule',
+                   '(V)': 'scheduled during vacation',
+                   '(U)': 'scheduled during repeating unavailability'}
+    
+    def get_str(self, employee_name):
+        """Returns a string formatted date, times, department, name: conflict."""
+        date_str = self.start_datetime.strftime("%Y-%m-%d %I:%M %p")
+        end_str = self.end_datetime.strftime("%I:%M %p")
+        return "%s - %s %s, %s %s: %s %s" % (date_str, end_str, 
+                                            self.department, employee_name,
+                                            self.flag, 
+                                            self.FLAG_TO_STR[self.flag],
+                                            self.conflict_id)
+    
+    
+def find_conflicts(session, start_date, end_date, archived=False):
+    """Find every conflict of assigned schedules within a date range.
+    
+    Instead of checking the availability of each schedule against every other
+    schedule of its employee, the schedules and vacations of each employee 
+    are sorted by start once and swept in order. Intervals that have started
+    are kept in a heap by their end, so an interval is dropped as soon as it
+    ends before the start of the next schedule and every interval still in 
+    the heap overlaps that schedule.
+    
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        start_date: datetime.date of the first day of schedules to check.
+        end_date: datetime.date of the last day of schedules to check.
+        archived: Boolean to also check archived schedules of the range,
+            which ends the session's transaction.
+    Returns:
+        A list of Conflict sorted by schedule start then employee. A double
+        booking is reported once for each of the two schedules.
+    """
+    
+    range_start = datetime.datetime(start_date.year, start_date.month, 
+                                    start_date.day)
+    range_end = (datetime.datetime(end_date.year, end_date.month, 
+                                   end_date.day) 
+                 + datetime.timedelta(days=1))
+    archived_range = (start_date, end_date) if archived else None
+    # Schedules of the last day may end the day after it
+    vacation_end = range_end + MAX_SCHEDULE_LENGTH
+    schedules = select_schedules(session,
+                                 ['employee_id', 'id', 'start_datetime', 
+                                  'end_datetime', 'start_time', 'end_time', 
+                                  'department'],
+                                 [Schedule.employee_id != None,
+                                  Schedule.schedule_date >= start_date,
+                                  Schedule.schedule_date <= end_date],
+                                 order_by=['employee_id', 'start_datetime'],
+                                 archived=archived_range)
+    vacations = select_vacations(session, range_start, vacation_end)
+    employee_vacations = dict((k, list(g)) for k, g 
+                              in itertools.groupby(vacations, 
+                                                   lambda v: v[0]))
+    employee_unav_times = collections.defaultdict(list)
+    for u in select_unavailable_times(session):
+        employee_unav_times[u.employee_id].append(u)
+    
+    conflicts = []
+    for employee_id, group in itertools.groupby(schedules, lambda s: s[0]):
+        group = list(group)
+        conflicts += get_schedule_conflicts(group)
+        conflicts += get_vacation_conflicts(group, 
+                                            employee_vacations.get(employee_id,
+                                                                   []))
+        conflicts += get_unavailable_conflicts(group, 
+                                               employee_unav_times[employee_id])
+    conflicts.sort(key=lambda c: (c.start_datetime, c.employee_id))
+    return conflicts
+    
+    
+def get_schedule_conflicts(schedules):
+    """Return conflicts between overlapping schedules of one employee.
+    
+    Args:
+        schedules: list of schedule rows of one employee sorted by start.
+    """
+    
+    conflicts = []
+    active = []
+    for s in schedules:
+        employee_id, id, start, end, start_time, end_time, dep = s
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for other_end, other in active:
+            conflicts.append(Conflict(employee_id, '(S)', id, start, end,
+                                      dep, other[1]))
+            conflicts.append(Conflict(employee_id, '(S)', other[1], other[2],
+                                      other[3], other[6], id))
+        heapq.heappush(active, (end, s))
+    return conflicts
+    
+    
+def get_vacation_conflicts(schedules, vacations):
+    """Return conflicts between schedules and vacations of one employee.
+    
+    Args:
+        schedules: list of schedule rows of one employee sorted by start.
+        vacations: list of vacation rows of the employee sorted by start.
+    """
+    
+    conflicts = []
+    active = []
+    i = 0
+    for employee_id, id, start, end, start_time, end_time, dep in schedules:
+        while i < len(vacations) and vacations[i][2] < end:
+            heapq.heappush(active, (vacations[i][3], vacations[i][2],
+                                    vacations[i][1]))
+            i += 1
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        # An earlier schedule may end after this one, so vacations in the
+        # heap may start after this schedule ends.
+        for v_end, v_start, v_id in active:
+            if v_start < end:
+                conflicts.append(Conflict(employee_id, '(V)', id, start, end,
+                                          dep, v_id))
+    return conflicts
+    
+    
+def get_unavailable_conflicts(schedules, unav_times):
+    """Return conflicts between schedules and repeating unavailabilities.
+    
+    Times are compared by 15 minute slots, as Employee.get_availability 
+    does, on each day a schedule is on, so a schedule past midnight 
+    conflicts with unavailability of the weekday it ends on too.
+    
+    Args:
+        schedules: list of schedule rows of one employee.
+        unav_times: list of repeating unavailability rows of the employee
+            as returned by core_reads.select_unavailable_times.
+    """
+    
+    conflicts = []
+    if unav_times == []:
+        return conflicts
+    weekday_unav = collections.defaultdict(list)
+    for u in unav_times:
+        weekday_unav[u.weekday].append((get_slot_mask(u.start_time, 
+                                                      u.end_time), u.id))
+    for employee_id, id, start, end, start_time, end_time, dep in schedules:
+        for weekday, slot_mask in get_day_slot_masks(start, end):
+            for unav_mask, unav_id in weekday_unav.get(weekday, []):
+                if slot_mask & unav_mask:
+                    conflicts.append(Conflict(employee_id, '(U)', id, start,
+                                              end, dep, unav_id))
+    return conflicts
+    
+    
+def get_overlapping_schedules(session, employee_id, start_dt, end_dt):
+    """Return schedules of an employee that overlap a time period.
+    
+    Rather than loading every schedule the employee has ever worked, the
+    query is a range scan of the (employee_id, start_datetime) index that is
+    bounded on both sides by the period and the maximum schedule length.
+    
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        employee_id: Primary key of the employee to check.
+        start_dt: datetime.datetime of the start of the period.
+        end_dt: datetime.datetime of the end of the period.
+    Returns:
+        A list of schedule objects sorted by start.
+    """
+    
+    return (session.query(Schedule)
+                   .filter(Schedule.employee_id == employee_id,
+                           Schedule.start_datetime > (start_dt 
+                                                      - MAX_SCHEDULE_LENGTH),
+                           Schedule.start_datetime < end_dt,
+                           Schedule.end_datetime > start_dt)
+                   .order_by(Schedule.start_datetime)
+                   .all())
+                   
+                   
+def find_vacation_conflicts(session, vacations):
+    """Find schedules that overlap each of many proposed vacations.
+    
+    All schedules of the employees of the vacations within the time spanned 
+    by the vacations are loaded with one indexed query. Then the schedules 
+    and vacations of each employee are swept once in order of start, keeping
+    schedules that have started in a heap by their end.
+    
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        vacations: list of 3-element tuples of (employee primary key, start
+            datetime, end datetime) of each proposed vacation.
+    Returns:
+        A list parallel to vacations of lists of the primary keys of the 
+        schedules that overlap each vacation, sorted by schedule start.
+    """
+    
+    conflicts = [[] for v in vacations]
+    if vacations == []:
+        return conflicts
+    employee_ids = set(v[0] for v in vacations)
+    range_start = min(v[1] for v in vacations)
+    range_end = max(v[2] for v in vacations)
+    earliest_start = range_start - MAX_SCHEDULE_LENGTH
+    schedules = select_schedules(session,
+                                 ['employee_id', 'id', 'start_datetime', 
+                                  'end_datetime'],
+                                 [Schedule.employee_id.in_(employee_ids),
+                                  Schedule.start_datetime > earliest_start,
+                                  Schedule.start_datetime < range_end,
+                                  Schedule.end_datetime > range_start],
+                                 order_by=['employee_id', 'start_datetime'])
+    employee_schedules = dict((k, list(g)) for k, g 
+                              in itertools.groupby(schedules, 
+                                                   lambda s: s[0]))
+    # Indexes of the vacations of each employee sorted by start
+    employee_vacations = collections.defaultdict(list)
+    for i in sorted(range(len(vacations)), key=lambda i: vacations[i][1]):
+        employee_vacations[vacations[i][0]].append(i)
+    
+    for employee_id, vacation_indexes in employee_vacations.iteritems():
+        e_schedules = employee_schedules.get(employee_id, [])
+        active = []
+        j = 0
+        for i in vacation_indexes:
+            v_start, v_end = vacations[i][1], vacations[i][2]
+            while j < len(e_schedules) and e_schedules[j][2] < v_end:
+                heapq.heappush(active, (e_schedules[j][3], e_schedules[j]))
+                j += 1
+            while active and active[0][0] <= v_start:
+                heapq.heappop(active)
+            # An earlier vacation may end after this one, so schedules in the
+            # heap may start after this vacation ends.
+            overlapping = [s for end, s in active if s[2] < v_end]
+            overlapping.sort(key=lambda s: s[2])
+            conflicts[i] = [s[1] for s in overlapping]
+    return conflicts
+    
+    
+def get_employee_names(session):
+    """Return dict of employee primary keys to employee full names."""
+    names = {}
+    rows = select_employee_names(session)
+    for employee_id, first_name, last_name in rows:
+        names[employee_id] = "%s %s" % (first_name, last_name)
+    return names
+    
+    
+def main():
+    """Print conflict report of a database for a date range."""
+    parser = argparse.ArgumentParser(description="Report every employee who "
+                                     "is double-booked, scheduled during a "
+                                     "vacation or scheduled during a "
+                                     "repeating unavailability.")
+    parser.add_argument('db_name', help="Database name without .db, e.g. 35")
+    parser.add_argument('start_date', help="First day, YYYY-MM-DD")
+    parser.add_argument('end_date', help="Last day, YYYY-MM-DD")
+    args = parser.parse_args()
+    
+    start_date = datetime.datetime.strptime(args.start_date, "%Y-%m-%d").date()
+    end_date = datetime.datetime.strptime(args.end_date, "%Y-%m-%d").date()
+    path = args.db_name + '.db'
+    if not os.path.exists(path):
+        parser.error("no database %s" % path)
+    session = sessionmaker(bind=create_engine('sqlite:///' + path))()
+    version = get_schema_version(session)
+    if version != SCHEMA_VERSION:
+        parser.error("database %s is at schema version %s, not %s, run "
+                     "migrations.py first" % (path, version, SCHEMA_VERSION))
+    conflicts = find_conflicts(session, start_date, end_date, archived=True)
+    names = get_employee_names(session)
+    for c in conflicts:
+        print(c.get_str(names.get(c.employee_id, c.employee_id)))
+    print("%s conflicts found." % len(conflicts))
+    
+    
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Module for reading a few columns of many rows without the ORM
+
+The cost panel, staffing gaps and the conflict report read only a handful
+of columns of every schedule in a month, department or employee range.
+Selecting those columns with SQLAlchemy Core returns plain rows, which skips
+building mapped objects, the identity map and converting the columns that
+are not needed. Rows unpack like tuples and their columns can also be read
+by name, for example row.start_datetime.
+
+Schedules of archived months are read too when a range of dates is given,
+by attaching the archives of the range to the session's connection.
+"""
+
+from sqlalchemy import select, and_, union_all
+from sqlalchemy.sql import visitors
+from orm_models import (Schedule, Employee, Vacation, UnavailableTime,
+                        EmployeeMonthHours, EmployeeWeekHours, 
+                        DepartmentMonthCost)
+from archive import attach_archives, get_archive_table
+
+SCHEDULES = Schedule.__table__
+EMPLOYEES = Employee.__table__
+VACATIONS = Vacation.__table__
+UNAVAILABLE_TIMES = UnavailableTime.__table__
+
+
+def get_wage_column():
+    """Return a column of the wage of the employee of each schedule."""
+    return (select([EMPLOYEES.c.wage])
+            .where(EMPLOYEES.c.id == SCHEDULES.c.employee_id)
+            .as_scalar()
+            .label('wage'))
+
+
+def adapt_to_archive(clause, archive):
+    """Return copy of a clause on the schedules table using an archive's.
+
+    Args:
+        clause: A select or other clause using columns of SCHEDULES.
+        archive: The schedules table of an attached archive.
+    """
+
+    def replace(element):
+        if getattr(element, 'table', None) is SCHEDULES:
+            return archive.c[element.key]
+        return None
+
+    return visitors.replacement_traverse(clause, {}, replace)
+
+
+def select_schedules(session, columns, criteria=(), wage=False, order_by=(),
+                     archived=None, live=True):
+    """Return rows of some columns of the schedules matching criteria.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        columns: list of names of columns of the schedules table.
+        criteria: list of clauses on Schedule to filter by, e.g.
+            [Schedule.calendar_date == date, Schedule.department == dep].
+        wage: Boolean to add the wage of the assigned employee as the last
+            column, None if the schedule is not assigned.
+        order_by: list of names of columns of the schedules table to sort
+            rows by, which must be in columns when reading archives.
+        archived: tuple of (start, end) datetime.date of a range of dates to
+            also read archived schedules of, or None to only read the live
+            database. Attaching archives ends the session's transaction, 
+            so this should not be used by a session with changes.
+        live: Boolean to read the live database, False to only read the
+            archives of archived.
+    Returns:
+        A list of rows in order of columns.
+    """
+
+    selected = [SCHEDULES.c[name] for name in columns]
+    if wage:
+        selected.append(get_wage_column())
+    query = select(selected)
+    if criteria:
+        query = query.where(and_(*criteria))
+    order_columns = SCHEDULES.c
+    queries = [query] if live else []
+    if archived:
+        schemas = attach_archives(session.connection(), 
+                                  session.bind.url.database, *archived)
+        queries += [adapt_to_archive(query, get_archive_table(s))
+                    for s in schemas]
+    if not queries:
+        return []
+    if len(queries) > 1 or not live:
+        query = union_all(*queries)
+        order_columns = query.c
+    if order_by:
+        query = query.order_by(*[order_columns[name] for name in order_by])
+    return session.execute(query).fetchall()
+
+
+def select_schedule_columns(session, columns, criteria=(), wage=False):
+    """Return a list of the values of each column of matching schedules.
+
+    Args are the same as for select_schedules.
+
+    Returns:
+        A tuple of lists parallel to columns, with the wage list last if
+        wage is True. Each list has the value of its column for every
+        matching schedule, in the same order in every list.
+    """
+
+    rows = select_schedules(session, columns, criteria, wage)
+    width = len(columns) + (1 if wage else 0)
+    if rows == []:
+        return tuple([] for i in range(width))
+    return tuple(list(column) for column in zip(*rows))
+
+
+def select_vacations(session, start, end, employee_ids=None):
+    """Return rows of vacations overlapping a time period by employee.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        start: datetime.datetime of the start of the period.
+        end: datetime.datetime of the end of the period.
+        employee_ids: Collection of employee_id to only return vacations of,
+            None for vacations of every employee.
+    Returns:
+        A list of (employee_id, id, start_datetime, end_datetime) rows sorted
+        by employee_id then start.
+    """
+
+    query = (select([VACATIONS.c.employee_id, VACATIONS.c.id,
+                     VACATIONS.c.start_datetime, VACATIONS.c.end_datetime])
+             .where(and_(VACATIONS.c.employee_id != None,
+                         VACATIONS.c.start_datetime < end,
+                         VACATIONS.c.end_datetime > start))
+             .order_by(VACATIONS.c.employee_id, VACATIONS.c.start_datetime))
+    if employee_ids is not None:
+        query = query.where(VACATIONS.c.employee_id.in_(employee_ids))
+    return session.execute(query).fetchall()
+
+
+def select_unavailable_times(session):
+    """Return rows of every repeating unavailability.
+
+    Returns:
+        A list of (employee_id, id, weekday, start_time, end_time) rows.
+    """
+
+    query = select([UNAVAILABLE_TIMES.c.employee_id, UNAVAILABLE_TIMES.c.id,
+                    UNAVAILABLE_TIMES.c.weekday, 
+                    UNAVAILABLE_TIMES.c.start_time,
+                    UNAVAILABLE_TIMES.c.end_time])
+    return session.execute(query).fetchall()
+
+
+def select_employee_minutes(session, model, key, value):
+    """Return dict of employee primary key to minutes of a month or week.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        model: EmployeeMonthHours or EmployeeWeekHours.
+        key: String name of the column of the month or week, calendar_date
+            or week_start.
+        value: datetime.date of the first day of the month or week.
+    """
+
+    table = model.__table__
+    query = (select([table.c.employee_id, table.c.minutes])
+             .where(table.c[key] == value))
+    return dict(session.execute(query).fetchall())
+
+
+def select_month_minutes(session, calendar_date):
+    """Return dict of employee primary key to minutes scheduled in a month."""
+    return select_employee_minutes(session, EmployeeMonthHours, 
+                                   'calendar_date', calendar_date)
+
+
+def select_week_minutes(session, week_start):
+    """Return dict of employee primary key to minutes scheduled in a week."""
+    return select_employee_minutes(session, EmployeeWeekHours, 'week_start',
+                                   week_start)
+
+
+def select_department_costs(session, start_date, end_date, department=None):
+    """Return rows of the cost of each department's month in a range.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        start_date: datetime.date of the first month.
+        end_date: datetime.date of the last month.
+        department: String name of a department, None for all of them.
+    Returns:
+        A list of (calendar_date, department, cost) rows of the live
+        database sorted by month.
+    """
+
+    table = DepartmentMonthCost.__table__
+    query = (select([table.c.calendar_date, table.c.department, 
+                     table.c.cost])
+             .where(and_(table.c.calendar_date >= start_date,
+                         table.c.calendar_date <= end_date))
+             .order_by(table.c.calendar_date))
+    if department is not None:
+        query = query.where(table.c.department == department)
+    return session.execute(query).fetchall()
+
+
+def select_employee_names(session):
+    """Return rows of (id, first_name, last_name) of employees."""
+    query = select([EMPLOYEES.c.id, EMPLOYEES.c.first_name,
+                    EMPLOYEES.c.last_name])
+    return session.execute(query).fetchall()
@@ -4,11 +4,18 @@ Module for the employee and department page.
 
 import Tkinter as tk
 import ttk
+import tkMessageBox
 import datetime
 import bisect
 import collections
 from datetime_widgets import DateEntry, TimeEntry, yearify
 from orm_models import Employee, Department, Vacation, UnavailableTime
+from conflict_report import get_overlapping_schedules
+from bulk_operations import (remove_employee, remove_department, 
+                             count_department_rows, get_unshared_name)
+from unit_of_work import (expire_employee_rows, expire_employee_schedules,
+                          expunge_employee, expunge_department)
+from write_queue import set_committed_values
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -29,10 +36,14 @@ class EmployeePage(tk.Frame):
     widgets talk to each other and to know the current selected employee.
     """
     
-    def __init__(self, parent, session):
+    def __init__(self, parent, session, write_queue, read_cache, 
+                 calendar_page):
         """Initialize EmployeePage and the different composite widgets."""
         tk.Frame.__init__(self, parent)
         self.session = session
+        self.write_queue = write_queue
+        self.read_cache = read_cache
+        self.cal = calendar_page
         self.curr_sel_employee = None
         
         # Left Panel Frame Widgets for Employee/Department Lists
@@ -90,11 +101,8 @@ class EmployeePage(tk.Frame):
                   
                   
     def get_employee(self, id):
-        """Return employee in database given employee id."""
-        employee = (self.session.query(Employee)
-                                .filter(Employee.employee_id == id)
-                                .first())
-        return employee
+        """Return employee in database given its primary key."""
+        return self.session.query(Employee).get(id)
         
                                    
     def load_employee_data(self, employee_id):
@@ -113,9 +121,27 @@ class EmployeePage(tk.Frame):
         
     def update_e_list(self, employee_id):
         """Update list of employees in employee listbox."""
+        self.invalidate_directory()
+        self.invalidate_employees()
         self.employee_list.update_listbox(employee_id)
         
         
+    def invalidate_employees(self):
+        """Read employee and vacation snapshots again when next used."""
+        self.read_cache.invalidate('employees')
+        self.read_cache.invalidate('vacations')
+        
+        
+    def invalidate_directory(self):
+        """Read the employee directory again when next used.
+        
+        Only saving or removing an employee or department changes what the
+        directory has of employees.
+        """
+        
+        self.read_cache.invalidate('employee_directory')
+        
+        
     def add_new_e_info(self):
         """Fill in employee info form as a new employee."""
         self.e_info_form.add_new_e_info()
@@ -165,15 +191,15 @@ class EmployeeList(tk.Frame):
 
         
     def load_listbox_and_parallel_list(self):
-        """Load listbox of employee names and parallel list of employee_id."""
-        employee_db_list = self.controller.session.query(Employee).all()
-        employee_db_list.sort(key=lambda e: e.first_name)
+        """Load listbox of employee names and parallel list of their ids."""
+        employees = self.controller.read_cache.get('employee_directory')
+        employee_db_list = sorted(employees.values(), 
+                                  key=lambda e: e.first_name)
         
         for e in employee_db_list:
-            str = e.first_name + " " + e.last_name
-            self.employee_listbox.insert(tk.END, str)
+            self.employee_listbox.insert(tk.END, e.get_name())
             
-        self.employee_id_list = [e.employee_id for e in employee_db_list]
+        self.employee_id_list = [e.id for e in employee_db_list]
         
         
     def add_new_employee(self):
@@ -195,19 +221,33 @@ class EmployeeList(tk.Frame):
         
     
     def remove_employee(self):
-        """Delete employee from lb and tell controller to remove employee."""
+        """Queue removal of employee, delete from lb once it is removed."""
         if self.employee_listbox.curselection() == ():
             return 
         index = self.employee_listbox.curselection()[0]
-        self.employee_listbox.delete(index)
         self.controller.clear_employee_data()
         # Employee in listbox may be new employee not in parallel list
-        if index < len(self.employee_id_list):
-            employee_id = self.employee_id_list[index]
-            employee = self.controller.get_employee(employee_id)
-            self.controller.session.delete(employee)
-            self.controller.session.commit()
+        if index >= len(self.employee_id_list):
+            self.employee_listbox.delete(index)
+            return
+        employee_id = self.employee_id_list[index]
+        
+        def write(session):
+            remove_employee(session, employee_id)
+            
+        def on_success(result):
+            expunge_employee(self.controller.session, employee_id)
+            self.controller.invalidate_directory()
+            self.controller.invalidate_employees()
+            self.controller.cal.remove_employee(employee_id)
+            index = self.employee_id_list.index(employee_id)
+            self.employee_listbox.delete(index)
             del self.employee_id_list[index]
+            
+        def on_error(error):
+            tkMessageBox.showerror("Could Not Remove Employee", str(error))
+            
+        self.controller.write_queue.submit(write, on_success, on_error)
 
         
     def get_employee_id(self):
@@ -215,7 +255,7 @@ class EmployeeList(tk.Frame):
         
         Returns:
             None: if no element in listbox was selected
-            employee_id: if employee existing in database is clicked
+            id: primary key if employee existing in database is clicked
             "New Employee": A new employee that doesn't exist in database, but
                 exists in the listbox.
         """
@@ -232,8 +272,8 @@ class EmployeeList(tk.Frame):
         
     def update_listbox(self, employee_id):
         """Update the name of employee in the listbox."""
-        employee = self.controller.get_employee(employee_id)
-        str = employee.first_name + " " + employee.last_name
+        directory = self.controller.read_cache.get('employee_directory')
+        str = directory[employee_id].get_name()
         if employee_id in self.employee_id_list:
             index = self.employee_id_list.index(employee_id)
             self.employee_listbox.delete(index)
@@ -310,28 +350,74 @@ class DepartmentList(tk.Frame):
         
         
     def add_department(self):
-        """Add department from listbox and database."""
-        department = Department(self.dep_name.get())
-        self.controller.session.add(department)
-        self.controller.session.commit()
-        
-        self.department_listbox.insert(tk.END, department.name)
-        self.cal.dep_id_list.append(department.id)
+        """Queue department to add to database, add to lb once saved."""
+        name = self.dep_name.get()
+        
+        def write(session):
+            department = Department(name)
+            session.add(department)
+            session.flush()
+            return department.id
+            
+        def on_success(id):
+            self.controller.read_cache.invalidate('departments')
+            self.department_listbox.insert(tk.END, name)
+            self.dep_id_list.append(id)
+            
+        self.controller.write_queue.submit(write, on_success, 
+                                           self.save_failed)
         
         
     def remove_department(self):
-        """Remove department from listbox and database."""
+        """Remove department from listbox and database.
+        
+        The department's schedules, staffing requirements and shift 
+        templates are deleted with it, so the user is told how many there 
+        are and asked to confirm first. The department is deleted from the
+        listbox once the write queue has removed it.
+        """
+        
         if self.department_listbox.curselection() == ():
             return
         index = self.department_listbox.curselection()[0]
         dep_id = self.dep_id_list[index]
-        db_department = (self.controller.session.query(Department)
-                                        .filter(Department.id == dep_id)
-                                        .first())
-        self.controller.session.delete(db_department)
-        self.controller.session.commit()
-        self.department_listbox.delete(index)
-        del self.dep_id_list[index]
+        department = self.department_listbox.get(index)
+        counts = count_department_rows(self.controller.session, dep_id)
+        if any(counts):
+            msg = ("Removing %s also deletes its %s schedules, %s staffing "
+                   "requirements and %s shift templates. Archived schedules "
+                   "are kept. Remove %s?" % ((department,) + counts 
+                                             + (department,)))
+            if not tkMessageBox.askyesno("Remove Department", msg):
+                return
+        
+        def write(session):
+            name = get_unshared_name(session, dep_id)
+            return name, remove_department(session, dep_id)
+            
+        def on_success(result):
+            name, deleted = result
+            session = self.controller.session
+            expunge_department(session, dep_id, name)
+            expire_employee_schedules(session, set(d.employee_id 
+                                                   for d in deleted))
+            self.controller.read_cache.invalidate('departments')
+            self.controller.read_cache.invalidate('staffing_requirements')
+            self.controller.invalidate_directory()
+            self.controller.invalidate_employees()
+            if deleted:
+                self.controller.cal.remove_department(department)
+            index = self.dep_id_list.index(dep_id)
+            self.department_listbox.delete(index)
+            del self.dep_id_list[index]
+            
+        self.controller.write_queue.submit(write, on_success, 
+                                           self.save_failed)
+        
+        
+    def save_failed(self, error):
+        """Tell the user the department could not be saved or removed."""
+        tkMessageBox.showerror("Could Not Save Department", str(error))
         
                    
         
@@ -544,42 +630,101 @@ class EmployeeInfoForm(tk.Frame):
             errors.append("Employee ID %s is already taken." % new_e_id)
         if errors == []:
             employee_id = self.controller.curr_sel_employee
+            values = {'first_name': f_name,
+                      'last_name': l_name,
+                      'primary_department': self.dep1.get(),
+                      'alternate1_department': self.dep2.get(),
+                      'alternate2_department': self.dep3.get(),
+                      'wage': wage_value,
+                      'desired_hours': self.d_hours.get(),
+                      'overtime': o_time,
+                      'medical': medical_value,
+                      'workmans_comp': work_comp,
+                      'social_security': social}
             if employee_id != None and employee_id != "New Employee":
-                employee = self.controller.get_employee(employee_id)
-                employee.first_name = f_name
-                employee.last_name = l_name
-                employee.employee_id = new_e_id
-                employee.primary_department = self.dep1.get()
-                employee.alternate1_department = self.dep2.get()
-                employee.alternate2_department = self.dep3.get()
-                employee.wage = wage_value
-                employee.desired_hours = self.d_hours.get()
-                employee.overtime = o_time
-                employee.medical = medical_value
-                employee.workmans_comp = work_comp
-                employee.social_security = social   
-                self.controller.session.commit()
-                self.controller.update_e_list(new_e_id)
+                self.update_employee(employee_id, new_e_id, values)
             elif employee_id == "New Employee": 
-                employee = Employee(new_e_id, 
-                                    f_name, l_name,
-                                    self.dep1.get(), 
-                                    self.dep2.get(), 
-                                    self.dep3.get(),
-                                    wage_value, 
-                                    self.d_hours.get(),
-                                    o_time,
-                                    medical_value,
-                                    work_comp, 
-                                    social)
-                self.controller.session.add(employee)
-                self.controller.session.commit()
-                self.controller.update_e_list(new_e_id)
+                self.add_employee(new_e_id, values)
         else:
             print "Errors were: ", errors
             # Replace with warning dialog
             
 
+    def update_employee(self, employee_id, new_e_id, values):
+        """Queue a write of new values of an employee.
+        
+        The employee list shows the new values once the write commits. If 
+        the write fails the employee is loaded again from the database. 
+        Schedules, vacations and repeating unavailability refer to the 
+        employee by its primary key, so they keep their employee when the
+        employee_id changes.
+        
+        Args:
+            employee_id: Primary key of the employee to update.
+            new_e_id: The new employee_id of the employee.
+            values: dict of Employee attribute names to their new values.
+        """
+        
+        employee = self.controller.get_employee(employee_id)
+        values = dict(values, employee_id=new_e_id)
+        
+        def write(session):
+            (session.query(Employee)
+                    .filter(Employee.id == employee_id)
+                    .update(values, synchronize_session=False))
+                    
+        def on_success(result):
+            self.controller.update_e_list(employee_id)
+            self.controller.cal.set_employee_wage(employee_id, 
+                                                  values['wage'])
+                
+        def on_error(error):
+            if employee in self.controller.session:
+                self.controller.session.expire(employee)
+            self.controller.update_e_list(employee_id)
+            self.save_failed(error)
+            
+        set_committed_values(employee, values)
+        self.controller.write_queue.submit(write, on_success, on_error)
+        
+        
+    def add_employee(self, new_e_id, values):
+        """Queue a write of a new employee, add it to list once written.
+        
+        Args:
+            new_e_id: employee_id of the new employee.
+            values: dict of Employee attribute names to their values.
+        """
+        
+        def write(session):
+            employee = Employee(new_e_id, 
+                                values['first_name'], 
+                                values['last_name'],
+                                values['primary_department'], 
+                                values['alternate1_department'], 
+                                values['alternate2_department'],
+                                values['wage'], 
+                                values['desired_hours'],
+                                values['overtime'],
+                                values['medical'],
+                                values['workmans_comp'], 
+                                values['social_security'])
+            session.add(employee)
+            session.flush()
+            return employee.id
+            
+        def on_success(id):
+            self.controller.update_e_list(id)
+            
+        self.controller.write_queue.submit(write, on_success, 
+                                           self.save_failed)
+        
+        
+    def save_failed(self, error):
+        """Tell the user the employee information could not be saved."""
+        tkMessageBox.showerror("Could Not Save Employee", str(error))
+        
+        
     def employee_id_conflict(self, id):
         """Return true if there exists an employee id conflict.
         
@@ -587,14 +732,12 @@ class EmployeeInfoForm(tk.Frame):
         id and that employee is not currently selected.
         """
         
-        potential_employee = (self.controller.session
-                                  .query(Employee)
-                                  .filter(Employee.employee_id == id)
-                                  .first())
-        if potential_employee == None or potential_employee.employee_id == id:
-            return False
-        else:
-            return True
+        directory = self.controller.read_cache.get('employee_directory')
+        for e in directory.itervalues():
+            if (e.employee_id == id 
+                and e.id != self.controller.curr_sel_employee):
+                return True
+        return False
             
             
     def add_new_e_info(self):
@@ -702,24 +845,26 @@ class EmployeeRepeatUnavailable(tk.Frame):
          
             
     def remove_unav_time(self):
-        """Remove repeat unavailability clicked from listbox."""
+        """Queue removal of repeat unavailability clicked from listbox."""
         if self.unavailable_d_lb.curselection() == ():
             return
         index = self.unavailable_d_lb.curselection()[0]
-        self.unavailable_d_lb.delete(index)
-        
         unav_time_id = self.unav_days[index]
-        unav_time = (self.controller.session.query(UnavailableTime)
-                                .filter(UnavailableTime.id == unav_time_id)
-                                .first())
-        self.controller.session.delete(unav_time)
-        self.controller.session.commit()
         
-        del self.unav_days[index]
+        def write(session):
+            unav_time = session.query(UnavailableTime).get(unav_time_id)
+            session.delete(unav_time)
+            return unav_time.employee_id
+            
+        def on_success(employee_id):
+            self.unav_times_saved(employee_id, [unav_time_id])
+            
+        self.controller.write_queue.submit(write, on_success, 
+                                           self.save_failed)
         
         
     def add_unav_time(self):
-        """Add repeat unavailability to listbox and database."""
+        """Queue repeat unavailability to database, list once saved."""
         start_time = self.unav_start_te.get_time()
         end_time = self.unav_end_te.get_time()
         weekday = self.DAYS_TO_NUM[self.unav_weekday_var.get()]
@@ -727,20 +872,37 @@ class EmployeeRepeatUnavailable(tk.Frame):
         if start_time < end_time:
             employee_id = self.controller.curr_sel_employee
             if employee_id != None and employee_id != "New Employee":
-
-                unav_time = UnavailableTime(start_time, 
-                                            end_time,
-                                            weekday,
-                                            employee_id)
-                self.controller.session.add(unav_time)
-                self.controller.session.commit()
-                employee = self.controller.get_employee(employee_id)
-                employee.add_unav_time(unav_time)
-                self.controller.session.commit()
-                # Insert newly added unavailable to listbox for display
-                self.unavailable_d_lb.insert(tk.END, 
-                                             unav_time.get_str())
-                self.unav_days.append(unav_time.id)
+            
+                def write(session):
+                    session.add(UnavailableTime(start_time, 
+                                                end_time,
+                                                weekday,
+                                                employee_id))
+                    return employee_id
+                    
+                self.controller.write_queue.submit(write, 
+                                                   self.unav_times_saved,
+                                                   self.save_failed)
+        
+        
+    def unav_times_saved(self, employee_id, deleted_ids=()):
+        """Show the employee's repeat unavailability once a write commits.
+        
+        Args:
+            employee_id: Primary key of the employee written to.
+            deleted_ids: Collection of primary keys of deleted UnavailableTime.
+        """
+        
+        expire_employee_rows(self.controller.session, UnavailableTime,
+                             employee_id, deleted_ids)
+        self.controller.invalidate_employees()
+        if self.controller.curr_sel_employee == employee_id:
+            self.load_unav_times(employee_id)
+            
+            
+    def save_failed(self, error):
+        """Tell the user the repeat unavailability could not be saved."""
+        tkMessageBox.showerror("Could Not Save Unavailable Time", str(error))
                
                
         
@@ -876,22 +1038,21 @@ class EmployeeVacations(tk.Frame):
         
             employee_id = self.controller.curr_sel_employee
             
-            conflicting_schedules = []
-            
             if employee_id != None and employee_id != "New Employee":
-                employee = self.controller.get_employee(employee_id)
-                for t in employee.schedules:
-                    if start_datetime < t.end_datetime and t.start_datetime < end_datetime:
-                        conflicting_schedules.append(t)   
+                session = self.controller.session
+                conflicting_schedules = get_overlapping_schedules(
+                                            session, employee_id,
+                                            start_datetime, end_datetime)
                 if conflicting_schedules == []:
-                    vacation = Vacation(start_datetime, end_datetime, 
-                                        employee_id)
-                    self.controller.session.add(vacation)
-                    employee.add_unavailable_schedule(vacation)
-                    self.controller.session.commit()
-                    self.future_v_lb.insert(tk.END, 
-                                            vacation.get_str_dates())
-                    self.future_vacations.append(vacation.id)
+                
+                    def write(session):
+                        session.add(Vacation(start_datetime, end_datetime, 
+                                             employee_id))
+                        return employee_id
+                        
+                    self.controller.write_queue.submit(write, 
+                                                       self.vacations_saved,
+                                                       self.save_failed)
                 else:
                     for e in conflicting_schedules:
                         print 'Confliction schedules are...'
@@ -903,40 +1064,54 @@ class EmployeeVacations(tk.Frame):
                 
         
     def remove_future_v(self):
-        """Remove vacation from future listbox and database."""
+        """Queue removal of vacation selected in future listbox."""
         if self.future_v_lb.curselection() == ():
             return
         index =  self.future_v_lb.curselection()[0]
-        
-        self.future_v_lb.delete(index)
-        vacation_id = self.future_vacations[index]
-        vacation = (self.controller.session.query(Vacation)
-                                .filter(Vacation.id == vacation_id)
-                                .first())
-        
-        
-        self.controller.session.delete(vacation)
-        self.controller.session.commit()
-        
-        del self.future_vacations[index]
+        self.remove_vacation(self.future_vacations[index])
         
         
     def remove_past_v(self):
-        """Remove vacation from past listbox and database."""
+        """Queue removal of vacation selected in past listbox."""
         if self.past_v_lb.curselection() == ():
             return
         index = self.past_v_lb.curselection()[0]
+        self.remove_vacation(self.past_vacations[index])
         
-        self.past_v_lb.delete(index)
-        vacation_id = self.past_vacations[index]
-        vacation = (self.controller.session.query(Vacation)
-                                .filter(Vacation.id == vacation_id)
-                                .first())
         
-        self.controller.session.delete(vacation)
-        self.controller.session.commit()
+    def remove_vacation(self, vacation_id):
+        """Queue removal of a vacation from database, list once removed."""
         
-        del self.past_vacations[index]
+        def write(session):
+            vacation = session.query(Vacation).get(vacation_id)
+            session.delete(vacation)
+            return vacation.employee_id
+            
+        def on_success(employee_id):
+            self.vacations_saved(employee_id, [vacation_id])
+            
+        self.controller.write_queue.submit(write, on_success, 
+                                           self.save_failed)
+        
+        
+    def vacations_saved(self, employee_id, deleted_ids=()):
+        """Show the employee's vacations once a write commits.
+        
+        Args:
+            employee_id: Primary key of the employee written to.
+            deleted_ids: Collection of primary keys of deleted Vacation.
+        """
+        
+        expire_employee_rows(self.controller.session, Vacation, employee_id,
+                             deleted_ids)
+        self.controller.invalidate_employees()
+        if self.controller.curr_sel_employee == employee_id:
+            self.load_vacations(employee_id)
+            
+            
+    def save_failed(self, error):
+        """Tell the user the vacation could not be saved."""
+        tkMessageBox.showerror("Could Not Save Vacation", str(error))
     
         
         
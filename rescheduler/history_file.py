@@ -0,0 +1,352 @@
+"""
+Module for a compressed file format of the schedules of a closed year
+
+Closed years are written once and only read for audits and year over year
+reports, so they can be exported from the database to a history file and
+imported back when needed. A history file stores the schedules of a year
+sorted by start, column by column, in batches:
+
+    header: magic, version, year, number of rows, length of dictionary
+    dictionary: zlib compressed JSON of the department names and
+        employee_ids the schedules use
+    batches: number of rows and length, then zlib compressed columns of
+        id deltas, start deltas and durations in seconds, department codes,
+        employee codes and undetermined time flags
+
+Starts of schedules sorted by start differ by little, and most ids by one,
+so the deltas are small numbers that compress well, and departments and
+employees are each stored once in the dictionary. A reader streams the
+file back one batch at a time. For example:
+
+    python history_file.py 35 export 2016
+    python history_file.py 35 import 35_history_2016.history
+"""
+
+import argparse
+import array
+import collections
+import datetime
+import json
+import os
+import struct
+import sys
+import zlib
+from itertools import izip
+from sqlalchemy import create_engine
+from orm_models import Schedule, start_db
+from archive import get_archive_path, create_archive
+from bulk_operations import get_schedule_row
+from core_reads import select_schedules
+
+MAGIC = 'RSHF'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+BATCH_HEADER = struct.Struct('<II')
+BATCH_SIZE = 8192
+# Typecodes of the columns of a batch, in the order they are stored
+TYPECODES = 'iiiHiB'
+S_UNDETERMINED = 1
+E_UNDETERMINED = 2
+NO_EMPLOYEE = -1
+SCHEDULES = Schedule.__table__
+
+
+class RecordBatch(collections.namedtuple('RecordBatch',
+                                         ['year_start', 'ids', 'starts',
+                                          'durations', 'departments',
+                                          'employee_ids',
+                                          's_undetermined_times',
+                                          'e_undetermined_times'])):
+    """Columns of a batch of schedules read from a history file.
+
+    Every attribute but year_start is a list or array with a value of each
+    schedule of the batch, in the same order in each. Times are kept as
+    seconds, as building a datetime for every schedule takes longer than
+    reading the rest of the batch, and sums of hours do not need them.
+
+    Attributes:
+        year_start: datetime.datetime of the start of the year.
+        ids: list of the primary key of each schedule.
+        starts: list of start times in seconds from the start of the year.
+        durations: array of the length of each schedule in seconds.
+        departments: list of department names.
+        employee_ids: list of employee_id, None if unassigned.
+        s_undetermined_times: list of bool of undetermined start times.
+        e_undetermined_times: list of bool of undetermined end times.
+    """
+
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    @property
+    def start_datetimes(self):
+        """List of the start of each schedule as a datetime.datetime."""
+        return [self.year_start + datetime.timedelta(0, s)
+                for s in self.starts]
+
+
+    @property
+    def end_datetimes(self):
+        """List of the end of each schedule as a datetime.datetime."""
+        return [self.year_start + datetime.timedelta(0, s + d)
+                for s, d in izip(self.starts, self.durations)]
+
+
+    def get_rows(self):
+        """Return list of dicts of the column values of each schedule."""
+        rows = []
+        for values in izip(self.ids, self.start_datetimes,
+                           self.end_datetimes, self.departments,
+                           self.employee_ids, self.s_undetermined_times,
+                           self.e_undetermined_times):
+            (id, start, end, department, employee_id,
+             s_undetermined, e_undetermined) = values
+            row = get_schedule_row(start, end, s_undetermined,
+                                   e_undetermined, department)
+            row['id'] = id
+            row['employee_id'] = employee_id
+            rows.append(row)
+        return rows
+
+
+
+def get_history_path(db_path, year):
+    """Return path of the history file of a year of a database."""
+    return "%s_history_%s.history" % (os.path.splitext(db_path)[0], year)
+
+
+def to_bytes(column):
+    """Return the bytes of an array in little-endian order."""
+    if sys.byteorder == 'big':
+        column = array.array(column.typecode, column)
+        column.byteswap()
+    return column.tostring()
+
+
+def from_bytes(typecode, data):
+    """Return an array of the little-endian bytes data."""
+    column = array.array(typecode)
+    column.fromstring(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def write_batch(history_file, columns):
+    """Compress and write a batch of encoded columns to a file."""
+    data = zlib.compress(''.join(to_bytes(c) for c in columns), 9)
+    history_file.write(BATCH_HEADER.pack(len(columns[0]), len(data)))
+    history_file.write(data)
+
+
+def export_history(session, year, path, batch_size=BATCH_SIZE):
+    """Write the schedules of a year to a history file.
+
+    Schedules are read from the live database and the archive of the year.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        year: int year of the schedules.
+        path: String path of the history file to write.
+        batch_size: int number of schedules of each batch.
+    Returns:
+        The number of schedules written.
+    """
+
+    first_day = datetime.date(year, 1, 1)
+    last_day = datetime.date(year, 12, 31)
+    rows = select_schedules(session,
+                            ['id', 'start_datetime', 'end_datetime',
+                             'department', 'employee_id',
+                             's_undetermined_time', 'e_undetermined_time'],
+                            [Schedule.calendar_date >= first_day,
+                             Schedule.calendar_date <= last_day],
+                            order_by=['start_datetime', 'id'],
+                            archived=(first_day, last_day))
+    departments = sorted(set(row.department for row in rows))
+    employee_ids = sorted(set(row.employee_id for row in rows
+                              if row.employee_id != None))
+    dep_codes = dict((d, i) for i, d in enumerate(departments))
+    employee_codes = dict((e, i) for i, e in enumerate(employee_ids))
+    dictionary = zlib.compress(json.dumps({'departments': departments,
+                                           'employee_ids': employee_ids}))
+
+    with open(path, 'wb') as history_file:
+        history_file.write(HEADER.pack(MAGIC, VERSION, year, len(rows),
+                                       len(dictionary)))
+        history_file.write(dictionary)
+        last_id = 0
+        last_start = datetime.datetime(year, 1, 1)
+        for batch_start in range(0, len(rows), batch_size):
+            columns = [array.array(t) for t in TYPECODES]
+            (id_deltas, start_deltas, durations, dep_column,
+             employee_column, flags) = columns
+            for row in rows[batch_start:batch_start + batch_size]:
+                id_deltas.append(row.id - last_id)
+                start_deltas.append(get_seconds(row.start_datetime
+                                                - last_start))
+                durations.append(get_seconds(row.end_datetime
+                                             - row.start_datetime))
+                dep_column.append(dep_codes[row.department])
+                employee_column.append(employee_codes.get(row.employee_id,
+                                                          NO_EMPLOYEE))
+                flag = 0
+                if row.s_undetermined_time:
+                    flag |= S_UNDETERMINED
+                if row.e_undetermined_time:
+                    flag |= E_UNDETERMINED
+                flags.append(flag)
+                last_id = row.id
+                last_start = row.start_datetime
+            write_batch(history_file, columns)
+    return len(rows)
+
+
+def get_seconds(timedelta):
+    """Return int number of seconds of a datetime.timedelta."""
+    return timedelta.days * 24 * 60 * 60 + timedelta.seconds
+
+
+
+class HistoryReader(object):
+    """Reader streaming the schedules of a history file in batches.
+
+    Only one batch is decoded at a time, so a file of any size is read in
+    the memory of a batch. Iterating over the reader yields RecordBatch.
+
+    Attributes:
+        path: String path of the history file.
+        year: int year of the schedules.
+        rows: int number of schedules of the file.
+        departments: list of department names by their code.
+        employee_ids: list of employee_id by their code.
+    """
+
+    def __init__(self, path):
+        """Open a history file and read its header.
+
+        Raises:
+            ValueError: If the file is not a history file of this version.
+        """
+
+        self.path = path
+        with open(path, 'rb') as history_file:
+            header = history_file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError("Not a history file: %s" % path)
+            magic, version, self.year, self.rows, length = (
+                HEADER.unpack(header))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("Not a history file of version %s: %s"
+                                 % (VERSION, path))
+            dictionary = json.loads(zlib.decompress(
+                                        history_file.read(length)))
+            self.offset = history_file.tell()
+        self.departments = dictionary['departments']
+        self.employee_ids = dictionary['employee_ids']
+
+
+    def __iter__(self):
+        """Yield each batch of the file as a RecordBatch."""
+        last_id = 0
+        last_start = 0
+        year_start = datetime.datetime(self.year, 1, 1)
+        with open(self.path, 'rb') as history_file:
+            history_file.seek(self.offset)
+            while True:
+                header = history_file.read(BATCH_HEADER.size)
+                if not header:
+                    return
+                count, length = BATCH_HEADER.unpack(header)
+                data = zlib.decompress(history_file.read(length))
+                columns = []
+                offset = 0
+                for typecode in TYPECODES:
+                    size = array.array(typecode).itemsize * count
+                    columns.append(from_bytes(typecode,
+                                              data[offset:offset + size]))
+                    offset += size
+                (id_deltas, start_deltas, durations, dep_column,
+                 employee_column, flags) = columns
+                ids, starts = [], []
+                for id_delta, start_delta in izip(id_deltas, start_deltas):
+                    last_id += id_delta
+                    last_start += start_delta
+                    ids.append(last_id)
+                    starts.append(last_start)
+                departments = [self.departments[c] for c in dep_column]
+                employee_ids = [None if c == NO_EMPLOYEE
+                                else self.employee_ids[c]
+                                for c in employee_column]
+                yield RecordBatch(year_start, ids, starts, durations,
+                                  departments, employee_ids,
+                                  [bool(f & S_UNDETERMINED) for f in flags],
+                                  [bool(f & E_UNDETERMINED) for f in flags])
+
+
+
+def import_history(connection, path):
+    """Insert the schedules of a history file into a database.
+
+    Schedules with the primary key of one already in the database replace
+    it, so importing a file twice does not repeat its schedules.
+
+    Args:
+        connection: An sqlalchemy connection to the database to import to.
+        path: String path of the history file.
+    Returns:
+        The number of schedules imported.
+    """
+
+    count = 0
+    with connection.begin():
+        for batch in HistoryReader(path):
+            connection.execute(SCHEDULES.insert().prefix_with('OR REPLACE'),
+                               batch.get_rows())
+            count += len(batch)
+    return count
+
+
+def main():
+    """Export a closed year to a history file or import one to its archive."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('db_name', help="Database name without .db, e.g. 35")
+    subparsers = parser.add_subparsers(dest='command')
+    export_parser = subparsers.add_parser('export',
+                                          help="export the schedules of a "
+                                               "year")
+    export_parser.add_argument('year', type=int)
+    export_parser.add_argument('--output', default=None,
+                               help="path of the history file to write")
+    import_parser = subparsers.add_parser('import',
+                                          help="import a history file to "
+                                               "the archive of its year")
+    import_parser.add_argument('path', help="path of the history file")
+    args = parser.parse_args()
+
+    session = start_db(args.db_name)
+    db_path = session.bind.url.database
+    if args.command == 'export':
+        path = args.output or get_history_path(db_path, args.year)
+        count = export_history(session, args.year, path)
+        print("%s schedules exported to %s, %s bytes."
+              % (count, path, os.path.getsize(path)))
+    else:
+        archive_path = get_archive_path(db_path,
+                                        HistoryReader(args.path).year)
+        if not os.path.exists(archive_path):
+            create_archive(archive_path)
+        engine = create_engine('sqlite:///' + archive_path)
+        connection = engine.connect()
+        try:
+            count = import_history(connection, args.path)
+        finally:
+            connection.close()
+        print("%s schedules imported to %s." % (count, archive_path))
+
+
+if __name__ == '__main__':
+    main()
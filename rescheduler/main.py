@@ -9,10 +9,10 @@ SQLAlchemy 1.0.12
 
 import Tkinter as tk
 import calendar_page
-from orm_models import start_db
+from orm_models import create_session_factory
 
 
-session = start_db('35')
+session_factory = create_session_factory('35')
 
 # Instantiate the Tkinter program
 sizex = 1420
@@ -23,6 +23,7 @@ posy  = 100
 root = tk.Tk()
 root.title("Retail Scheduler")
 root.wm_geometry("%dx%d+%d+%d" % (sizex, sizey, posx, posy))
-gui = calendar_page.ReScheduler(root, session)
+gui = calendar_page.ReScheduler(root, session_factory)
 
-root.mainloop()
\ No newline at end of file
+root.mainloop()
+gui.close()
\ No newline at end of file
@@ -0,0 +1,388 @@
+"""
+Module for upgrading the schema of existing databases
+
+create_all only creates tables that do not exist, so changes to tables that
+do, such as new columns, keys or indexes, are made by migrations. The
+schema version of a database is kept in its user_version PRAGMA and each
+migration upgrades a database to the next version. Migrations are applied
+in order when a session factory is created, and can be run headless ahead
+of time, e.g. before the store opens, so that starting the program does
+not wait on them:
+
+    python migrations.py 35 --list
+    python migrations.py 35
+
+Rows are copied or backfilled in batches of ids, each in a transaction of
+its own, so the write lock is held for a batch at a time rather than for
+the whole table and readers of the WAL database are never blocked. Indexes
+are built after their table is filled, one statement each. A migration
+that is interrupted is resumed from its last batch the next time it runs.
+Migrations should be run while no other program writes to the database,
+as the program itself does when it starts.
+"""
+
+import argparse
+import collections
+import glob
+import os
+from sqlalchemy import (create_engine, inspect, text, select, MetaData, 
+                        Table, Column, Integer, String)
+from sqlalchemy.schema import CreateTable
+from orm_models import (Base, Schedule, Vacation, UnavailableTime,
+                        EmployeeMonthHours, EmployeeWeekHours,
+                        DepartmentMonthCost, SCHEMA_VERSION, DEFAULT_PROFILE,
+                        MINUTES_SQL, WEEK_START_SQL, WAGE_SQL, create_indexes,
+                        create_aggregate_triggers, drop_aggregate_triggers,
+                        create_db_engine,
+                        get_schema_version, set_schema_version)
+from unit_of_work import enable_savepoints
+
+BATCH_SIZE = 20000
+# The last id done of each batched statement of a migration in progress
+PROGRESS = Table('migration_progress', MetaData(),
+                 Column('name', String, primary_key=True),
+                 Column('last_id', Integer))
+
+
+class Migration(collections.namedtuple('Migration',
+                                       ['version', 'description',
+                                        'upgrade'])):
+    """A change of the schema from the version before to version.
+
+    Attributes:
+        version: int schema version of a database once migrated.
+        description: String description of the change.
+        upgrade: function of an engine, a batch size and a progress
+            function that migrates the database. It records the new
+            version in the transaction of its last change, and may be run
+            again after being interrupted.
+    """
+
+    __slots__ = ()
+
+
+def run_in_batches(engine, source, statement, start=0,
+                   batch_size=BATCH_SIZE, progress=None, name=None):
+    """Execute a statement over ranges of the ids of a table.
+
+    Each range is executed in a transaction of its own.
+
+    Args:
+        engine: An sqlalchemy engine using sqlite3 beginning transactions
+            with BEGIN, see unit_of_work.enable_savepoints.
+        source: String name of the table whose ids are ranged over.
+        statement: String SQL statement using :first and :last, the first
+            and last id of a range, or a list of them executed in order.
+        start: int id after which to start.
+        batch_size: int number of ids of each range.
+        progress: function called with a String message after each range,
+            or None.
+        name: String name to record the last id done under with each 
+            range, so that the statement is resumed after it when run 
+            again, or None. See clear_progress.
+    """
+
+    if isinstance(statement, basestring):
+        statement = [statement]
+    if name:
+        start = get_progress(engine, name) or start
+    last_id = engine.scalar("SELECT MAX(id) FROM %s" % source) or 0
+    for first in xrange(start + 1, last_id + 1, batch_size):
+        last = min(first + batch_size - 1, last_id)
+        with engine.begin() as connection:
+            for s in statement:
+                connection.execute(text(s), first=first, last=last)
+            if name:
+                connection.execute(PROGRESS.insert().prefix_with('OR REPLACE'),
+                                   name=name, last_id=last)
+        if progress:
+            progress("%s: %s of %s" % (source, last, last_id))
+
+
+def get_progress(engine, name):
+    """Return the last id done of a batched statement, None if not begun."""
+    PROGRESS.create(engine, checkfirst=True)
+    return engine.scalar(select([PROGRESS.c.last_id])
+                         .where(PROGRESS.c.name == name))
+
+
+def clear_progress(connection, name):
+    """Forget the last id done of a batched statement of run_in_batches."""
+    if PROGRESS.exists(connection):
+        connection.execute(PROGRESS.delete().where(PROGRESS.c.name == name))
+
+
+def migrate_employee_keys(engine, batch_size=BATCH_SIZE, progress=None):
+    """Key the rows of employees on Employee.id instead of employee_id.
+
+    Databases of schema version 0 refer to employees by employee_id. Each
+    table referring to employees is renamed and created again with the new
+    foreign key, then its rows are copied back in batches with the primary
+    key of the employee of their employee_id. A row of an employee_id no
+    employee has is left without an employee, and of an employee_id several
+    employees have is given the first of them. Archives of the database are
+    migrated first, see migrate_archive_keys.
+    """
+
+    migrate_archive_keys(engine)
+    tables = [Schedule.__table__, Vacation.__table__,
+              UnavailableTime.__table__]
+    existing = inspect(engine).get_table_names()
+    for table in tables:
+        old_name = table.name + '_old'
+        # Tables not created yet are created by create_all, and a renamed
+        # table is left by a migration that was interrupted while copying
+        if table.name not in existing or old_name in existing:
+            continue
+        with engine.begin() as connection:
+            drop_aggregate_triggers(connection)
+            for index in inspect(connection).get_indexes(table.name):
+                connection.execute("DROP INDEX %s" % index['name'])
+            connection.execute("ALTER TABLE %s RENAME TO %s"
+                               % (table.name, old_name))
+            connection.execute(CreateTable(table))
+    existing = inspect(engine).get_table_names()
+    for table in tables:
+        old_name = table.name + '_old'
+        if old_name not in existing:
+            continue
+        names = ", ".join(table.c.keys())
+        values = names.replace('employee_id',
+                               "(SELECT MIN(id) FROM Employee "
+                               "WHERE Employee.employee_id = "
+                               "%s.employee_id)" % old_name)
+        copied = engine.scalar("SELECT MAX(id) FROM %s" % table.name) or 0
+        run_in_batches(engine, old_name,
+                       "INSERT INTO %s (%s) SELECT %s FROM %s "
+                       "WHERE id BETWEEN :first AND :last"
+                       % (table.name, names, values, old_name),
+                       copied, batch_size, progress)
+    with engine.begin() as connection:
+        for table in tables:
+            if table.name + '_old' in existing:
+                connection.execute("DROP TABLE %s_old" % table.name)
+        set_schema_version(connection, 1)
+
+
+def migrate_archive_keys(engine):
+    """Key the schedules of archives of a database on Employee.id.
+
+    Archives of schema version 0 are updated in place with the primary keys
+    of the live database's employees, as they have no employees of their
+    own. Each archive is updated in a transaction of its own.
+    """
+
+    db_path = engine.url.database
+    pattern = os.path.splitext(db_path)[0] + '_archive_*.db'
+    for path in glob.glob(pattern):
+        archive_engine = create_engine('sqlite:///' + path)
+        enable_savepoints(archive_engine)
+        connection = archive_engine.connect()
+        try:
+            if get_schema_version(connection) >= 1:
+                continue
+            connection.execute("ATTACH DATABASE ? AS live", (db_path,))
+            with connection.begin():
+                connection.execute("UPDATE schedules SET employee_id = "
+                                   "(SELECT MIN(id) FROM live.Employee "
+                                   "WHERE live.Employee.employee_id = "
+                                   "schedules.employee_id)")
+                set_schema_version(connection, 1)
+        finally:
+            connection.close()
+            archive_engine.dispose()
+
+
+def create_aggregates(engine, batch_size=BATCH_SIZE, progress=None):
+    """Create the aggregate tables of hours and costs and their triggers.
+
+    The aggregates of the schedules already in the database are added in 
+    batches of employees who have about batch_size schedules, then the
+    triggers keeping the aggregates up to date are created along with the
+    new version. See orm_models.create_aggregate_triggers.
+    """
+
+    models = [EmployeeMonthHours, EmployeeWeekHours, DepartmentMonthCost]
+    begun = get_progress(engine, 'aggregates') is not None
+    with engine.begin() as connection:
+        drop_aggregate_triggers(connection)
+        for model in models:
+            model.__table__.create(connection, checkfirst=True)
+            # Aggregates not added by the batches are added by the triggers
+            if not begun:
+                connection.execute(model.__table__.delete())
+    schedules = engine.scalar("SELECT COUNT(*) FROM schedules "
+                              "WHERE employee_id IS NOT NULL")
+    employees = engine.scalar("SELECT MAX(id) FROM Employee") or 0
+    employee_batch = max(1, batch_size * employees / max(schedules, 1))
+    values = {'minutes': MINUTES_SQL.format(row='schedules'),
+              'week_start': WEEK_START_SQL.format(row='schedules'),
+              'wage': WAGE_SQL.format(row='schedules'),
+              'batch': "schedules.employee_id BETWEEN :first AND :last"}
+    costs = ("FROM schedules JOIN department_month_costs AS costs "
+             "ON costs.calendar_date = schedules.calendar_date "
+             "AND costs.department = schedules.department")
+    statements = [
+        "INSERT INTO employee_month_hours "
+        "(calendar_date, employee_id, minutes) "
+        "SELECT calendar_date, employee_id, SUM({minutes}) "
+        "FROM schedules WHERE {batch} GROUP BY calendar_date, employee_id",
+        "INSERT INTO employee_week_hours (week_start, employee_id, minutes) "
+        "SELECT {week_start}, employee_id, SUM({minutes}) "
+        "FROM schedules WHERE {batch} GROUP BY 1, employee_id",
+        "INSERT OR IGNORE INTO department_month_costs "
+        "(calendar_date, department, cost) "
+        "SELECT DISTINCT calendar_date, department, 0 "
+        "FROM schedules WHERE {batch}",
+        "UPDATE department_month_costs SET cost = cost + "
+        "(SELECT SUM(({minutes} / 60) * {wage}) FROM schedules "
+        "WHERE {batch} "
+        "AND schedules.calendar_date = department_month_costs.calendar_date "
+        "AND schedules.department = department_month_costs.department) "
+        "WHERE rowid IN (SELECT costs.rowid " + costs + " WHERE {batch})"]
+    run_in_batches(engine, 'Employee', 
+                   [s.format(**values) for s in statements],
+                   batch_size=employee_batch, progress=progress, 
+                   name='aggregates')
+    with engine.begin() as connection:
+        create_aggregate_triggers(connection)
+        clear_progress(connection, 'aggregates')
+        set_schema_version(connection, 2)
+
+
+def remove_duplicate_overrides(engine, batch_size=BATCH_SIZE, progress=None):
+    """Keep only the last override of a shift template on each date.
+
+    Skipping a date again used to add another override of it. The unique 
+    index of the template and date is created by upgrade_database once the
+    duplicates are gone.
+    """
+
+    with engine.begin() as connection:
+        if 'shift_overrides' in inspect(connection).get_table_names():
+            connection.execute("DELETE FROM shift_overrides WHERE id NOT IN "
+                               "(SELECT MAX(id) FROM shift_overrides "
+                               "GROUP BY template_id, date)")
+        set_schema_version(connection, 3)
+
+
+def rebuild_schedules(engine, batch_size=BATCH_SIZE, progress=None):
+    """Create the schedules table again with AUTOINCREMENT keys.
+
+    Without AUTOINCREMENT sqlite gives a new row the greatest key plus one,
+    so a new schedule could be given the key of an archived schedule. The
+    table is renamed and created again, then its rows are copied back in
+    batches. The aggregate triggers are dropped while copying, as the
+    aggregates of the rows do not change.
+    """
+
+    existing = inspect(engine).get_table_names()
+    old_name = 'schedules_old'
+    # A renamed table is left by a migration that was interrupted while
+    # copying, and create_all creates the table if it does not exist yet
+    if 'schedules' in existing and old_name not in existing:
+        sql = engine.scalar("SELECT sql FROM sqlite_master "
+                            "WHERE type = 'table' AND name = 'schedules'")
+        if 'AUTOINCREMENT' not in sql.upper():
+            with engine.begin() as connection:
+                drop_aggregate_triggers(connection)
+                for index in inspect(connection).get_indexes('schedules'):
+                    connection.execute("DROP INDEX %s" % index['name'])
+                connection.execute("ALTER TABLE schedules RENAME TO %s"
+                                   % old_name)
+                connection.execute(CreateTable(Schedule.__table__))
+            existing.append(old_name)
+    if old_name in existing:
+        names = ", ".join(Schedule.__table__.c.keys())
+        copied = engine.scalar("SELECT MAX(id) FROM schedules") or 0
+        run_in_batches(engine, old_name,
+                       "INSERT INTO schedules (%s) SELECT %s FROM %s "
+                       "WHERE id BETWEEN :first AND :last"
+                       % (names, names, old_name),
+                       copied, batch_size, progress)
+    with engine.begin() as connection:
+        if old_name in existing:
+            connection.execute("DROP TABLE %s" % old_name)
+        set_schema_version(connection, 4)
+
+
+MIGRATIONS = [Migration(1, "Key schedules, vacations and unavailability on "
+                           "Employee.id", migrate_employee_keys),
+              Migration(2, "Add aggregate tables of hours and costs kept by "
+                           "triggers", create_aggregates),
+              Migration(3, "Allow one override of a shift template per date",
+                        remove_duplicate_overrides),
+              Migration(4, "Never reuse the keys of schedules",
+                        rebuild_schedules)]
+
+
+def get_pending_migrations(engine):
+    """Return list of the Migration not yet applied to a database."""
+    version = engine.scalar("PRAGMA user_version")
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def upgrade_database(engine, batch_size=BATCH_SIZE, progress=None):
+    """Bring the schema of a database up to SCHEMA_VERSION.
+
+    A database without tables is created at SCHEMA_VERSION, any other has
+    its pending migrations applied in order. Then tables, indexes and 
+    triggers missing from the database are created.
+
+    Args:
+        engine: An sqlalchemy engine using sqlite3 beginning transactions
+            with BEGIN, see unit_of_work.enable_savepoints.
+        batch_size: int number of ids of each batch of rows copied.
+        progress: function called with a String message before each
+            migration and after each batch of rows, or None.
+    Returns:
+        The list of Migration applied.
+    """
+
+    if not inspect(engine).get_table_names():
+        with engine.begin() as connection:
+            set_schema_version(connection, SCHEMA_VERSION)
+        pending = []
+    else:
+        pending = get_pending_migrations(engine)
+    for migration in pending:
+        if progress:
+            progress("Migrating to %s: %s" % (migration.version,
+                                              migration.description))
+        migration.upgrade(engine, batch_size, progress)
+    Base.metadata.create_all(engine)
+    create_indexes(engine)
+    with engine.begin() as connection:
+        create_aggregate_triggers(connection)
+    return pending
+
+
+def main():
+    """Apply the pending schema migrations of a database."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('db_name', help="Database name without .db, e.g. 35")
+    parser.add_argument('--list', action='store_true',
+                        help="only list the pending migrations")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="number of rows copied in each transaction")
+    args = parser.parse_args()
+
+    engine = create_db_engine(args.db_name, profile=DEFAULT_PROFILE)
+    enable_savepoints(engine)
+    print("Schema version %s, latest %s."
+          % (engine.scalar("PRAGMA user_version"), SCHEMA_VERSION))
+    if args.list:
+        for migration in get_pending_migrations(engine):
+            print("%s: %s" % (migration.version, migration.description))
+        return
+    applied = upgrade_database(engine, args.batch_size, log)
+    print("%s migrations applied." % len(applied))
+
+
+def log(message):
+    """Print a progress message of the migrations."""
+    print(message)
+
+
+if __name__ == '__main__':
+    main()
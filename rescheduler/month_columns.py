@@ -0,0 +1,366 @@
+"""
+Module for a column-oriented store of the schedules around a month
+
+The calendar's analytics each read one or two fields of every schedule of
+the month: costs read the department, day and cost, eligibility reads the
+times and employee. Keeping each field in a typed array of its own keeps
+these values contiguous, a few bytes each instead of an object per
+schedule, and a pass over the month compares plain ints. Department names
+and employee_ids are encoded as small ints for the same reason.
+"""
+
+import array
+import collections
+import datetime
+from itertools import izip
+from orm_models import schedule_cost
+from schedule_metrics import MINUTES_PER_DAY
+
+UNASSIGNED = -1
+
+
+class MonthColumns(object):
+    """Schedules of a month as parallel typed arrays, one row per schedule.
+
+    A schedule is appended to the end of every array, and deleted by moving
+    the last row into its place, so neither rebuilds the arrays. The order
+    of rows is therefore not meaningful.
+
+    Attributes:
+        date: datetime.date of the first day of the month.
+        start_datetime: datetime.datetime of midnight of the first day.
+        ids: array of the primary key of each schedule.
+        in_month: array of 1 if the schedule is on the calendar of the month,
+            0 if it is on a day just before or after it.
+        starts: array of start times in minutes from the start of the month,
+            negative for the day before the month.
+        ends: array of end times in minutes from the start of the month.
+        dep_codes: array of indexes into departments.
+        employee_indexes: array of indexes into employee_ids, UNASSIGNED if
+            the schedule has no employee.
+        costs: array of the cost of each schedule.
+        departments: list of department names in order of their codes.
+        dep_codes_of: dict of department names to their codes.
+        employee_ids: list of employee_id in order of their indexes.
+        employee_indexes_of: dict of employee_id to their indexes.
+        rows: dict of schedule primary keys to their row in the arrays.
+    """
+
+    def __init__(self, date):
+        """Initialize empty columns of the month of date.
+
+        Args:
+            date: datetime.date object of the month and year.
+        """
+
+        self.date = datetime.date(date.year, date.month, 1)
+        self.start_datetime = datetime.datetime.combine(self.date,
+                                                        datetime.time())
+        self.ids = array.array('l')
+        self.in_month = array.array('b')
+        self.starts = array.array('l')
+        self.ends = array.array('l')
+        self.dep_codes = array.array('h')
+        self.employee_indexes = array.array('l')
+        self.costs = array.array('d')
+        self.departments = []
+        self.dep_codes_of = {}
+        self.employee_ids = []
+        self.employee_indexes_of = {}
+        self.rows = {}
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def __contains__(self, id):
+        return id in self.rows
+
+
+    def get_columns(self):
+        """Return tuple of every array, in the same order for every row."""
+        return (self.ids, self.in_month, self.starts, self.ends,
+                self.dep_codes, self.employee_indexes, self.costs)
+
+
+    def set_columns(self, columns, departments, employee_ids):
+        """Replace every array, such as with arrays read from a file.
+
+        Args:
+            columns: tuple of arrays in the order of get_columns.
+            departments: list of department names in order of their codes.
+            employee_ids: list of employee_id in order of their indexes.
+        """
+
+        (self.ids, self.in_month, self.starts, self.ends, self.dep_codes,
+         self.employee_indexes, self.costs) = columns
+        self.departments = list(departments)
+        self.dep_codes_of = dict((d, i) for i, d in enumerate(departments))
+        self.employee_ids = list(employee_ids)
+        self.employee_indexes_of = dict((e, i) for i, e 
+                                        in enumerate(employee_ids))
+        self.rows = dict((id, row) for row, id in enumerate(self.ids))
+
+
+    def get_minutes(self, dt):
+        """Return minutes from the start of the month to a datetime."""
+        delta = dt - self.start_datetime
+        return delta.days * MINUTES_PER_DAY + delta.seconds // 60
+
+
+    def get_dep_code(self, department):
+        """Return the code of a department, adding it if it is new."""
+        if department not in self.dep_codes_of:
+            self.dep_codes_of[department] = len(self.departments)
+            self.departments.append(department)
+        return self.dep_codes_of[department]
+
+
+    def get_employee_index(self, employee_id):
+        """Return the index of an employee_id, UNASSIGNED for None."""
+        if employee_id == None:
+            return UNASSIGNED
+        if employee_id not in self.employee_indexes_of:
+            self.employee_indexes_of[employee_id] = len(self.employee_ids)
+            self.employee_ids.append(employee_id)
+        return self.employee_indexes_of[employee_id]
+
+
+    def append(self, schedule):
+        """Add a schedule, replacing the row of it if there is one.
+
+        Args:
+            schedule: ScheduleSnapshot of the schedule.
+        """
+
+        self.delete(schedule.id)
+        self.rows[schedule.id] = len(self.ids)
+        self.ids.append(schedule.id)
+        self.in_month.append(1 if schedule.calendar_date == self.date else 0)
+        self.starts.append(self.get_minutes(schedule.start_datetime))
+        self.ends.append(self.get_minutes(schedule.end_datetime))
+        self.dep_codes.append(self.get_dep_code(schedule.department))
+        self.employee_indexes.append(self.get_employee_index(
+                                         schedule.employee_id))
+        self.costs.append(schedule.cost())
+
+
+    def delete(self, id):
+        """Delete the row of a schedule by moving the last row into it.
+
+        Args:
+            id: Primary key of the schedule.
+        Returns:
+            True if the schedule had a row, else False.
+        """
+
+        row = self.rows.pop(id, None)
+        if row is None:
+            return False
+        last = len(self.ids) - 1
+        if row != last:
+            for column in self.get_columns():
+                column[row] = column[last]
+            self.rows[self.ids[row]] = row
+        for column in self.get_columns():
+            column.pop()
+        return True
+
+
+    def unassign_employee(self, employee_id):
+        """Unassign every schedule of an employee in one pass.
+
+        Args:
+            employee_id: Primary key of the employee.
+        Returns:
+            A list of the primary keys of the unassigned schedules.
+        """
+
+        index = self.employee_indexes_of.get(employee_id)
+        if index is None:
+            return []
+        ids = []
+        for row, i in enumerate(self.employee_indexes):
+            if i == index:
+                self.employee_indexes[row] = UNASSIGNED
+                self.costs[row] = 0
+                ids.append(self.ids[row])
+        return ids
+
+
+    def set_employee_wage(self, employee_id, wage):
+        """Price every schedule of an employee at a new wage in one pass.
+
+        Args:
+            employee_id: Primary key of the employee.
+            wage: Number new wage of the employee.
+        Returns:
+            A list of the primary keys of the schedules priced again.
+        """
+
+        index = self.employee_indexes_of.get(employee_id)
+        if index is None:
+            return []
+        ids = []
+        for row, i in enumerate(self.employee_indexes):
+            if i == index:
+                start = (self.start_datetime 
+                         + datetime.timedelta(minutes=self.starts[row]))
+                end = (self.start_datetime 
+                       + datetime.timedelta(minutes=self.ends[row]))
+                self.costs[row] = schedule_cost(start, end, wage)
+                ids.append(self.ids[row])
+        return ids
+
+
+    def delete_department(self, department):
+        """Delete every schedule of a department in one pass.
+
+        The arrays are rebuilt without the department's rows, in the order
+        of the rows kept.
+
+        Args:
+            department: String name of the department.
+        Returns:
+            A list of the primary keys of the deleted schedules.
+        """
+
+        code = self.dep_codes_of.get(department)
+        if code is None:
+            return []
+        keep = [row for row, c in enumerate(self.dep_codes) if c != code]
+        ids = [id for id, c in izip(self.ids, self.dep_codes) if c == code]
+        columns = [array.array(column.typecode, [column[row] for row in keep])
+                   for column in self.get_columns()]
+        self.set_columns(columns, self.departments, self.employee_ids)
+        return ids
+
+
+    def get_department_costs(self):
+        """Return dict of department names to the cost of the month."""
+        totals = [0] * len(self.departments)
+        for in_month, code, cost in izip(self.in_month, self.dep_codes,
+                                         self.costs):
+            if in_month:
+                totals[code] += cost
+        return dict(zip(self.departments, totals))
+
+
+    def get_day_costs(self, department, days_in_month):
+        """Return list of the cost of each day of the month of a department.
+
+        Args:
+            department: String name of the department.
+            days_in_month: int number of days of the month.
+        Returns:
+            A list of the cost of each day, the 1st is at index 0.
+        """
+
+        day_costs = [0] * days_in_month
+        code = self.dep_codes_of.get(department)
+        for in_month, c, start, cost in izip(self.in_month, self.dep_codes,
+                                             self.starts, self.costs):
+            if in_month and c == code:
+                day_costs[start // MINUTES_PER_DAY] += cost
+        return day_costs
+
+
+    def get_department_rows(self, department):
+        """Return list of the times of every schedule of a department.
+
+        Args:
+            department: String name of the department.
+        Returns:
+            A list of (primary key, start datetime, end datetime, assigned
+            boolean) of each schedule.
+        """
+
+        code = self.dep_codes_of.get(department)
+        minutes = datetime.timedelta(minutes=1)
+        return [(id, self.start_datetime + start * minutes,
+                 self.start_datetime + end * minutes, i != UNASSIGNED)
+                for id, c, start, end, i
+                in izip(self.ids, self.dep_codes, self.starts, self.ends,
+                        self.employee_indexes)
+                if c == code]
+
+
+    def get_employee_minutes(self):
+        """Return dict of employee_id to minutes scheduled in the month."""
+        totals = [0] * len(self.employee_ids)
+        for in_month, start, end, i in izip(self.in_month, self.starts,
+                                            self.ends, self.employee_indexes):
+            if in_month and i != UNASSIGNED:
+                totals[i] += end - start
+        return dict((self.employee_ids[i], minutes) 
+                    for i, minutes in enumerate(totals) if minutes)
+
+
+    def get_day_intervals(self, department):
+        """Return the minutes each day of the month a department is staffed.
+
+        The same as schedule_metrics.get_day_intervals of the assigned
+        schedules of get_month_criteria, including those starting the day
+        before the month that go past midnight into the 1st.
+
+        Args:
+            department: String name of the department.
+        Returns:
+            A dict of datetime.date as keys and a list of (start minute, end
+            minute) of that day as values.
+        """
+
+        day_intervals = collections.defaultdict(list)
+        code = self.dep_codes_of.get(department)
+        for c, start, end, i in izip(self.dep_codes, self.starts, self.ends,
+                                     self.employee_indexes):
+            if c != code or i == UNASSIGNED:
+                continue
+            while start < end:
+                day_index = start // MINUTES_PER_DAY
+                day_start = day_index * MINUTES_PER_DAY
+                day_end = min(end, day_start + MINUTES_PER_DAY)
+                date = self.date + datetime.timedelta(days=day_index)
+                day_intervals[date].append((start - day_start,
+                                            day_end - day_start))
+                start = day_end
+        return day_intervals
+
+
+    def get_day_ids(self, department, day_index):
+        """Return primary keys of a day's schedules sorted by start time.
+
+        Args:
+            department: String name of the department.
+            day_index: int index of the day in the month, the 1st is 0.
+        """
+
+        code = self.dep_codes_of.get(department)
+        day_start = day_index * MINUTES_PER_DAY
+        day_end = day_start + MINUTES_PER_DAY
+        day_rows = [(start, id) for id, in_month, c, start
+                    in izip(self.ids, self.in_month, self.dep_codes,
+                            self.starts)
+                    if in_month and c == code and day_start <= start < day_end]
+        day_rows.sort()
+        return [id for start, id in day_rows]
+
+
+    def get_busy_employees(self, start, end, exclude_id=None):
+        """Return set of employee_id of employees working during a time.
+
+        Args:
+            start: datetime.datetime of the start of the time.
+            end: datetime.datetime of the end of the time.
+            exclude_id: Primary key of a schedule not to count, such as the
+                schedule the time is of.
+        """
+
+        start, end = self.get_minutes(start), self.get_minutes(end)
+        busy = set()
+        for id, s, e, i in izip(self.ids, self.starts, self.ends,
+                                self.employee_indexes):
+            if i != UNASSIGNED and s < end and start < e and id != exclude_id:
+                busy.add(i)
+        return set(self.employee_ids[i] for i in busy)
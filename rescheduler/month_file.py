@@ -0,0 +1,438 @@
+"""
+Module for saving the calendar's month to a file to reopen it from
+
+When the program closes, the month the calendar displays is saved to a
+file next to the database: the columns of the schedules around the month,
+the display string and eligibility tiers of each schedule of the
+calendar's department, the minutes each employee works in the weeks of the
+month, and the read models these were worked out from. When the database
+has not changed since, the read models are put in the read model cache at
+startup, and if the same month and department are opened the file is
+memory-mapped and the month is built from it without querying the database.
+
+Whether the database has changed is told by its change stamp: sqlite's
+file change counter from the header of the database file, with the size
+and modification time of the database and of its write-ahead log. These
+are read without opening a connection to the database.
+
+The columns are saved as raw arrays and everything else as JSON of plain
+lists and numbers, so reading a damaged file can only fail to parse, and
+is then deleted like a stale file.
+"""
+
+import array
+import datetime
+import json
+import mmap
+import os
+import struct
+from month_columns import UNASSIGNED
+from snapshots import (MonthSnapshot, ScheduleSnapshot, EmployeeSnapshot,
+                       DirectoryEntry, VacationSnapshot)
+
+MAGIC = 'RSMF'
+VERSION = 4
+# Typecodes of the arrays of MonthColumns.get_columns, then the wage and
+# the undetermined time flags of each schedule
+TYPECODES = 'lbllhld' + 'db'
+LAYOUT = ''.join(chr(array.array(t).itemsize) for t in TYPECODES)
+# Magic, version, ordinal of the month, layout, change stamp, length of the
+# department name and number of rows
+HEADER = struct.Struct('<4sHI%ssIqdqdHI' % len(TYPECODES))
+S_UNDETERMINED = 1
+E_UNDETERMINED = 2
+# Read models saved with the month, so that they are not read from the
+# database while the file is current
+READ_MODELS = ('departments', 'monthly_sales', 'employees', 'vacations',
+               'employee_directory', 'staffing_requirements')
+# Errors reading a file that is damaged or of another version can raise
+READ_ERRORS = (EnvironmentError, ValueError, TypeError, KeyError,
+               IndexError, AttributeError, struct.error)
+
+
+def get_db_path(session):
+    """Return path of the database file of a session."""
+    return session.bind.url.database
+
+
+def get_month_file_path(db_path):
+    """Return path of the month file of a database, e.g. 35.month."""
+    return os.path.splitext(db_path)[0] + '.month'
+
+
+def get_change_stamp(db_path):
+    """Return a tuple that changes whenever the database is changed.
+
+    In rollback journal mode sqlite increments the file change counter of
+    the database on every commit, but in WAL mode commits are written to
+    the write-ahead log and only reach the database file when checkpointed,
+    so the log's size and modification time are part of the stamp too. An
+    empty log is the same as no log.
+
+    Args:
+        db_path: String path of the database file.
+    Returns:
+        A tuple of (change counter, database size, database modification
+        time, log size, log modification time), None if there is no
+        database yet.
+    """
+
+    try:
+        db_stat = os.stat(db_path)
+        with open(db_path, 'rb') as db_file:
+            header = db_file.read(100)
+    except EnvironmentError:
+        return None
+    if len(header) < 100:
+        return None
+    counter, = struct.unpack('>I', header[24:28])
+    wal_size, wal_mtime = 0, 0.0
+    try:
+        wal_stat = os.stat(db_path + '-wal')
+        if wal_stat.st_size:
+            wal_size, wal_mtime = wal_stat.st_size, wal_stat.st_mtime
+    except EnvironmentError:
+        pass
+    return (counter, db_stat.st_size, db_stat.st_mtime, wal_size, wal_mtime)
+
+
+def encode_datetime(dt):
+    """Return list of the fields of a datetime.datetime."""
+    return list(dt.timetuple()[:6]) + [dt.microsecond]
+
+
+def encode_read_models(read_cache):
+    """Return dict of the read models of READ_MODELS as JSON values."""
+    vacations = [[v.id, v.employee_id, encode_datetime(v.start_datetime),
+                  encode_datetime(v.end_datetime)]
+                 for employee_vacations
+                 in read_cache.get('vacations').itervalues()
+                 for v in employee_vacations]
+    return {'departments': read_cache.get('departments'),
+            'monthly_sales': [[date.toordinal(), total] for date, total
+                              in read_cache.get('monthly_sales')],
+            'employees': [e.values()
+                          for e in read_cache.get('employees').itervalues()],
+            'vacations': vacations,
+            'employee_directory': [e.values() for e in read_cache.get(
+                                       'employee_directory').itervalues()],
+            'staffing_requirements': read_cache.get('staffing_requirements')}
+
+
+def decode_read_models(sections):
+    """Return dict of read model names to their read models.
+
+    Args:
+        sections: dict of the JSON values returned by encode_read_models.
+    """
+
+    employees = {}
+    for values in sections['employees']:
+        values = values[:-1] + [tuple(values[-1])]
+        employees[values[0]] = EmployeeSnapshot(*values)
+    vacations = {}
+    for id, employee_id, start, end in sections['vacations']:
+        vacation = VacationSnapshot(id, employee_id,
+                                    datetime.datetime(*start),
+                                    datetime.datetime(*end))
+        vacations.setdefault(employee_id, []).append(vacation)
+    requirements = sections['staffing_requirements']
+    return {'departments': list(sections['departments']),
+            'monthly_sales': [(datetime.date.fromordinal(ordinal), total)
+                              for ordinal, total
+                              in sections['monthly_sales']],
+            'employees': employees,
+            'vacations': vacations,
+            'employee_directory': dict((values[0], DirectoryEntry(*values))
+                                       for values
+                                       in sections['employee_directory']),
+            'staffing_requirements': dict((dep, [tuple(r) for r
+                                                 in requirements[dep]])
+                                          for dep in requirements)}
+
+
+def save_month_file(snapshot):
+    """Save a month to the month file of its database.
+
+    The snapshot's session is closed and the engine disposed first, which
+    closes its connections and so checkpoints the write-ahead log, so that
+    the change stamp saved is the one the database has when next opened.
+    This is meant to be called when the program closes.
+
+    Args:
+        snapshot: MonthSnapshot of the month, with every write made to the
+            database also made to it.
+    Returns:
+        True if the month was saved.
+    """
+
+    views = [[id, view[0], view[1].items()]
+             for id, view in snapshot.get_views().iteritems()]
+    week_minutes = [[week_start.toordinal(), minutes.items()]
+                    for week_start, minutes
+                    in snapshot.week_minutes.iteritems()]
+    columns = snapshot.columns
+    wages = array.array('d')
+    undetermined = array.array('b')
+    for id in columns.ids:
+        s = snapshot.schedules.get(id)
+        if s is None or s.wage == None:
+            wages.append(float('nan'))
+        else:
+            wages.append(s.wage)
+        flags = 0
+        if s is not None and s.s_undetermined_time:
+            flags |= S_UNDETERMINED
+        if s is not None and s.e_undetermined_time:
+            flags |= E_UNDETERMINED
+        undetermined.append(flags)
+    blob = json.dumps({'departments': columns.departments,
+                       'employee_ids': columns.employee_ids,
+                       'views': views,
+                       'week_minutes': week_minutes,
+                       'read_models': encode_read_models(snapshot.read_cache)})
+
+    db_path = get_db_path(snapshot.session)
+    snapshot.session.close()
+    snapshot.session.bind.dispose()
+    stamp = get_change_stamp(db_path)
+    if stamp is None:
+        return False
+    dep = snapshot.dep.encode('utf-8')
+    header = HEADER.pack(MAGIC, VERSION, snapshot.date.toordinal(), LAYOUT,
+                         *(stamp + (len(dep), len(columns))))
+    path = get_month_file_path(db_path)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as month_file:
+        month_file.write(header)
+        month_file.write(dep)
+        for column in columns.get_columns() + (wages, undetermined):
+            column.tofile(month_file)
+        month_file.write(blob)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temp_path, path)
+    return True
+
+
+def read_header(data):
+    """Return dict of the header of a month file.
+
+    Raises:
+        ValueError: If the file is not a month file of this version written
+            on a platform with the same sizes of arrays.
+    """
+
+    values = HEADER.unpack_from(data)
+    magic, version, ordinal, layout = values[:4]
+    if magic != MAGIC or version != VERSION or layout != LAYOUT:
+        raise ValueError("Not a month file of this version")
+    dep_length, rows = values[-2:]
+    dep = data[HEADER.size:HEADER.size + dep_length].decode('utf-8')
+    offset = HEADER.size + dep_length
+    arrays_size = sum(array.array(t).itemsize for t in TYPECODES) * rows
+    return {'date': datetime.date.fromordinal(ordinal),
+            'stamp': values[4:-2],
+            'dep': dep,
+            'rows': rows,
+            'offset': offset,
+            'json_offset': offset + arrays_size}
+
+
+def read_sections(data, header):
+    """Return dict of the JSON sections of the data of a month file."""
+    sections = json.loads(data[header['json_offset']:])
+    if not isinstance(sections, dict):
+        raise ValueError("Not a month file of this version")
+    return sections
+
+
+def read_snapshot(data, header, session, read_cache):
+    """Build a MonthSnapshot from the data of a month file.
+
+    The read models saved with the month are put in the read model cache,
+    and the display strings and eligibility tiers are kept as the saved
+    views of the snapshot.
+
+    Args:
+        data: The mmap of the month file.
+        header: dict returned by read_header for the data.
+        session: An sqlalchemy session object using sqlite3.
+        read_cache: ReadModelCache of the read models of READ_MODELS.
+    """
+
+    offset = header['offset']
+    arrays = []
+    for typecode in TYPECODES:
+        column = array.array(typecode)
+        size = column.itemsize * header['rows']
+        column.fromstring(data[offset:offset + size])
+        offset += size
+        arrays.append(column)
+    sections = read_sections(data, header)
+    read_models = decode_read_models(sections['read_models'])
+    views = dict((id, (schedule_str, dict(flags)))
+                 for id, schedule_str, flags in sections['views'])
+    week_minutes = dict((datetime.date.fromordinal(ordinal), dict(minutes))
+                        for ordinal, minutes in sections['week_minutes'])
+    for name in READ_MODELS:
+        read_cache.set(name, read_models[name])
+
+    snapshot = MonthSnapshot(session, read_cache, header['date'],
+                             header['dep'], load=False)
+    columns = snapshot.columns
+    columns.set_columns(arrays[:-2], sections['departments'],
+                        sections['employee_ids'])
+    wages, undetermined = arrays[-2:]
+    code = columns.dep_codes_of.get(snapshot.dep)
+    for row, id in enumerate(columns.ids):
+        if not columns.in_month[row] or columns.dep_codes[row] != code:
+            continue
+        start = (columns.start_datetime
+                 + datetime.timedelta(minutes=columns.starts[row]))
+        end = (columns.start_datetime
+               + datetime.timedelta(minutes=columns.ends[row]))
+        index = columns.employee_indexes[row]
+        employee_id = None
+        if index != UNASSIGNED:
+            employee_id = columns.employee_ids[index]
+        wage = wages[row]
+        # Only NaN is not equal to itself
+        if wage != wage:
+            wage = None
+        snapshot.schedules[id] = ScheduleSnapshot(
+                                     id, snapshot.date, start.date(), start,
+                                     end, start.time(), end.time(),
+                                     snapshot.dep,
+                                     bool(undetermined[row] & S_UNDETERMINED),
+                                     bool(undetermined[row] & E_UNDETERMINED),
+                                     employee_id, wage)
+    snapshot.saved_views = views
+    snapshot.saved_employees = read_models['employees']
+    snapshot.week_minutes = week_minutes
+    return snapshot
+
+
+def open_data(path):
+    """Return a read-only mmap of a file."""
+    with open(path, 'rb') as month_file:
+        return mmap.mmap(month_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def is_month_file_current(db_path):
+    """Return True if the month file of a database has its change stamp.
+
+    Only the header of the month file is read, and the database is not
+    opened, so checking does not change the stamp.
+
+    Args:
+        db_path: String path of the database file.
+    """
+
+    try:
+        with open(get_month_file_path(db_path), 'rb') as month_file:
+            header = read_header(month_file.read(HEADER.size))
+    except READ_ERRORS:
+        return False
+    return header['stamp'] == get_change_stamp(db_path)
+
+
+def load_read_models(session, read_cache):
+    """Put the read models of the month file in the cache if it is current.
+
+    This is meant to be called at startup, before the pages first use the
+    read models, whatever month the calendar opens.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        read_cache: ReadModelCache to put the read models in.
+    Returns:
+        True if the read models were put in the cache.
+    """
+
+    db_path = get_db_path(session)
+    path = get_month_file_path(db_path)
+    if not os.path.exists(path):
+        return False
+    try:
+        data = open_data(path)
+        try:
+            header = read_header(data)
+            if header['stamp'] != get_change_stamp(db_path):
+                return False
+            read_models = decode_read_models(
+                              read_sections(data, header)['read_models'])
+        finally:
+            data.close()
+    except READ_ERRORS:
+        return False
+    for name in READ_MODELS:
+        read_cache.set(name, read_models[name])
+    return True
+
+
+def load_month_file(session, read_cache, date, department):
+    """Return the month saved in the month file if it is still current.
+
+    A month file saved with a different change stamp than the database has
+    now is stale and is deleted, as is a file that cannot be read.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        read_cache: ReadModelCache of the read models of READ_MODELS.
+        date: datetime.date object of the month and year.
+        department: String name of the department of the calendar.
+    Returns:
+        A MonthSnapshot, or None if there is no current file of the month
+        and department.
+    """
+
+    db_path = get_db_path(session)
+    path = get_month_file_path(db_path)
+    if not os.path.exists(path):
+        return None
+    date = datetime.date(date.year, date.month, 1)
+    stamp = get_change_stamp(db_path)
+    snapshot = None
+    try:
+        data = open_data(path)
+        try:
+            header = read_header(data)
+            stale = header['stamp'] != stamp
+            if (not stale and header['date'] == date
+                and header['dep'] == department):
+                snapshot = read_snapshot(data, header, session, read_cache)
+        finally:
+            data.close()
+    except READ_ERRORS:
+        stale = True
+    if stale:
+        os.remove(path)
+    return snapshot
+
+
+def remove_month_file(session, date):
+    """Delete the month file if it is of a month, or cannot be read.
+
+    This is for changes to a month other than the calendar's, such as
+    copying schedules into it, which the month file does not include.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        date: datetime.date object of the month and year.
+    """
+
+    path = get_month_file_path(get_db_path(session))
+    if not os.path.exists(path):
+        return
+    date = datetime.date(date.year, date.month, 1)
+    try:
+        data = open_data(path)
+        try:
+            remove = read_header(data)['date'] == date
+        finally:
+            data.close()
+    except READ_ERRORS:
+        remove = True
+    if remove:
+        os.remove(path)
@@ -4,13 +4,45 @@ Module for the database ORM representation
 
 import datetime
 import calendar
-from sqlalchemy import create_engine, ForeignKey
-from sqlalchemy import Column, Date, Integer, String, Time, DateTime, Boolean
+from sqlalchemy import create_engine, event, inspect, ForeignKey, Index
+from sqlalchemy import (Column, Date, Integer, String, Time, DateTime, Boolean,
+                        Float)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, backref
+from sqlalchemy.orm import (sessionmaker, relationship, backref, 
+                            object_session)
 
 Base = declarative_base()
 
+# Times are selected in 15 minute intervals, so a day has 96 time slots
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 / SLOT_MINUTES
+
+# Performance profiles of PRAGMAs set on every connection, a value of None
+# leaves sqlite's own default. In WAL mode readers and the writer do not
+# block each other and with synchronous NORMAL a commit only syncs at 
+# checkpoints. The database cannot be corrupted by a crash, but the last 
+# commits before a power loss may be rolled back.
+PERFORMANCE_PROFILES = {
+    'sqlite': {'journal_mode': None,
+               'synchronous': None,
+               'cache_size': None,
+               'mmap_size': None,
+               'temp_store': None},
+    'durable': {'journal_mode': 'WAL',
+                'synchronous': 'FULL',
+                'cache_size': -16000,
+                'mmap_size': 64 * 1024 * 1024,
+                'temp_store': 'MEMORY'},
+    'fast': {'journal_mode': 'WAL',
+             'synchronous': 'NORMAL',
+             # Negative cache size is in KiB, so 16MB
+             'cache_size': -16000,
+             'mmap_size': 64 * 1024 * 1024,
+             'temp_store': 'MEMORY'}}
+DEFAULT_PROFILE = 'fast'
+# Version of the schema, kept in the user_version PRAGMA of each database
+SCHEMA_VERSION = 4
+
 class Schedule(Base):
     """ORM representation of an employee schedule
     
@@ -25,6 +57,14 @@ class Schedule(Base):
     """
     
     __tablename__ = 'schedules'
+    # Range queries for an employee's schedules over a time period, and the
+    # schedules of a department in a month. Keys are never reused, so that
+    # a new schedule is not given the key of an archived one.
+    __table_args__ = (Index('ix_schedules_employee_start', 
+                            'employee_id', 'start_datetime'),
+                      Index('ix_schedules_calendar_department',
+                            'calendar_date', 'department'),
+                      {'sqlite_autoincrement': True})
         
     id = Column(Integer, primary_key=True)
     calendar_date = Column(Date)
@@ -37,9 +77,9 @@ class Schedule(Base):
     s_undetermined_time = Column(Boolean)
     e_undetermined_time = Column(Boolean)
     
-    employee_id = Column(Integer, ForeignKey('Employee.employee_id'), 
+    employee_id = Column(Integer, ForeignKey('Employee.id'), 
                          nullable = True)
-    employee = relationship('Employee')
+    employee = relationship('Employee', back_populates='schedules')
     
     def __init__(self, start_dt, end_dt, s_undetermined, e_undetermined, 
                  department):
@@ -65,9 +105,8 @@ class Schedule(Base):
         """Calculate the cost of this schedule given assigned employee."""
         if self.employee_id == None:
             return 0
-        timedelta = self.end_datetime - self.start_datetime
-        hours = timedelta.seconds / 3600
-        return hours * self.employee.wage
+        return schedule_cost(self.start_datetime, self.end_datetime, 
+                             self.employee.wage)
 
 
     
@@ -85,9 +124,10 @@ class Vacation(Base):
     start_datetime = Column(DateTime, default=datetime.datetime.utcnow)
     end_datetime = Column(DateTime, default=datetime.datetime.utcnow)
     
-    employee_id = Column(Integer, ForeignKey('Employee.employee_id'),
+    employee_id = Column(Integer, ForeignKey('Employee.id'),
                          nullable = True)
-    employee = relationship('Employee')
+    employee = relationship('Employee', 
+                            back_populates='unavailable_schedules')
     
     def __init__(self, start_datetime, end_datetime, employee_id):
         """Initialize a Vacation ORM object."""
@@ -122,9 +162,10 @@ class UnavailableTime(Base):
     end_time = Column(Time)
     weekday = Column(Integer)
     
-    employee_id = Column(Integer, ForeignKey('Employee.employee_id'),
+    employee_id = Column(Integer, ForeignKey('Employee.id'),
                          nullable = True)
-    employee = relationship('Employee')
+    employee = relationship('Employee', 
+                            back_populates='unav_time_schedules')
     
     def __init__(self, start_time, end_time, weekday, employee_id):
         """Initialize a repeating unavailability ORM object."""
@@ -148,12 +189,14 @@ class Employee(Base):
     An employee is primarily represented by their employee_id which must be
     a unique identifier. Then extra information such as their first and last
     names, wage, departments they can work, desired hours, overtime, medical
-    benefit cost per month, workmans comp and social security. Then there
-    are foreign keys for schedules, vacations, and repeating unavailability
-    an employee can be assigned to.
+    benefit cost per month, workmans comp and social security. Schedules, 
+    vacations and repeating unavailability refer to an employee by its 
+    primary key id rather than its employee_id, so the employee_id can be 
+    changed without losing them.
     """
 
     __tablename__ = 'Employee'
+    __table_args__ = (Index('ix_employee_employee_id', 'employee_id'),)
     
     id = Column(Integer, primary_key=True)
     first_name = Column(String)
@@ -164,15 +207,17 @@ class Employee(Base):
     alternate2_department = Column(String)
     wage = Column(Integer)
     desired_hours = Column(Integer)
+    # Not kept up to date, see EmployeeMonthHours
     scheduled_hours = Column(Integer)
     overtime = Column(Integer)
     medical = Column(Integer)
     workmans_comp = Column(Integer)
     social_security = Column(Integer)
     
-    schedules = relationship("Schedule")
-    unavailable_schedules = relationship("Vacation")
-    unav_time_schedules = relationship("UnavailableTime")
+    schedules = relationship("Schedule", back_populates='employee')
+    unavailable_schedules = relationship("Vacation", back_populates='employee')
+    unav_time_schedules = relationship("UnavailableTime", 
+                                       back_populates='employee')
     
     
     def __init__(self, employee_id, first_name, last_name, p_department, 
@@ -216,6 +261,7 @@ class Employee(Base):
     def add_unav_time(self, unav_time):
         """Add unrepeating unavailabile to to this employee."""
         self.unav_time_schedules.append(unav_time)
+        self.invalidate_unav_masks()
         
         
     def get_absent_schedules(self):
@@ -227,8 +273,32 @@ class Employee(Base):
         """Get all unrepeating unavailabile schedules of this employee."""
         return self.unav_time_schedules
         
+        
+    def get_unav_masks(self):
+        """Get slot bitmasks of repeating unavailability for each weekday.
+        
+        The repeating unavailabilities of this employee are compiled into 7
+        integers, one per weekday with Monday at index 0, where each set bit
+        is a 15 minute slot of that weekday the employee is unavailable. The
+        masks are kept on this employee object until invalidate_unav_masks
+        is called when a repeating unavailability is added or removed.
+        """
+        
+        masks = getattr(self, 'unav_masks', None)
+        if masks is None:
+            masks = [0] * 7
+            for u in self.unav_time_schedules:
+                masks[u.weekday] |= get_slot_mask(u.start_time, u.end_time)
+            self.unav_masks = masks
+        return masks
+        
+        
+    def invalidate_unav_masks(self):
+        """Discard compiled repeating unavailability masks of this employee."""
+        self.unav_masks = None
+        
     
-    def get_availability(self, schedule):
+    def get_availability(self, schedule, week_minutes=None):
         """Get availability of employee given schedule.
         
         There are 5 levels of availability of an employee given a schedule.
@@ -242,6 +312,13 @@ class Employee(Base):
         Note that in order to not have a schedule conflict (S) with an employee
         already assigned to that schedule we must remove the schedule from the 
         list of assigned schedules for this employee.
+        
+        Args:
+            schedule: The schedule to check the employee against.
+            week_minutes: dict of employee primary keys to minutes scheduled
+                in the week of the schedule, as core_reads.select_week_minutes
+                returns, to check many employees with one query. None to 
+                query the employee's minutes.
         """
         
         schedules = list(self.schedules)
@@ -253,19 +330,49 @@ class Employee(Base):
         for t in self.unavailable_schedules:
             if schedule.start_datetime < t.end_datetime and t.start_datetime < schedule.end_datetime:
                 return '(V)'
-        same_day_unav = [s for s in self.unav_time_schedules if (s.weekday 
-                                                                 == schedule.schedule_date.weekday())]
-        for s in same_day_unav:
-            if schedule.start_time < s.end_time and s.start_time < schedule.end_time:
+        unav_masks = self.get_unav_masks()
+        for weekday, slot_mask in get_day_slot_masks(schedule.start_datetime,
+                                                     schedule.end_datetime):
+            if unav_masks[weekday] & slot_mask:
                 return '(U)'
-        if self.calculate_weekly_hours(schedule) > self.overtime:
+        if self.calculate_weekly_hours(schedule, week_minutes) > self.overtime:
             return '(O)'
         return '(A)'
         
         
-    def calculate_weekly_hours(self, schedule):
-        """Calculate number of hours worked by employee for week of schedule."""
-        return 0
+    def calculate_weekly_hours(self, schedule, week_minutes=None):
+        """Calculate number of hours worked by employee for week of schedule.
+        
+        The hours include the schedule, as if it were assigned to this 
+        employee. Hours already scheduled are read from EmployeeWeekHours,
+        or from week_minutes if it is given.
+        
+        Args:
+            schedule: The schedule whose week to count.
+            week_minutes: dict of employee primary keys to minutes scheduled
+                in the week of the schedule, or None.
+        """
+        
+        minutes = get_schedule_minutes(schedule.start_datetime, 
+                                       schedule.end_datetime)
+        session = object_session(self)
+        scheduled = None
+        if week_minutes is not None:
+            scheduled = week_minutes.get(self.id, 0)
+        elif session is not None and self.id is not None:
+            week_start = get_week_start(schedule.schedule_date)
+            scheduled = (session.query(EmployeeWeekHours.minutes)
+                                .filter(EmployeeWeekHours.week_start 
+                                        == week_start,
+                                        EmployeeWeekHours.employee_id 
+                                        == self.id)
+                                .scalar()) or 0
+        if scheduled is not None:
+            if schedule.employee_id == self.id:
+                minutes = scheduled
+            else:
+                minutes += scheduled
+        return minutes / 60.0
     
     
         
@@ -291,6 +398,152 @@ class MonthSales(Base):
         return date_str + amt_str
         
         
+class StaffingRequirement(Base):
+    """ORM representation of a minimum staffing level for a department.
+    
+    A staffing requirement is represented as a department, an integer 
+    representing the day of the week, two datetime.time that represent the 
+    start and end times, and the number of employees the department needs
+    assigned to schedules during that time every week on that day.
+    """
+    
+    __tablename__ = 'staffing_requirements'
+    
+    id = Column(Integer, primary_key=True)
+    department = Column(String)
+    weekday = Column(Integer)
+    start_time = Column(Time)
+    end_time = Column(Time)
+    employees_needed = Column(Integer)
+    
+    def __init__(self, department, weekday, start_time, end_time, 
+                 employees_needed):
+        """Initialize a StaffingRequirement ORM object."""
+        self.department = department
+        self.weekday = weekday
+        self.start_time = start_time
+        self.end_time = end_time
+        self.employees_needed = employees_needed
+        
+        
+    def get_str(self):
+        """Returns a string formatted weekday, start - end time: needed."""
+        weekday_str = UnavailableTime.WEEKDAY_TO_STR[self.weekday]
+        start_str = self.start_time.strftime("%I:%M %p")
+        end_str = self.end_time.strftime("%I:%M %p")
+        return "%s %s %s - %s: %s" % (self.department, weekday_str,
+                                      start_str, end_str, 
+                                      self.employees_needed)
+        
+        
+class ShiftTemplate(Base):
+    """ORM representation of a shift that repeats every week.
+    
+    A shift template is represented as a department, an integer with a bit
+    set for each day of the week the shift is worked, Monday being the 
+    lowest bit, two datetime.time that represent the start and end times, 
+    booleans to hide the start and/or end times in the view and the first
+    date the shift is worked. Templates are expanded into schedules a month
+    at a time, see shift_templates.
+    """
+    
+    __tablename__ = 'shift_templates'
+    
+    id = Column(Integer, primary_key=True)
+    department = Column(String)
+    weekdays = Column(Integer)
+    start_time = Column(Time)
+    end_time = Column(Time)
+    s_undetermined_time = Column(Boolean)
+    e_undetermined_time = Column(Boolean)
+    start_date = Column(Date)
+    
+    overrides = relationship('ShiftOverride', 
+                             cascade='all, delete, delete-orphan')
+    expansions = relationship('TemplateExpansion', 
+                              cascade='all, delete, delete-orphan')
+    
+    def __init__(self, department, weekdays, start_time, end_time, 
+                 start_date, s_undetermined=False, e_undetermined=False):
+        """Initialize a ShiftTemplate ORM object."""
+        self.department = department
+        self.weekdays = weekdays
+        self.start_time = start_time
+        self.end_time = end_time
+        self.start_date = start_date
+        self.s_undetermined_time = s_undetermined
+        self.e_undetermined_time = e_undetermined
+        
+        
+    def is_on_weekday(self, weekday):
+        """Return True if the shift is worked on weekday, Monday being 0."""
+        return bool(self.weekdays & (1 << weekday))
+        
+        
+    def get_str(self):
+        """Returns a string formatted department weekdays start - end time."""
+        days = [UnavailableTime.WEEKDAY_TO_STR[d] for d in range(0, 7)
+                if self.is_on_weekday(d)]
+        start_str = self.start_time.strftime("%I:%M %p")
+        end_str = self.end_time.strftime("%I:%M %p")
+        return "%s %s %s - %s from %s" % (self.department, " ".join(days), 
+                                          start_str, end_str,
+                                          self.start_date.strftime("%m/%d/%Y"))
+                                  
+                                  
+class ShiftOverride(Base):
+    """ORM representation of a one-off change to a shift template.
+    
+    An override changes the times of a shift template on a single date, or 
+    skips the shift on that date entirely when it has no start and end time.
+    Overrides are applied when the template's month is expanded, and a
+    template has at most one override of a date.
+    """
+    
+    __tablename__ = 'shift_overrides'
+    __table_args__ = (Index('ix_shift_overrides_template_date',
+                            'template_id', 'date', unique=True),)
+    
+    id = Column(Integer, primary_key=True)
+    template_id = Column(Integer, ForeignKey('shift_templates.id'))
+    date = Column(Date)
+    start_time = Column(Time, nullable=True)
+    end_time = Column(Time, nullable=True)
+    
+    def __init__(self, template_id, date, start_time=None, end_time=None):
+        """Initialize a ShiftOverride ORM object."""
+        self.template_id = template_id
+        self.date = date
+        self.start_time = start_time
+        self.end_time = end_time
+        
+        
+    def is_skipped(self):
+        """Return True if the shift is not worked on the override's date."""
+        return self.start_time == None or self.end_time == None
+        
+        
+class TemplateExpansion(Base):
+    """ORM record of a month a shift template has been expanded for.
+    
+    Once a month is expanded its schedules are ordinary schedules that may 
+    be edited or removed, so a template is never expanded twice for a month.
+    """
+    
+    __tablename__ = 'template_expansions'
+    __table_args__ = (Index('ix_template_expansions_template_date',
+                            'template_id', 'calendar_date', unique=True),)
+    
+    id = Column(Integer, primary_key=True)
+    template_id = Column(Integer, ForeignKey('shift_templates.id'))
+    calendar_date = Column(Date)
+    
+    def __init__(self, template_id, calendar_date):
+        """Initialize a TemplateExpansion ORM object."""
+        self.template_id = template_id
+        self.calendar_date = calendar_date
+        
+        
 class Department(Base):  
     """ORM representation of a department."""
     
@@ -302,16 +555,374 @@ class Department(Base):
     def __init__(self, department):
         """Initialize a Department ORM object."""
         self.name = department
+        
+        
+class EmployeeMonthHours(Base):
+    """ORM representation of the minutes an employee is scheduled in a month.
+    
+    This and the other aggregate tables are kept up to date by triggers on 
+    the schedules table, see create_aggregate_triggers, whatever program 
+    writes the schedules. Archived schedules are not counted.
+    """
+    
+    __tablename__ = 'employee_month_hours'
+    
+    calendar_date = Column(Date, primary_key=True)
+    employee_id = Column(Integer, primary_key=True)
+    minutes = Column(Integer)
+    
+    
+class EmployeeWeekHours(Base):
+    """ORM representation of the minutes an employee is scheduled in a week.
+    
+    Weeks start on Sunday, see get_week_start, and a schedule is counted in
+    the week of its schedule_date.
+    """
+    
+    __tablename__ = 'employee_week_hours'
+    
+    week_start = Column(Date, primary_key=True)
+    employee_id = Column(Integer, primary_key=True)
+    minutes = Column(Integer)
+    
+    
+class DepartmentMonthCost(Base):
+    """ORM representation of the cost of a department's month.
+    
+    Each assigned schedule is costed at the current wage of its employee
+    the same way as schedule_cost.
+    """
+    
+    __tablename__ = 'department_month_costs'
+    
+    calendar_date = Column(Date, primary_key=True)
+    department = Column(String, primary_key=True)
+    cost = Column(Float)
+
+
+def schedule_cost(start_dt, end_dt, wage):
+    """Return the USD cost of working from start_dt to end_dt at wage."""
+    timedelta = end_dt - start_dt
+    hours = timedelta.seconds / 3600
+    return hours * wage
+
+
+def get_schedule_minutes(start_dt, end_dt):
+    """Return int number of minutes from start_dt to end_dt."""
+    timedelta = end_dt - start_dt
+    return timedelta.days * 24 * 60 + (timedelta.seconds + 30) / 60
+
+
+def get_week_start(date):
+    """Return datetime.date of the Sunday starting the week of date."""
+    return date - datetime.timedelta(days=(date.weekday() + 1) % 7)
+
+
+def get_slot(time, round_up=False):
+    """Return index of the 15 minute slot of the day that time falls in.
+    
+    Args:
+        time: datetime.time or datetime.datetime object.
+        round_up: Boolean to return the index of the next slot when time is
+            not exactly at the start of a slot, used for end times.
+    """
+    
+    minutes = time.hour * 60 + time.minute
+    slot = minutes / SLOT_MINUTES
+    if round_up and (minutes % SLOT_MINUTES or time.second 
+                     or time.microsecond):
+        slot += 1
+    return slot
+    
+    
+def get_day_slot_ranges(start_dt, end_dt):
+    """Return (date, start slot, end slot) of each day a period is on.
+    
+    The end slot is exclusive. A period that ends on a later day than it
+    starts, such as a schedule past midnight, is split at midnight into a
+    range of each day it is on.
+    
+    Args:
+        start_dt: datetime.datetime of the start of the period.
+        end_dt: datetime.datetime of the end of the period.
+    """
+    
+    ranges = []
+    date = start_dt.date()
+    start_slot = get_slot(start_dt)
+    while date < end_dt.date():
+        ranges.append((date, start_slot, SLOTS_PER_DAY))
+        date += datetime.timedelta(days=1)
+        start_slot = 0
+    end_slot = get_slot(end_dt, True)
+    if end_slot > start_slot:
+        ranges.append((date, start_slot, end_slot))
+    return ranges
+    
+    
+def get_slot_mask(start_time, end_time):
+    """Return int with a bit set for each time slot from start to end time.
+    
+    Bit i of the mask is set if the period overlaps the ith 15 minute slot of
+    the day. Two periods whose times are on slot boundaries overlap exactly
+    when their masks have a bit in common.
+    
+    Args:
+        start_time: datetime.time of the start of the period.
+        end_time: datetime.time of the end of the period.
+    """
+    
+    start_slot = get_slot(start_time)
+    end_slot = get_slot(end_time, True)
+    if end_slot <= start_slot:
+        return 0
+    return (1 << end_slot) - (1 << start_slot)
+    
+    
+def get_day_slot_masks(start_dt, end_dt):
+    """Return (weekday, slot mask) of each day a period is on.
+    
+    The mask of each day is that of get_slot_mask for the part of the 
+    period on the day, see get_day_slot_ranges. Monday is weekday 0.
+    
+    Args:
+        start_dt: datetime.datetime of the start of the period.
+        end_dt: datetime.datetime of the end of the period.
+    """
+    
+    return [(date.weekday(), (1 << end_slot) - (1 << start_slot))
+            for date, start_slot, end_slot 
+            in get_day_slot_ranges(start_dt, end_dt)]
+
+
+def create_indexes(engine):
+    """Create declared indexes missing from tables already in the database.
+    
+    create_all only creates the indexes of a table when it creates the table,
+    so indexes added to an existing table must be created separately.
+    """
+    
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = [i['name'] for i in inspector.get_indexes(table.name)]
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
 
+
+# SQL of the minutes of a schedule row, the Sunday starting its week and 
+# the wage of its employee, given the name of the row, e.g. NEW
+MINUTES_SQL = ("CAST(ROUND((julianday({row}.end_datetime) "
+               "- julianday({row}.start_datetime)) * 1440) AS INTEGER)")
+WEEK_START_SQL = ("date({row}.schedule_date, '-' "
+                  "|| strftime('%w', {row}.schedule_date) || ' days')")
+WAGE_SQL = ("COALESCE((SELECT wage FROM Employee "
+            "WHERE Employee.id = {row}.employee_id), 0)")
+# Columns of schedules that change the aggregates of a schedule
+AGGREGATE_COLUMNS = ['employee_id', 'calendar_date', 'schedule_date',
+                     'start_datetime', 'end_datetime', 'department']
+
+
+def get_aggregate_statements(row, sign):
+    """Return SQL statements adding or subtracting a schedule's aggregates.
+    
+    Rows of the aggregate tables are only created when adding, as a 
+    schedule being subtracted was added before.
+    
+    Args:
+        row: String name of the schedule row in a trigger, NEW or OLD.
+        sign: '+' to add the schedule to the aggregates, '-' to subtract it.
+    Returns:
+        A list of String SQL statements.
+    """
+    
+    values = {'minutes': MINUTES_SQL.format(row=row),
+              'week_start': WEEK_START_SQL.format(row=row),
+              'wage': WAGE_SQL.format(row=row),
+              'row': row, 'sign': sign}
+    statements = []
+    if sign == '+':
+        statements += [
+            "INSERT OR IGNORE INTO employee_month_hours "
+            "(calendar_date, employee_id, minutes) "
+            "VALUES ({row}.calendar_date, {row}.employee_id, 0)",
+            "INSERT OR IGNORE INTO employee_week_hours "
+            "(week_start, employee_id, minutes) "
+            "VALUES ({week_start}, {row}.employee_id, 0)",
+            "INSERT OR IGNORE INTO department_month_costs "
+            "(calendar_date, department, cost) "
+            "VALUES ({row}.calendar_date, {row}.department, 0)"]
+    statements += [
+        "UPDATE employee_month_hours SET minutes = minutes {sign} {minutes} "
+        "WHERE calendar_date = {row}.calendar_date "
+        "AND employee_id = {row}.employee_id",
+        "UPDATE employee_week_hours SET minutes = minutes {sign} {minutes} "
+        "WHERE week_start = {week_start} "
+        "AND employee_id = {row}.employee_id",
+        "UPDATE department_month_costs "
+        "SET cost = cost {sign} ({minutes} / 60) * {wage} "
+        "WHERE calendar_date = {row}.calendar_date "
+        "AND department = {row}.department"]
+    return [s.format(**values) for s in statements]
+    
+    
+def get_aggregate_triggers():
+    """Return (name, SQL statement) creating each aggregate table trigger.
+    
+    Triggers on the schedules table add a schedule to the aggregates of its
+    employee and department when it is assigned, and subtract it when it 
+    is unassigned, changed or deleted. A trigger on the Employee table 
+    updates the costs of an employee's schedules when the wage changes.
+    """
+    
+    columns = ", ".join(AGGREGATE_COLUMNS)
+    triggers = [
+        ("schedules_aggregates_insert", "INSERT", "NEW", "+"),
+        ("schedules_aggregates_delete", "DELETE", "OLD", "-"),
+        ("schedules_aggregates_update_old", "UPDATE OF " + columns, "OLD", 
+         "-"),
+        ("schedules_aggregates_update_new", "UPDATE OF " + columns, "NEW", 
+         "+")]
+    statements = []
+    for name, event, row, sign in triggers:
+        statements.append((name, 
+                           "CREATE TRIGGER IF NOT EXISTS %s AFTER %s "
+                           "ON schedules WHEN %s.employee_id IS NOT NULL "
+                           "BEGIN %s; END" 
+                           % (name, event, row, 
+                              "; ".join(get_aggregate_statements(row, 
+                                                                 sign)))))
+    schedule_costs = ("FROM schedules "
+                      "WHERE schedules.employee_id = NEW.id "
+                      "AND schedules.calendar_date "
+                      "= department_month_costs.calendar_date "
+                      "AND schedules.department "
+                      "= department_month_costs.department")
+    statements.append((
+        "employee_aggregates_wage",
+        "CREATE TRIGGER IF NOT EXISTS employee_aggregates_wage "
+        "AFTER UPDATE OF wage ON Employee "
+        "WHEN NEW.wage IS NOT OLD.wage BEGIN "
+        "UPDATE department_month_costs SET cost = cost "
+        "+ (SELECT SUM(%s / 60) %s) "
+        "* (COALESCE(NEW.wage, 0) - COALESCE(OLD.wage, 0)) "
+        "WHERE EXISTS (SELECT 1 %s); END" 
+        % (MINUTES_SQL.format(row='schedules'), schedule_costs, 
+           schedule_costs)))
+    return statements
+    
+    
+def create_aggregate_triggers(connection):
+    """Create the triggers of the aggregate tables missing from a database.
+    
+    Triggers are only created in the live database, so archived schedules
+    are not counted in the aggregates.
+    """
+    
+    for name, statement in get_aggregate_triggers():
+        connection.execute(statement)
+        
+        
+def drop_aggregate_triggers(connection):
+    """Drop the triggers of the aggregate tables from a database.
+    
+    Tables cannot be renamed while triggers refer to them, and aggregates
+    being filled in are not to be changed by triggers.
+    """
+    
+    for name, statement in get_aggregate_triggers():
+        connection.execute("DROP TRIGGER IF EXISTS %s" % name)
         
-def start_db(db_name, test=False):
-    """Function to start database, for normal usage or for testing."""
+        
+def get_schema_version(connection):
+    """Return the schema version recorded in a database."""
+    return connection.execute("PRAGMA user_version").scalar()
+    
+    
+def set_schema_version(connection, version, schema='main'):
+    """Record the schema version of a database or an attached database."""
+    connection.execute("PRAGMA %s.user_version = %d" % (schema, version))
+    
+    
+def set_pragmas(engine, profile):
+    """Set the PRAGMAs of a performance profile on each new connection.
+    
+    Args:
+        engine: An sqlalchemy engine using sqlite3.
+        profile: dict of PRAGMA names to values, see PERFORMANCE_PROFILES.
+    Raises:
+        ValueError: If a PRAGMA or value is not in the performance profiles.
+    """
+    
+    pragmas = []
+    for name, value in sorted(profile.iteritems()):
+        if name not in PERFORMANCE_PROFILES['sqlite']:
+            raise ValueError("Unknown PRAGMA in profile: %s" % name)
+        if value is None:
+            continue
+        # Values are put into the statement, so only allow plain words
+        if not (isinstance(value, (int, long)) or str(value).isalpha()):
+            raise ValueError("Invalid value of PRAGMA %s: %s" % (name, value))
+        pragmas.append("PRAGMA %s = %s" % (name, value))
+        
+    @event.listens_for(engine, 'connect')
+    def execute_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+        
+        
+def create_db_engine(db_name, test=False, profile=DEFAULT_PROFILE):
+    """Return an engine of a database setting the PRAGMAs of a profile.
+    
+    Args:
+        db_name: String name of the database file without .db.
+        test: Boolean to use the test database of db_name instead.
+        profile: String name of a performance profile in 
+            PERFORMANCE_PROFILES, or a dict of PRAGMA names to values.
+    """
+    
     db = 'sqlite:///' + db_name + '.db'
     if test:
         db = 'sqlite:///' + db_name + 'test.db'
+    if isinstance(profile, basestring):
+        profile = PERFORMANCE_PROFILES[profile]
     engine = create_engine(db, echo=False)
-    Base.metadata.create_all(engine)
+    set_pragmas(engine, profile)
+    return engine
+    
+    
+def create_session_factory(db_name, test=False, profile=DEFAULT_PROFILE):
+    """Start database and return a sessionmaker for sessions of it.
+    
+    Each unit of work, such as a write or the view of a month, can use a 
+    short-lived session of its own made by the sessionmaker. The schema of
+    the database is upgraded first, see migrations.upgrade_database, 
+    unless it is at SCHEMA_VERSION and has not changed since its month file
+    was saved, in which case its schema and departments were already made 
+    when it was last opened and startup only reads the schema version.
+    
+    Args:
+        db_name: String name of the database file without .db.
+        test: Boolean to use the test database of db_name instead.
+        profile: String name of a performance profile in 
+            PERFORMANCE_PROFILES, or a dict of PRAGMA names to values.
+    """
+    
+    engine = create_db_engine(db_name, test, profile)
+    # Imported here as both modules depend on the models of this module
+    from unit_of_work import configure_session_factory, enable_savepoints
+    from migrations import upgrade_database
+    from month_file import is_month_file_current
+    enable_savepoints(engine)
     Session = sessionmaker(bind=engine)
+    configure_session_factory(Session)
+    # The stamp is read before connecting, as the check must not change it
+    if (is_month_file_current(engine.url.database) 
+        and get_schema_version(engine) == SCHEMA_VERSION):
+        return Session
+    upgrade_database(engine)
     session = Session()
     # Case where user starts program, but no departments in database
     departments = session.query(Department).all()
@@ -321,5 +932,22 @@ def start_db(db_name, test=False):
             dep = Department(d)
             session.add(dep)
         session.commit()
+    session.close()
         
-    return session
\ No newline at end of file
+    return Session
+    
+    
+def start_db(db_name, test=False, profile=DEFAULT_PROFILE):
+    """Function to start database, for normal usage or for testing.
+    
+    Args:
+        db_name: String name of the database file without .db.
+        test: Boolean to use the test database of db_name instead.
+        profile: String name of a performance profile in 
+            PERFORMANCE_PROFILES, or a dict of PRAGMA names to values.
+    Returns:
+        A new session of a sessionmaker from create_session_factory.
+    """
+    
+    Session = create_session_factory(db_name, test, profile)
+    return Session()
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Module for comparing the commit latency of database performance profiles
+
+Each profile is run on a new database of its own with the same autofill
+workload: a month of schedules of a department is filled one schedule at a
+time with the first available employee, committing each assignment as it
+is when assigned from the eligable list. For example:
+
+    python profile_benchmark.py --employees 30 --shifts 6 sqlite fast
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+from orm_models import (Employee, Schedule, PERFORMANCE_PROFILES,
+                        start_db, get_week_start)
+from bulk_operations import create_schedules
+from core_reads import select_week_minutes
+from unit_of_work import commit
+
+DEPARTMENT = 'Front'
+
+
+def create_workload(session, date, employees, shifts):
+    """Create the employees and unassigned schedules of a month.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        date: datetime.date of the first day of the month.
+        employees: int number of employees of the department.
+        shifts: int number of 4 hour schedules on each day, from 8:00.
+    """
+
+    session.add_all([Employee(i, "Employee %s" % i, "Doe", DEPARTMENT,
+                              "None", "None", "9.5", "40", "48", "0", "50",
+                              "7.5")
+                     for i in range(1, employees + 1)])
+    commit(session)
+    schedule_tuples = []
+    day = date
+    while day.month == date.month:
+        for i in range(shifts):
+            start = datetime.datetime.combine(day, datetime.time(8))
+            start += datetime.timedelta(hours=2 * i)
+            end = start + datetime.timedelta(hours=4)
+            schedule_tuples.append((start, end, False, False, DEPARTMENT))
+        day += datetime.timedelta(days=1)
+    create_schedules(session, schedule_tuples)
+
+
+def autofill(session):
+    """Assign each schedule to its first available employee.
+
+    Returns:
+        A list of the seconds each commit of an assignment took.
+    """
+
+    employees = session.query(Employee).all()
+    schedules = (session.query(Schedule)
+                        .order_by(Schedule.start_datetime)
+                        .all())
+    commit_times = []
+    for s in schedules:
+        week_minutes = select_week_minutes(session, 
+                                           get_week_start(s.schedule_date))
+        for e in employees:
+            if e.get_availability(s, week_minutes) == '(A)':
+                e.add_schedule(s)
+                session.flush()
+                start = time.time()
+                commit(session)
+                commit_times.append(time.time() - start)
+                break
+    return commit_times
+
+
+def run_profile(profile, date, employees, shifts, directory=None):
+    """Run the autofill workload on a new database using a profile.
+
+    Args:
+        profile: String name of a profile in PERFORMANCE_PROFILES.
+        date: datetime.date of the first day of the month to fill.
+        employees: int number of employees.
+        shifts: int number of schedules each day.
+        directory: Directory to create the database in, None for the 
+            system's temporary directory. Commit latency depends mostly on
+            the disk, so this should be on the disk the database is used on.
+    Returns:
+        A tuple of the total seconds the autofill took and the list of the
+        seconds each commit took.
+    """
+
+    directory = tempfile.mkdtemp(dir=directory)
+    try:
+        session = start_db(os.path.join(directory, 'benchmark'),
+                           profile=profile)
+        create_workload(session, date, employees, shifts)
+        start = time.time()
+        commit_times = autofill(session)
+        total = time.time() - start
+        session.close()
+        session.bind.dispose()
+    finally:
+        shutil.rmtree(directory)
+    return total, commit_times
+
+
+def main():
+    """Print the commit latency of autofill with each profile."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('profiles', nargs='*',
+                        default=sorted(PERFORMANCE_PROFILES),
+                        help="profiles to compare, by default all of them")
+    parser.add_argument('--month', default='2017-03',
+                        help="month to fill as YYYY-MM")
+    parser.add_argument('--employees', type=int, default=20,
+                        help="number of employees")
+    parser.add_argument('--shifts', type=int, default=4,
+                        help="number of schedules each day")
+    parser.add_argument('--directory', default=None,
+                        help="directory to create databases in")
+    args = parser.parse_args()
+
+    date = datetime.datetime.strptime(args.month, "%Y-%m").date()
+    print("%-10s %8s %8s %10s %10s" % ("profile", "commits", "total s",
+                                       "mean ms", "max ms"))
+    for profile in args.profiles:
+        total, commit_times = run_profile(profile, date, args.employees,
+                                          args.shifts, args.directory)
+        count = len(commit_times)
+        mean = sum(commit_times) / count * 1000 if count else 0
+        longest = max(commit_times) * 1000 if count else 0
+        print("%-10s %8s %8.2f %10.2f %10.2f" % (profile, count, total,
+                                                 mean, longest))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Module for comparing the speed of ways of reading many schedules
+
+A new database is filled with schedules spread over a month, a third of
+them assigned, then the columns the cost panel needs are read in three
+ways: as ORM objects, as ORM column tuples and with core_reads. For
+example:
+
+    python read_benchmark.py --schedules 100000
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+from orm_models import Employee, Schedule, start_db
+from bulk_operations import create_schedules
+from core_reads import select_schedules
+from unit_of_work import commit
+
+DEPARTMENT = 'Front'
+COLUMNS = ['id', 'department', 'schedule_date', 'start_datetime',
+           'end_datetime', 'employee_id']
+
+
+def create_workload(session, date, schedules, employees=50):
+    """Create employees and schedules of a month, a third of them assigned.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        date: datetime.date of the first day of the month.
+        schedules: int number of schedules to create.
+        employees: int number of employees to assign schedules to.
+    """
+
+    session.add_all([Employee(i, "Employee %s" % i, "Doe", DEPARTMENT,
+                              "None", "None", "9.5", "40", "48", "0", "50",
+                              "7.5")
+                     for i in range(1, employees + 1)])
+    commit(session)
+    schedule_tuples = []
+    for i in range(schedules):
+        start = datetime.datetime.combine(date + datetime.timedelta(i % 28),
+                                          datetime.time(8))
+        start += datetime.timedelta(minutes=15 * (i % 32))
+        end = start + datetime.timedelta(hours=4)
+        schedule_tuples.append((start, end, False, False, DEPARTMENT))
+    create_schedules(session, schedule_tuples)
+    (session.query(Schedule)
+            .filter(Schedule.id % 3 == 0)
+            .update({'employee_id': Schedule.id % employees + 1},
+                    synchronize_session=False))
+    commit(session)
+
+
+def read_entities(session, date):
+    """Read the schedules of the month as ORM objects with their wage."""
+    query = (session.query(Schedule, Employee.wage)
+                    .outerjoin(Employee,
+                               Schedule.employee_id == Employee.id)
+                    .filter(Schedule.calendar_date == date))
+    return [(s.id, s.department, s.schedule_date, s.start_datetime,
+             s.end_datetime, s.employee_id, wage) for s, wage in query]
+
+
+def read_columns(session, date):
+    """Read the columns of the month's schedules with an ORM query."""
+    return (session.query(*[getattr(Schedule, name) for name in COLUMNS]
+                          + [Employee.wage])
+                   .outerjoin(Employee,
+                              Schedule.employee_id == Employee.id)
+                   .filter(Schedule.calendar_date == date)
+                   .all())
+
+
+def read_core(session, date):
+    """Read the columns of the month's schedules with a core select."""
+    return select_schedules(session, COLUMNS,
+                            [Schedule.calendar_date == date], wage=True)
+
+
+READERS = [('orm entities', read_entities),
+           ('orm columns', read_columns),
+           ('core', read_core)]
+
+
+def run_readers(date, schedules, repeat=3, directory=None):
+    """Time each way of reading the schedules of a month.
+
+    Args:
+        date: datetime.date of the first day of the month.
+        schedules: int number of schedules in the month.
+        repeat: int number of times to read, the fastest time is kept.
+        directory: Directory to create the database in, None for the
+            system's temporary directory.
+    Returns:
+        A list of (name, rows read, fastest seconds) of each reader.
+    """
+
+    directory = tempfile.mkdtemp(dir=directory)
+    try:
+        session = start_db(os.path.join(directory, 'benchmark'))
+        create_workload(session, date, schedules)
+        results = []
+        for name, reader in READERS:
+            times = []
+            for i in range(repeat):
+                session.close()
+                start = time.time()
+                rows = reader(session, date)
+                times.append(time.time() - start)
+            results.append((name, len(rows), min(times)))
+        session.close()
+        session.bind.dispose()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def main():
+    """Print how long each way of reading a month of schedules takes."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--month', default='2017-03',
+                        help="month of the schedules as YYYY-MM")
+    parser.add_argument('--schedules', type=int, default=100000,
+                        help="number of schedules to read")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="number of reads, the fastest is printed")
+    parser.add_argument('--directory', default=None,
+                        help="directory to create the database in")
+    args = parser.parse_args()
+
+    date = datetime.datetime.strptime(args.month, "%Y-%m").date()
+    print("%-14s %8s %8s" % ("reader", "rows", "s"))
+    for name, count, seconds in run_readers(date, args.schedules,
+                                            args.repeat, args.directory):
+        print("%-14s %8s %8.3f" % (name, count, seconds))
+
+
+if __name__ == '__main__':
+    main()
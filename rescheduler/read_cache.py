@@ -0,0 +1,112 @@
+"""
+Module for caching read models that stay resident while the GUI runs
+
+The GUI's session is closed whenever the calendar changes month, so data
+every page needs all the time is kept here instead. Read models are plain
+tuples, strings and snapshots rather than ORM objects, so holding them keeps no
+session or identity map alive, and each is loaded in a short-lived session
+of its own. The cache holds one entry per kind of read model, so its memory
+does not grow however long the program runs.
+"""
+
+import collections
+from orm_models import Department, MonthSales, StaffingRequirement
+from schedule_metrics import minute_of_day, end_minute_of_day
+from snapshots import (load_employee_snapshots, load_vacation_snapshots,
+                       load_employee_directory)
+from unit_of_work import session_scope
+
+
+def load_departments(session):
+    """Return list of the names of all departments."""
+    return [name for name, in session.query(Department.name)]
+
+
+def load_monthly_sales(session):
+    """Return list of (month_and_year, total_sales) of all sales data."""
+    return [tuple(row) for row in session.query(MonthSales.month_and_year,
+                                                MonthSales.total_sales)]
+
+
+def load_staffing_requirements(session):
+    """Return dict of department names to list of requirements.
+
+    Each requirement is (weekday, start minute, end minute, employees
+    needed), as schedule_metrics.get_staffing_gaps takes them.
+    """
+
+    requirements = collections.defaultdict(list)
+    for r in session.query(StaffingRequirement):
+        requirements[r.department].append((r.weekday, 
+                                           minute_of_day(r.start_time),
+                                           end_minute_of_day(r.end_time),
+                                           r.employees_needed))
+    return dict(requirements)
+
+
+class ReadModelCache(object):
+    """Cache of read models loaded on first use until invalidated.
+
+    A page that changes the data of a read model invalidates it so that it
+    is loaded again the next time it is used.
+
+    Attributes:
+        session_factory: sessionmaker of the sessions read models are
+            loaded in.
+        entries: dict of read model names to loaded read models.
+    """
+
+    LOADERS = {'departments': load_departments,
+               'monthly_sales': load_monthly_sales,
+               'employees': load_employee_snapshots,
+               'vacations': load_vacation_snapshots,
+               'employee_directory': load_employee_directory,
+               'staffing_requirements': load_staffing_requirements}
+
+    def __init__(self, session_factory):
+        """Initialize an empty cache.
+
+        Args:
+            session_factory: sessionmaker configured by
+                unit_of_work.configure_session_factory.
+        """
+
+        self.session_factory = session_factory
+        self.entries = {}
+
+
+    def get(self, name):
+        """Return a read model, loading it if it is not cached.
+
+        Args:
+            name: String name of the read model, a key of LOADERS.
+        """
+
+        if name not in self.entries:
+            with session_scope(self.session_factory) as session:
+                self.entries[name] = self.LOADERS[name](session)
+        return self.entries[name]
+
+
+    def set(self, name, read_model):
+        """Cache a read model loaded some other way, such as from a file.
+
+        Args:
+            name: String name of the read model, a key of LOADERS.
+            read_model: The read model as its loader would return it.
+        """
+
+        self.entries[name] = read_model
+
+
+    def invalidate(self, name=None):
+        """Drop a read model so it is loaded again when next used.
+
+        Args:
+            name: String name of the read model, None to drop every one.
+        """
+
+        if name is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(name, None)
@@ -4,6 +4,7 @@ Module for the employee and department page.
 
 import Tkinter as tk
 import ttk
+import tkMessageBox
 import calendar
 import datetime
 from datetime_widgets import yearify
@@ -121,29 +122,44 @@ class SalesPage:
         for s in self.sales_info:
             text = s.get_string()
             self.sales_lb.insert(tk.END, text)
+        # Keep ids, the session is closed when the calendar changes month
+        self.sales_info = [s.id for s in self.sales_info]
         
     def add_sales_info(self):
-        """Commit data fields in widgets to listbox and DB Sales table."""
+        """Queue data fields in widgets to DB Sales table, list once saved."""
         year = int(self.year_var.get())
         month = self.MONTH_TO_NUM[self.month_var.get()]
         amount = self.amount_var.get()
         sales_date = datetime.date(year, month, 1)
-        sales_info = MonthSales(sales_date, amount)
-        self.session.add(sales_info)
-        self.session.commit()
-        self.load_sales_info()
         
-        self.cal.update_costs()
+        def write(session):
+            session.add(MonthSales(sales_date, amount))
+            
+        self.cal.write_queue.submit(write, self.sales_saved, 
+                                    self.save_failed)
         
     def remove_sales_info(self):
-        """Remove selected listbox element and object from DB."""
+        """Queue removal of selected object from DB, list once removed."""
         if self.sales_lb.curselection() == ():
             return
         index =  self.sales_lb.curselection()[0]
-        self.sales_lb.delete(index)
-        sales_info_obj = self.sales_info[index]
-        self.session.delete(sales_info_obj)
-        self.session.commit()
-        del self.sales_info[index]
+        sales_id = self.sales_info[index]
+        
+        def write(session):
+            (session.query(MonthSales)
+                    .filter(MonthSales.id == sales_id)
+                    .delete(synchronize_session=False))
+                    
+        self.cal.write_queue.submit(write, self.sales_saved, 
+                                    self.save_failed)
+        
+    def sales_saved(self, result):
+        """Show the sales info in the DB once a write is committed."""
+        self.cal.read_cache.invalidate('monthly_sales')
+        self.load_sales_info()
+        
+        self.cal.update_costs()
         
-        self.cal.update_costs()
\ No newline at end of file
+    def save_failed(self, error):
+        """Tell the user the sales info could not be saved."""
+        tkMessageBox.showerror("Could Not Save Sales Info", str(error))
\ No newline at end of file
@@ -0,0 +1,533 @@
+"""
+Module for month-wide schedule metrics used by the calendar page
+"""
+
+import calendar
+import datetime
+import bisect
+import collections
+from orm_models import (Schedule, StaffingRequirement, 
+                        UnavailableTime, SLOTS_PER_DAY, get_day_slot_ranges,
+                        schedule_cost)
+from core_reads import select_schedules, select_department_costs
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def get_day_percentages(day_costs, monthly_revenue):
+    """Return percentage cost of each day relative to its revenue.
+
+    There is no revenue data per day, so the forecast revenue of a day is
+    the monthly revenue split evenly across the days of the month.
+
+    Args:
+        day_costs: list of the cost of each day of the month.
+        monthly_revenue: Number for the forecast revenue of the month.
+    Returns:
+        A list of ints, the percentage cost of each day of the month where
+        the 1st of the month is at index 0.
+    """
+
+    daily_revenue = float(monthly_revenue) / len(day_costs)
+    return [int(round((c / daily_revenue) * 100, 0)) for c in day_costs]
+
+
+
+def get_monthly_costs(session, year, department=None):
+    """Return the cost of each month of a year, archived or live.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        year: int year of the months.
+        department: String name of a department, None for all of them.
+    Returns:
+        A list of the cost of each month, January at index 0. Archived
+        schedules are costed at the current wage of their employee.
+    """
+
+    first_day = datetime.date(year, 1, 1)
+    last_day = datetime.date(year, 12, 31)
+    costs = [0] * 12
+    # Costs of the live database are kept by triggers, only archived 
+    # schedules are read
+    for calendar_date, dep, cost in select_department_costs(session, 
+                                                            first_day,
+                                                            last_day, 
+                                                            department):
+        costs[calendar_date.month - 1] += cost
+    criteria = [Schedule.calendar_date >= first_day,
+                Schedule.calendar_date <= last_day,
+                Schedule.employee_id != None]
+    if department is not None:
+        criteria.append(Schedule.department == department)
+    rows = select_schedules(session, 
+                            ['calendar_date', 'start_datetime', 
+                             'end_datetime'],
+                            criteria, wage=True, 
+                            archived=(first_day, last_day), live=False)
+    for calendar_date, start, end, wage in rows:
+        if wage != None:
+            costs[calendar_date.month - 1] += schedule_cost(start, end, wage)
+    return costs
+
+
+
+class MonthCoverage(object):
+    """Number of schedules of a department in each 15 minute slot of a month.
+
+    Assigned and unassigned schedules are counted separately for each of the
+    96 time slots of every day of the month. Rather than checking every slot
+    against every schedule, each schedule adds 1 at its start slot and 
+    subtracts 1 at its end slot of a difference list for its day. The count 
+    of schedules in a slot is then the prefix sum of the difference list up to
+    that slot. Prefix sums are computed once per day and kept until a schedule
+    of that day is added, removed or has its employee changed. A schedule
+    past midnight is counted on both days it is on, so a schedule starting
+    the day before the month counts on the 1st and one starting on the last
+    day counts only up to midnight.
+
+    Attributes:
+        session: An sqlalchemy session object using sqlite3.
+        date: datetime.date of the first day of the month of the coverage.
+        dep: String name of the department of the coverage.
+        days_in_month: int number of days in the month of the coverage.
+        assigned_diffs: list for each day of the month of the difference list
+            of schedules with an assigned employee.
+        unassigned_diffs: list for each day of the month of the difference
+            list of schedules without an assigned employee.
+        schedule_slots: dict of schedule primary keys as keys and a 2-element
+            tuple of a list of (day index, start slot, end slot) of each day
+            of the month the schedule is on and an assigned boolean that was
+            last added to the difference lists as values.
+        day_coverage: dict of day indexes as keys and a 2-element tuple of
+            the (assigned, unassigned) counts per slot of that day as values.
+    """
+
+    def __init__(self, session, date, department, columns=None):
+        """Initialize and load the coverage for the month of date.
+
+        Args:
+            session: An sqlalchemy session object using sqlite3.
+            date: datetime.date object of the month and year of the coverage.
+            department: String name of the department of the coverage.
+            columns: MonthColumns of the month to count the schedules of 
+                instead of reading them from the database, or None.
+        """
+
+        self.session = session
+        self.date = datetime.date(date.year, date.month, 1)
+        self.dep = department
+        self.days_in_month = calendar.monthrange(date.year, date.month)[1]
+        self.assigned_diffs = []
+        self.unassigned_diffs = []
+        self.schedule_slots = {}
+        self.day_coverage = {}
+
+        if columns is None:
+            self.load_coverage()
+        else:
+            self.load_columns(columns)
+
+
+    def clear_coverage(self):
+        """Set the counts of every slot of the month to 0."""
+        self.assigned_diffs = [[0] * (SLOTS_PER_DAY + 1)
+                               for i in range(self.days_in_month)]
+        self.unassigned_diffs = [[0] * (SLOTS_PER_DAY + 1)
+                                 for i in range(self.days_in_month)]
+        self.schedule_slots = {}
+        self.day_coverage = {}
+
+
+    def load_coverage(self):
+        """Load start and end slots of all schedules on days of the month."""
+        self.clear_coverage()
+        rows = select_schedules(self.session,
+                                ['id', 'start_datetime', 'end_datetime', 
+                                 'employee_id'],
+                                get_month_criteria(self.date, self.dep))
+        for id, start, end, employee_id in rows:
+            self.add_slots(id, start, end, employee_id != None)
+
+
+    def load_columns(self, columns):
+        """Load the slots of the department's schedules from MonthColumns.
+
+        The columns hold the schedules of the day before the month too, so
+        these are the same schedules load_coverage reads.
+        """
+
+        self.clear_coverage()
+        for id, start, end, assigned in columns.get_department_rows(self.dep):
+            self.add_slots(id, start, end, assigned)
+
+
+    def add_slots(self, id, start, end, assigned):
+        """Add a schedule to the difference lists of the days it is on.
+
+        Returns:
+            A list of the indexes of the days of the month the schedule is on.
+        """
+
+        if assigned:
+            diffs = self.assigned_diffs
+        else:
+            diffs = self.unassigned_diffs
+        day_slots = []
+        for date, start_slot, end_slot in get_day_slot_ranges(start, end):
+            day_index = (date - self.date).days
+            if 0 <= day_index < self.days_in_month:
+                diffs[day_index][start_slot] += 1
+                diffs[day_index][end_slot] -= 1
+                self.day_coverage.pop(day_index, None)
+                day_slots.append((day_index, start_slot, end_slot))
+        if day_slots:
+            self.schedule_slots[id] = (day_slots, assigned)
+        return [s[0] for s in day_slots]
+
+
+    def add_schedule(self, schedule):
+        """Add a db schedule to the coverage.
+
+        Args:
+            schedule: A schedule object, ignored if not of the coverage's 
+                department or on no day of its month.
+        Returns:
+            A list of the indexes of the days of the month the schedule is on.
+        """
+
+        if schedule.department != self.dep:
+            return []
+        return self.add_slots(schedule.id, schedule.start_datetime,
+                              schedule.end_datetime,
+                              schedule.employee_id != None)
+
+
+    def remove_schedule(self, id):
+        """Remove the slots last added for a schedule from the coverage.
+
+        Args:
+            id: The primary key of the schedule to be removed.
+        Returns:
+            A list of the indexes of the days of the removed schedule, empty
+            if the schedule was not in the coverage.
+        """
+
+        if id not in self.schedule_slots:
+            return []
+        day_slots, assigned = self.schedule_slots.pop(id)
+        if assigned:
+            diffs = self.assigned_diffs
+        else:
+            diffs = self.unassigned_diffs
+        for day_index, start_slot, end_slot in day_slots:
+            diffs[day_index][start_slot] -= 1
+            diffs[day_index][end_slot] += 1
+            self.day_coverage.pop(day_index, None)
+        return [s[0] for s in day_slots]
+
+
+    def update_schedule(self, schedule):
+        """Move a schedule between assigned and unassigned counts.
+
+        Returns:
+            A list of the indexes of the days of the month the schedule is on.
+        """
+
+        day_indexes = self.remove_schedule(schedule.id)
+        return sorted(set(day_indexes + self.add_schedule(schedule)))
+
+
+    def get_day_coverage(self, day_index):
+        """Return assigned and unassigned schedule counts for each slot.
+
+        Args:
+            day_index: int index of the day in the month, the 1st is 0.
+        Returns:
+            A 2-element tuple of lists of the number of assigned and of 
+            unassigned schedules in each of the 96 slots of the day.
+        """
+
+        if day_index not in self.day_coverage:
+            assigned = self.prefix_sum(self.assigned_diffs[day_index])
+            unassigned = self.prefix_sum(self.unassigned_diffs[day_index])
+            self.day_coverage[day_index] = (assigned, unassigned)
+        return self.day_coverage[day_index]
+
+
+    def prefix_sum(self, diff):
+        """Return running total of a difference list for each slot."""
+        counts = []
+        count = 0
+        for i in range(SLOTS_PER_DAY):
+            count += diff[i]
+            counts.append(count)
+        return counts
+
+
+
+
+class StaffingGap(collections.namedtuple('StaffingGap', 
+                                         ['date', 'start_minute', 
+                                          'end_minute', 'employees_needed',
+                                          'employees_scheduled'])):
+    """A time period of a day where a department is below its requirement.
+    
+    Attributes:
+        date: datetime.date of the day of the gap.
+        start_minute: int minute of the day of the start of the gap.
+        end_minute: int minute of the day of the end of the gap, a gap 
+            until midnight ends at minute 1440.
+        employees_needed: int number of employees the requirement needs.
+        employees_scheduled: int number of employees assigned to schedules
+            during the gap.
+    """
+    
+    __slots__ = ()
+    
+    @property
+    def start_time(self):
+        """datetime.time of the start of the gap."""
+        return time_of_minute(self.start_minute)
+        
+        
+    @property
+    def end_time(self):
+        """datetime.time of the end of the gap, 00:00 for midnight."""
+        return time_of_minute(self.end_minute)
+        
+        
+    def get_str(self):
+        """Returns a string formatted day, start - end: scheduled/needed."""
+        weekday_str = UnavailableTime.WEEKDAY_TO_STR[self.date.weekday()]
+        start_str = self.start_time.strftime("%I:%M %p")
+        end_str = self.end_time.strftime("%I:%M %p")
+        return "%s %s %s - %s: %s/%s" % (weekday_str, self.date.day, 
+                                         start_str, end_str,
+                                         self.employees_scheduled,
+                                         self.employees_needed)
+
+
+def minute_of_day(time):
+    """Return number of minutes from midnight to a time or datetime."""
+    return time.hour * 60 + time.minute
+    
+    
+def end_minute_of_day(time):
+    """Return minute_of_day of the end time of a period of a day.
+    
+    A period of a day that ends at 00:00 ends at midnight, minute 1440.
+    """
+    
+    return minute_of_day(time) or MINUTES_PER_DAY
+    
+    
+def time_of_minute(minute):
+    """Return datetime.time of a minute of the day, 00:00 for 1440."""
+    minute %= MINUTES_PER_DAY
+    return datetime.time(minute / 60, minute % 60)
+    
+    
+def get_coverage_segments(intervals):
+    """Sweep intervals of a day into segments of equal interval count.
+    
+    Args:
+        intervals: list of 2-element tuples of the start and end minute of
+            each interval in a day.
+    Returns:
+        A list of 3-element lists of [start minute, end minute, count] where
+        count is the number of intervals covering that segment. The segments
+        are sorted, do not overlap and cover the whole day.
+    """
+    
+    events = []
+    for start, end in intervals:
+        events.append((start, 1))
+        events.append((end, -1))
+    # Ends sort before starts at the same minute, so that back to back
+    # intervals never count as overlapping.
+    events.sort()
+    events.append((MINUTES_PER_DAY, 0))
+    segments = []
+    count = 0
+    prev = 0
+    for minute, delta in events:
+        minute = min(minute, MINUTES_PER_DAY)
+        if minute > prev:
+            if segments and segments[-1][2] == count:
+                segments[-1][1] = minute
+            else:
+                segments.append([prev, minute, count])
+            prev = minute
+        count += delta
+    return segments
+    
+    
+def get_day_minute_ranges(start, end):
+    """Return (date, start minute, end minute) of each day a period is on.
+    
+    A period that ends on a later day than it starts, such as a schedule 
+    past midnight, is split at midnight into a range of each day it is on.
+    
+    Args:
+        start: datetime.datetime of the start of the period.
+        end: datetime.datetime of the end of the period.
+    """
+    
+    ranges = []
+    date = start.date()
+    start_minute = minute_of_day(start)
+    while date < end.date():
+        ranges.append((date, start_minute, MINUTES_PER_DAY))
+        date += datetime.timedelta(days=1)
+        start_minute = 0
+    end_minute = minute_of_day(end)
+    if end_minute > start_minute:
+        ranges.append((date, start_minute, end_minute))
+    return ranges
+    
+    
+def get_day_intervals(rows):
+    """Group (date, start datetime, end datetime) rows into minute intervals.
+    
+    Returns:
+        A dict of datetime.date as keys and a list of (start minute, end 
+        minute) of that day as values. Intervals that end on a later day are 
+        split into an interval of each day.
+    """
+    
+    day_intervals = collections.defaultdict(list)
+    for schedule_date, start, end in rows:
+        for date, start_minute, end_minute in get_day_minute_ranges(start, 
+                                                                    end):
+            day_intervals[date].append((start_minute, end_minute))
+    return day_intervals
+    
+
+def get_month_criteria(date, department):
+    """Return criteria of the schedules of a department on days of a month.
+    
+    These are the schedules starting in the month and those starting the 
+    day before it, which may go past midnight into the 1st.
+    
+    Args:
+        date: datetime.date object of the month and year.
+        department: String name of the department.
+    """
+    
+    month = datetime.date(date.year, date.month, 1)
+    day_before = month - datetime.timedelta(days=1)
+    return [Schedule.calendar_date.in_([day_before.replace(day=1), month]),
+            Schedule.schedule_date >= day_before,
+            Schedule.department == department]
+    
+    
+def find_staffing_gaps(session, date, department):
+    """Find every time of a month a department is below its requirements.
+    
+    The start and end of all assigned schedules of each day are sorted once
+    and swept into segments of equal staffing, then each staffing requirement
+    of that weekday is compared with the segments it overlaps. Schedules 
+    past midnight staff both days they are on, including those starting the
+    day before the month.
+    
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        date: datetime.date object of the month and year to check.
+        department: String name of the department to check.
+    Returns:
+        A list of StaffingGap sorted by date and start time, adjacent times
+        with the same number of scheduled employees are a single gap.
+    """
+    
+    requirements = [(r.weekday, minute_of_day(r.start_time),
+                     end_minute_of_day(r.end_time), r.employees_needed)
+                    for r in (session.query(StaffingRequirement)
+                                     .filter(StaffingRequirement.department 
+                                             == department))]
+    if requirements == []:
+        return []
+    rows = select_schedules(session,
+                            ['schedule_date', 'start_datetime', 
+                             'end_datetime'],
+                            get_month_criteria(date, department) 
+                            + [Schedule.employee_id != None])
+    return get_staffing_gaps(date, requirements, get_day_intervals(rows))
+    
+    
+def get_staffing_gaps(date, requirements, day_intervals):
+    """Find every time of a month staffing is below its requirements.
+    
+    The sweep of find_staffing_gaps, without reading the database, so the
+    gaps can also be found from schedules kept in memory.
+    
+    Args:
+        date: datetime.date object of the month and year to check.
+        requirements: list of (weekday, start minute, end minute, employees
+            needed) of each staffing requirement of the department.
+        day_intervals: dict of datetime.date to list of (start minute, end
+            minute) of the assigned schedules of that day.
+    Returns:
+        A list of StaffingGap sorted by date and start time.
+    """
+    
+    weekday_requirements = collections.defaultdict(list)
+    for weekday, r_start, r_end, needed in requirements:
+        weekday_requirements[weekday].append((r_start, r_end, needed))
+    gaps = []
+    days_in_month = calendar.monthrange(date.year, date.month)[1]
+    for day in range(1, days_in_month + 1):
+        day_date = datetime.date(date.year, date.month, day)
+        day_requirements = weekday_requirements.get(day_date.weekday())
+        if not day_requirements:
+            continue
+        segments = get_coverage_segments(day_intervals.get(day_date, []))
+        segment_starts = [s[0] for s in segments]
+        for r_start, r_end, needed in sorted(day_requirements):
+            i = bisect.bisect_right(segment_starts, r_start) - 1
+            while i < len(segments) and segments[i][0] < r_end:
+                s_start, s_end, count = segments[i]
+                if count < needed:
+                    gaps.append(StaffingGap(day_date, max(s_start, r_start),
+                                            min(s_end, r_end), needed, 
+                                            count))
+                i += 1
+    return gaps
+    
+    
+def get_gap_overlaps(session, date, department, gaps):
+    """Score unassigned schedules of a month by the staffing gaps they cover.
+    
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        date: datetime.date object of the month and year of the gaps.
+        department: String name of the department of the gaps.
+        gaps: list of StaffingGap of the department for the month.
+    Returns:
+        A dict of schedule primary keys as keys and the sum over the gaps the
+        schedule overlaps of minutes of overlap times employees missing as
+        values. Schedules that cover no gap are left out.
+    """
+    
+    day_gaps = collections.defaultdict(list)
+    for g in gaps:
+        day_gaps[g.date].append((g.start_minute, g.end_minute,
+                                 g.employees_needed - g.employees_scheduled))
+    if not day_gaps:
+        return {}
+    rows = select_schedules(session,
+                            ['id', 'start_datetime', 'end_datetime'],
+                            get_month_criteria(date, department)
+                            + [Schedule.employee_id == None])
+    overlaps = {}
+    for id, start, end in rows:
+        score = 0
+        for day, start_minute, end_minute in get_day_minute_ranges(start, 
+                                                                   end):
+            for g_start, g_end, missing in day_gaps.get(day, []):
+                overlap = min(end_minute, g_end) - max(start_minute, g_start)
+                if overlap > 0:
+                    score += overlap * missing
+        if score:
+            overlaps[id] = score
+    return overlaps
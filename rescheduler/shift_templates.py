@@ -0,0 +1,211 @@
+"""
+Module for expanding weekly shift templates into schedules
+
+Shift templates are only expanded into schedules for the months that are
+viewed or exported, so the templates table stays a handful of rows however
+far ahead schedules are needed. A month can also be expanded without the GUI:
+
+    python shift_templates.py 35 2017-03
+"""
+
+import argparse
+import calendar
+import datetime
+from orm_models import (Schedule, ShiftTemplate, ShiftOverride, 
+                        TemplateExpansion, start_db)
+from bulk_operations import insert_schedules
+from unit_of_work import commit
+
+
+def get_template_schedules(templates, overrides, date):
+    """Return schedule tuples of shift templates for every day of a month.
+
+    Args:
+        templates: list of ShiftTemplate objects.
+        overrides: dict of (template id, datetime.date) to the ShiftOverride
+            of the template on that date.
+        date: datetime.date of the month to expand.
+    Returns:
+        A list of (start, end, s_hide, e_hide, department) tuples as taken by
+        bulk_operations.insert_schedules, sorted by date.
+    """
+
+    schedule_tuples = []
+    days_in_month = calendar.monthrange(date.year, date.month)[1]
+    for day in range(1, days_in_month + 1):
+        day_date = datetime.date(date.year, date.month, day)
+        for t in templates:
+            if (day_date < t.start_date 
+                or not t.is_on_weekday(day_date.weekday())):
+                continue
+            start_time, end_time = t.start_time, t.end_time
+            override = overrides.get((t.id, day_date))
+            if override:
+                if override.is_skipped():
+                    continue
+                start_time, end_time = override.start_time, override.end_time
+            start = datetime.datetime.combine(day_date, start_time)
+            end = datetime.datetime.combine(day_date, end_time)
+            schedule_tuples.append((start, end, t.s_undetermined_time,
+                                    t.e_undetermined_time, t.department))
+    return schedule_tuples
+
+
+def get_unexpanded_templates(session, date, department=None):
+    """Return a query of the shift templates not yet expanded for a month.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        date: datetime.date of the month.
+        department: String name of the department of the templates, None
+            for the templates of all departments.
+    """
+
+    calendar_date = datetime.date(date.year, date.month, 1)
+    days_in_month = calendar.monthrange(date.year, date.month)[1]
+    end_date = datetime.date(date.year, date.month, days_in_month)
+    expanded = (session.query(TemplateExpansion.template_id)
+                       .filter(TemplateExpansion.calendar_date
+                               == calendar_date))
+    query = (session.query(ShiftTemplate)
+                    .filter(~ShiftTemplate.id.in_(expanded),
+                            ShiftTemplate.start_date <= end_date))
+    if department != None:
+        query = query.filter(ShiftTemplate.department == department)
+    return query
+
+
+def has_unexpanded_templates(session, date, department=None):
+    """Return True if a month has shift templates to expand.
+
+    This only reads, so it can be asked on the GUI thread before queueing
+    expand_templates as a write.
+    """
+
+    return get_unexpanded_templates(session, date, department).first() != None
+
+
+def expand_templates(session, date, department=None):
+    """Create the schedules of shift templates not yet expanded for a month.
+
+    The schedules of every template are inserted and the month recorded as
+    expanded for each template in a single transaction. Once expanded, the
+    schedules are like any other and editing or removing them does not
+    affect the template.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        date: datetime.date of the month to expand.
+        department: String name of the department whose templates to expand,
+            None to expand the templates of all departments.
+    Returns:
+        A list of the created schedule objects.
+    """
+
+    calendar_date = datetime.date(date.year, date.month, 1)
+    days_in_month = calendar.monthrange(date.year, date.month)[1]
+    end_date = datetime.date(date.year, date.month, days_in_month)
+    templates = get_unexpanded_templates(session, date, department).all()
+    if templates == []:
+        return []
+
+    template_ids = [t.id for t in templates]
+    overrides = (session.query(ShiftOverride)
+                        .filter(ShiftOverride.template_id.in_(template_ids),
+                                ShiftOverride.date >= calendar_date,
+                                ShiftOverride.date <= end_date)
+                        .all())
+    overrides = dict(((o.template_id, o.date), o) for o in overrides)
+    schedule_tuples = get_template_schedules(templates, overrides,
+                                             calendar_date)
+    schedules = insert_schedules(session, schedule_tuples)
+    session.add_all([TemplateExpansion(id, calendar_date)
+                     for id in template_ids])
+    commit(session)
+    return schedules
+
+
+def skip_template_date(session, template_id, date):
+    """Skip a shift template on a date, removing its schedule if expanded.
+
+    If the month of the date has already been expanded, the schedule the
+    template created on the date is deleted along with adding the override.
+    The schedule is told by its department and times, and an unassigned one
+    is deleted before one with an employee.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        template_id: Primary key of the ShiftTemplate to skip.
+        date: datetime.date to skip the template on.
+    Returns:
+        A list of (id, schedule_date, department, employee_id) of the 
+        deleted schedule, empty if the month has not been expanded yet.
+    Raises:
+        ValueError: If the template is not worked on the date, or its 
+            schedule of the date has been changed or removed since the 
+            month was expanded.
+    """
+
+    template = session.query(ShiftTemplate).get(template_id)
+    if (date < template.start_date 
+        or not template.is_on_weekday(date.weekday())):
+        raise ValueError("The shift is not worked on %s." % date)
+    override = (session.query(ShiftOverride)
+                       .filter(ShiftOverride.template_id == template_id,
+                               ShiftOverride.date == date)
+                       .first())
+    if override and override.is_skipped():
+        return []
+    start_time, end_time = template.start_time, template.end_time
+    if override:
+        start_time, end_time = override.start_time, override.end_time
+    calendar_date = datetime.date(date.year, date.month, 1)
+    expanded = (session.query(TemplateExpansion)
+                       .filter(TemplateExpansion.template_id == template_id,
+                               TemplateExpansion.calendar_date 
+                               == calendar_date)
+                       .count())
+    deleted = []
+    if expanded:
+        start = datetime.datetime.combine(date, start_time)
+        end = datetime.datetime.combine(date, end_time)
+        schedule = (session.query(Schedule)
+                           .filter(Schedule.department 
+                                   == template.department,
+                                   Schedule.start_datetime == start,
+                                   Schedule.end_datetime == end)
+                           .order_by(Schedule.employee_id != None, 
+                                     Schedule.id)
+                           .first())
+        if schedule is None:
+            raise ValueError("The schedule of the shift on %s has been "
+                             "changed or removed, remove it from the "
+                             "calendar instead." % date)
+        deleted.append((schedule.id, schedule.schedule_date, 
+                        schedule.department, schedule.employee_id))
+        session.delete(schedule)
+    if override:
+        override.start_time = override.end_time = None
+    else:
+        session.add(ShiftOverride(template_id, date))
+    commit(session)
+    return deleted
+
+
+def main():
+    """Expand the shift templates of a month from the command line."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('db_name', help="database name without .db")
+    parser.add_argument('month', help="month to expand as YYYY-MM")
+    parser.add_argument('--department', default=None,
+                        help="only expand templates of this department")
+    args = parser.parse_args()
+
+    date = datetime.datetime.strptime(args.month, "%Y-%m").date()
+    session = start_db(args.db_name)
+    schedules = expand_templates(session, date, args.department)
+    print("Created %s schedules" % len(schedules))
+
+
+if __name__ == '__main__':
+    main()
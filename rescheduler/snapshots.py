@@ -0,0 +1,611 @@
+"""
+Module for read-only snapshots of schedules, employees and vacations
+
+The calendar and employee list render from snapshots rather than ORM
+objects. A snapshot is a small immutable record with __slots__ and no
+instrumentation, so reading it can never trigger a lazy load, and a month
+of them takes a fraction of the memory of mapped objects. Snapshots are
+built in bulk by plain column queries, one query for each kind of record,
+and a change is made by replacing a snapshot with an updated copy. The
+schedules around a month are also kept in a MonthColumns store for the
+passes over the whole month that costs and eligibility need.
+"""
+
+import datetime
+from sqlalchemy import select
+from orm_models import (Schedule, Employee, Vacation, get_slot_mask, 
+                        get_day_slot_masks, schedule_cost, 
+                        get_schedule_minutes, get_week_start)
+from core_reads import (select_schedules, select_unavailable_times,
+                        select_week_minutes)
+from month_columns import MonthColumns
+
+
+class Snapshot(object):
+    """Base of immutable records whose fields are their __slots__."""
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        """Set each field in order of __slots__ to the value given."""
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read-only" % type(self).__name__)
+
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is read-only" % type(self).__name__)
+
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __repr__(self):
+        fields = ", ".join("%s=%r" % (name, getattr(self, name))
+                           for name in self.__slots__)
+        return "%s(%s)" % (type(self).__name__, fields)
+
+
+    def values(self):
+        """Return tuple of the values of every field."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+
+    def replace(self, **values):
+        """Return a copy of this snapshot with some fields changed."""
+        return type(self)(*[values.get(name, getattr(self, name))
+                            for name in self.__slots__])
+
+
+
+class ScheduleSnapshot(Snapshot):
+    """Snapshot of a schedule with the wage of its assigned employee."""
+
+    __slots__ = ('id', 'calendar_date', 'schedule_date', 'start_datetime',
+                 'end_datetime', 'start_time', 'end_time', 'department',
+                 's_undetermined_time', 'e_undetermined_time', 'employee_id',
+                 'wage')
+
+    def cost(self):
+        """Calculate the cost of this schedule given assigned employee."""
+        if self.employee_id == None or self.wage == None:
+            return 0
+        return schedule_cost(self.start_datetime, self.end_datetime,
+                             self.wage)
+
+
+    def overlaps(self, start, end):
+        """Return True if this schedule overlaps the time from start to end."""
+        return self.start_datetime < end and start < self.end_datetime
+
+
+
+class EmployeeSnapshot(Snapshot):
+    """Snapshot of an employee with its repeating unavailability masks.
+
+    id is the primary key schedules and vacations refer to the employee by.
+    unav_masks is a tuple of 7 slot bitmasks as returned by
+    Employee.get_unav_masks, Monday at index 0.
+    """
+
+    __slots__ = ('id', 'employee_id', 'first_name', 'last_name',
+                 'primary_department', 'alternate1_department',
+                 'alternate2_department', 'wage', 'scheduled_hours',
+                 'overtime', 'unav_masks')
+
+    def works_in(self, department):
+        """Return True if the employee can work in the department."""
+        return department in (self.primary_department,
+                              self.alternate1_department,
+                              self.alternate2_department)
+
+
+
+class DirectoryEntry(Snapshot):
+    """Entry of an employee in the employee directory.
+
+    The directory has what display strings and costs need of an employee,
+    so it is only loaded again when an employee is saved or removed, not 
+    when their vacations or repeating unavailability change.
+    """
+
+    __slots__ = ('id', 'employee_id', 'first_name', 'last_name',
+                 'primary_department', 'wage')
+
+    def get_name(self):
+        """Return the full name of the employee."""
+        return self.first_name + " " + self.last_name
+
+
+
+class VacationSnapshot(Snapshot):
+    """Snapshot of a vacation of an employee."""
+
+    __slots__ = ('id', 'employee_id', 'start_datetime', 'end_datetime')
+
+
+
+def load_schedule_snapshots(session, *criteria):
+    """Return list of ScheduleSnapshot of schedules matching criteria.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        criteria: Clauses on the schedules table to filter by.
+    """
+
+    columns = [name for name in ScheduleSnapshot.__slots__ if name != 'wage']
+    return [ScheduleSnapshot(*row) 
+            for row in select_schedules(session, columns, criteria, 
+                                        wage=True)]
+
+
+def get_schedule_snapshot(schedule, wage=None):
+    """Return ScheduleSnapshot of a schedule object already loaded.
+
+    Args:
+        schedule: A schedule object, such as one just created.
+        wage: Number wage of the assigned employee, None if unassigned.
+    """
+
+    return ScheduleSnapshot(*[getattr(schedule, name) 
+                              for name in ScheduleSnapshot.__slots__
+                              if name != 'wage'] + [wage])
+
+
+def load_employee_snapshots(session):
+    """Return dict of primary key to EmployeeSnapshot of every employee.
+
+    The repeating unavailability of all employees is read with one more
+    query and compiled into the masks of each snapshot.
+    """
+
+    masks = {}
+    for employee_id, id, weekday, start, end in select_unavailable_times(
+                                                    session):
+        employee_masks = masks.setdefault(employee_id, [0] * 7)
+        employee_masks[weekday] |= get_slot_mask(start, end)
+    employees = Employee.__table__
+    columns = [employees.c[name] for name in EmployeeSnapshot.__slots__
+               if name != 'unav_masks']
+    snapshots = {}
+    for row in session.execute(select(columns)):
+        unav_masks = tuple(masks.get(row.id, [0] * 7))
+        snapshots[row.id] = EmployeeSnapshot(*(tuple(row) + (unav_masks,)))
+    return snapshots
+
+
+def load_employee_directory(session):
+    """Return dict of primary key to DirectoryEntry of every employee."""
+    employees = Employee.__table__
+    query = select([employees.c[name] for name in DirectoryEntry.__slots__])
+    return dict((row.id, DirectoryEntry(*row)) 
+                for row in session.execute(query))
+
+
+def load_vacation_snapshots(session):
+    """Return dict of employee primary key to list of VacationSnapshot."""
+    vacations = Vacation.__table__
+    query = (select([vacations.c[name]
+                     for name in VacationSnapshot.__slots__])
+             .order_by(vacations.c.start_datetime))
+    snapshots = {}
+    for row in session.execute(query):
+        vacation = VacationSnapshot(*row)
+        snapshots.setdefault(vacation.employee_id, []).append(vacation)
+    return snapshots
+
+
+
+class MonthSnapshot(object):
+    """Snapshots of the schedules a calendar of a month displays.
+
+    Snapshots are kept of the schedules of the calendar's department. The
+    schedules of every department from a day before the month to a day
+    after it are kept in columns, as these are all the schedules that can
+    overlap a schedule of the month or add to the cost of the month.
+    Employees and vacations are read from the read model cache so that
+    changes on the employee page are seen straight away.
+
+    A month opened from a month file also has the display string and
+    eligibility tiers of each schedule saved with it. These are used until
+    any schedule or employee changes.
+
+    Attributes:
+        session: An sqlalchemy session object using sqlite3.
+        read_cache: ReadModelCache with the 'employees', 'vacations' and
+            'employee_directory' read models.
+        date: datetime.date of the first day of the month.
+        dep: String name of the department of the calendar.
+        schedules: dict of schedule primary keys to ScheduleSnapshot of the
+            schedules of the department in the month.
+        columns: MonthColumns of the schedules of every department from a
+            day before the month to a day after it.
+        saved_views: dict of schedule primary keys to a tuple of the 
+            display string and a dict of employee primary keys to the
+            availability flag of each eligable employee, saved in a month
+            file.
+        saved_employees: The 'employees' read model saved_views were
+            worked out from.
+        week_minutes: dict of the Sunday starting a week to the dict of
+            select_week_minutes of the week, read once and then kept up to
+            date by every change made to the snapshot, so that hours are
+            right before a queued write of the change is committed.
+    """
+
+    def __init__(self, session, read_cache, date, department, load=True):
+        """Initialize and load the snapshots of the month of date.
+
+        Args:
+            session: An sqlalchemy session object using sqlite3.
+            read_cache: ReadModelCache of the employees and vacations.
+            date: datetime.date object of the month and year.
+            department: String name of the department of the calendar.
+            load: Boolean to load the schedules from the database, False 
+                to leave the snapshot empty to be filled from a month file.
+        """
+
+        self.session = session
+        self.read_cache = read_cache
+        self.date = datetime.date(date.year, date.month, 1)
+        self.dep = department
+        self.schedules = {}
+        self.columns = MonthColumns(self.date)
+        self.saved_views = {}
+        self.saved_employees = None
+        self.week_minutes = {}
+
+        if load:
+            self.load_schedules()
+
+
+    def load_schedules(self):
+        """Load the schedules around the month in one query."""
+        self.schedules = {}
+        self.columns = MonthColumns(self.date)
+        self.saved_views = {}
+        self.week_minutes = {}
+        next_month = (self.date + datetime.timedelta(days=31)).replace(day=1)
+        start = self.date - datetime.timedelta(days=1)
+        for s in load_schedule_snapshots(self.session,
+                                         Schedule.schedule_date >= start,
+                                         Schedule.schedule_date <= next_month):
+            self.columns.append(s)
+            if s.calendar_date == self.date and s.department == self.dep:
+                self.schedules[s.id] = s
+
+
+    def reload_day(self, date):
+        """Load the department's schedules of a day again after a change.
+
+        Args:
+            date: datetime.date of the day to reload.
+        """
+
+        for s in self.get_day_schedules(date):
+            self.remove_schedule(s.id)
+        for s in load_schedule_snapshots(self.session,
+                                         Schedule.schedule_date == date,
+                                         Schedule.department == self.dep):
+            self.set_schedule(s)
+
+
+    def load_schedule(self, id):
+        """Load a schedule added to the database and return its snapshot.
+
+        Args:
+            id: Primary key of the schedule.
+        """
+
+        schedule = load_schedule_snapshots(self.session,
+                                           Schedule.id == id)[0]
+        self.set_schedule(schedule)
+        return schedule
+
+
+    def set_schedule(self, schedule):
+        """Add or replace the snapshot of a schedule of the department."""
+        if (schedule.calendar_date == self.date 
+            and schedule.department == self.dep):
+            self.add_week_minutes(self.schedules.get(schedule.id), -1)
+            self.add_week_minutes(schedule, 1)
+            self.schedules[schedule.id] = schedule
+            self.columns.append(schedule)
+            self.saved_views = {}
+
+
+    def remove_schedule(self, id):
+        """Remove the snapshot of a schedule if there is one."""
+        schedule = self.schedules.pop(id, None)
+        if schedule:
+            self.add_week_minutes(schedule, -1)
+            self.columns.delete(id)
+            self.saved_views = {}
+
+
+    def add_week_minutes(self, schedule, sign):
+        """Add or subtract a schedule's minutes to the week it is in.
+
+        Args:
+            schedule: ScheduleSnapshot, nothing is done if None, unassigned
+                or its week has not been read.
+            sign: 1 to add the minutes, -1 to subtract them.
+        """
+
+        if schedule is None or schedule.employee_id is None:
+            return
+        week_start = get_week_start(schedule.schedule_date)
+        minutes = self.week_minutes.get(week_start)
+        if minutes is not None:
+            e_id = schedule.employee_id
+            minutes[e_id] = (minutes.get(e_id, 0)
+                             + sign * get_schedule_minutes(
+                                          schedule.start_datetime,
+                                          schedule.end_datetime))
+
+
+    def get_week_minutes(self, week_start):
+        """Return dict of employee primary key to minutes of a week.
+
+        Args:
+            week_start: datetime.date of the Sunday starting the week.
+        """
+
+        if week_start not in self.week_minutes:
+            self.week_minutes[week_start] = select_week_minutes(self.session,
+                                                                week_start)
+        return self.week_minutes[week_start]
+
+
+    def clear_week_minutes(self):
+        """Read the minutes of each week again, after the database changes
+        schedules that are not in the snapshot."""
+        self.week_minutes = {}
+
+
+    def set_employee(self, id, employee_id):
+        """Replace a schedule's snapshot with one assigned to an employee.
+
+        Args:
+            id: Primary key of the schedule.
+            employee_id: Primary key of the employee to assign, or None.
+        Returns:
+            The new ScheduleSnapshot of the schedule.
+        """
+
+        employee = self.get_directory().get(employee_id)
+        wage = employee.wage if employee else None
+        schedule = self.schedules[id].replace(employee_id=employee_id,
+                                              wage=wage)
+        # Read before the change is written, so it is only added once
+        self.get_week_minutes(get_week_start(schedule.schedule_date))
+        self.set_schedule(schedule)
+        return schedule
+
+
+    def remove_employee(self, employee_id):
+        """Unassign the snapshots of the schedules of a deleted employee.
+
+        The month's columns, and so its costs, are updated in one pass.
+
+        Args:
+            employee_id: Primary key of the deleted employee.
+        Returns:
+            A list of the new ScheduleSnapshot of the department's schedules
+            that were unassigned.
+        """
+
+        unassigned = []
+        for minutes in self.week_minutes.itervalues():
+            minutes.pop(employee_id, None)
+        for id in self.columns.unassign_employee(employee_id):
+            if id in self.schedules:
+                schedule = self.schedules[id].replace(employee_id=None,
+                                                      wage=None)
+                self.schedules[id] = schedule
+                unassigned.append(schedule)
+        self.saved_views = {}
+        return unassigned
+
+
+    def set_employee_wage(self, employee_id, wage):
+        """Price the schedules of an employee whose wage changed.
+
+        The month's columns, and so its costs, are updated in one pass.
+
+        Args:
+            employee_id: Primary key of the employee.
+            wage: Number new wage of the employee.
+        """
+
+        for id in self.columns.set_employee_wage(employee_id, wage):
+            if id in self.schedules:
+                self.schedules[id] = self.schedules[id].replace(wage=wage)
+
+
+    def remove_department(self, department):
+        """Remove the snapshots of the schedules of a deleted department.
+
+        Args:
+            department: String name of the deleted department.
+        """
+
+        self.columns.delete_department(department)
+        self.clear_week_minutes()
+        if department == self.dep:
+            self.schedules = {}
+            self.saved_views = {}
+
+
+    def get_day_schedules(self, date):
+        """Return snapshots of the schedules of a day sorted by start time."""
+        day_index = (date - self.date).days
+        return [self.schedules[id] 
+                for id in self.columns.get_day_ids(self.dep, day_index)]
+
+
+    def get_employees(self):
+        """Return dict of primary key to EmployeeSnapshot of all employees."""
+        return self.read_cache.get('employees')
+
+
+    def get_directory(self):
+        """Return dict of primary key to DirectoryEntry of all employees."""
+        return self.read_cache.get('employee_directory')
+
+
+    def get_saved_view(self, id):
+        """Return the saved view of a schedule, None if it may be stale.
+
+        Args:
+            id: Primary key of the schedule.
+        Returns:
+            A tuple of the display string and dict of employee primary keys
+            to availability flag, or None.
+        """
+
+        if id not in self.saved_views:
+            return None
+        if self.get_employees() is not self.saved_employees:
+            self.saved_views = {}
+            return None
+        return self.saved_views[id]
+
+
+    def get_schedule_str(self, schedule):
+        """Get str displaying start and end times and employee if assigned.
+
+        Args:
+            schedule: A ScheduleSnapshot.
+        Returns:
+            str: A string representing the string version of the schedule to
+            be displayed by the view.
+        """
+
+        view = self.get_saved_view(schedule.id)
+        if view:
+            return view[0]
+        if schedule.s_undetermined_time:
+            start_str = "?"
+        else:
+            start_str = schedule.start_datetime.strftime("%I:%M")
+        if schedule.e_undetermined_time:
+            end_str = "?"
+        else:
+            end_str = schedule.end_datetime.strftime("%I:%M")
+        str = start_str + " - " + end_str
+        if schedule.employee_id != None:
+            employee = self.get_directory()[schedule.employee_id]
+            str += "  " + employee.first_name
+        return str
+
+
+    def get_views(self):
+        """Return the view of each schedule of the department to save.
+
+        Returns:
+            A dict like saved_views of every schedule of the department.
+        """
+
+        employees = [e for e in self.get_employees().itervalues()
+                     if e.works_in(self.dep)]
+        views = {}
+        for id, schedule in self.schedules.iteritems():
+            availabilities = self.get_availabilities(employees, schedule)
+            flags = dict(zip([e.id for e in employees], 
+                             availabilities))
+            views[id] = (self.get_schedule_str(schedule), flags)
+        return views
+
+
+    def get_availabilities(self, employees, schedule):
+        """Get availability of each of some employees given schedule.
+
+        The same as Employee.get_availability, but from snapshots. Who is
+        working at the time of the schedule is found in one pass over the
+        columns of the month for all the employees, and the hours each has
+        in the week of the schedule from the week's minutes of the snapshot.
+
+        Args:
+            employees: list of EmployeeSnapshot of the employees.
+            schedule: ScheduleSnapshot of a schedule of the month.
+        Returns:
+            A list parallel to employees of the flags '(S)', '(V)', '(U)', 
+            '(O)' or '(A)'.
+        """
+
+        view = self.get_saved_view(schedule.id)
+        if view and all(e.id in view[1] for e in employees):
+            return [view[1][e.id] for e in employees]
+        start, end = schedule.start_datetime, schedule.end_datetime
+        busy = self.columns.get_busy_employees(start, end, schedule.id)
+        vacations = self.read_cache.get('vacations')
+        day_masks = get_day_slot_masks(start, end)
+        week_start = get_week_start(schedule.schedule_date)
+        minutes = get_schedule_minutes(start, end)
+        availabilities = []
+        for e in employees:
+            if e.id in busy:
+                availabilities.append('(S)')
+            elif any(start < v.end_datetime and v.start_datetime < end
+                     for v in vacations.get(e.id, [])):
+                availabilities.append('(V)')
+            elif any(e.unav_masks[weekday] & slot_mask
+                     for weekday, slot_mask in day_masks):
+                availabilities.append('(U)')
+            elif self.is_overtime(e, schedule, week_start, minutes):
+                availabilities.append('(O)')
+            else:
+                availabilities.append('(A)')
+        return availabilities
+
+
+    def is_overtime(self, employee, schedule, week_start, minutes):
+        """Return True if a schedule puts an employee into overtime.
+
+        The same as Employee.calculate_weekly_hours compared to overtime.
+
+        Args:
+            employee: EmployeeSnapshot of the employee.
+            schedule: ScheduleSnapshot of a schedule of the month.
+            week_start: datetime.date of the Sunday starting its week.
+            minutes: int minutes of the schedule.
+        """
+
+        if employee.overtime is None:
+            return False
+        scheduled = self.get_week_minutes(week_start).get(employee.id, 0)
+        if schedule.employee_id != employee.id:
+            scheduled += minutes
+        return scheduled / 60.0 > employee.overtime
+
+
+    def get_month_hours(self):
+        """Return dict of employee primary key to hours of the month.
+
+        The hours are summed in one pass over the month's columns, so they
+        include changes whose writes are still queued.
+        """
+
+        return dict((id, minutes / 60.0) for id, minutes 
+                    in self.columns.get_employee_minutes().iteritems())
+
+
+    def get_availability(self, employee, schedule):
+        """Get availability of employee given schedule.
+
+        Args:
+            employee: EmployeeSnapshot of the employee.
+            schedule: ScheduleSnapshot of a schedule of the month.
+        Returns:
+            One of the flags '(S)', '(V)', '(U)', '(O)' or '(A)'.
+        """
+
+        return self.get_availabilities([employee], schedule)[0]
@@ -0,0 +1,181 @@
+"""
+Module for the staffing requirements page.
+"""
+
+import Tkinter as tk
+import ttk
+import tkMessageBox
+import datetime
+from datetime_widgets import TimeEntry
+from orm_models import StaffingRequirement
+
+MEDIUM_FONT = ('Tahoma', 12, tk.NORMAL)
+
+class StaffingPage:
+    """
+    Staffing page acts as a simple add and remove listbox. It adds minimum
+    staffing requirements to the database, the number of employees a 
+    department needs assigned to schedules during a time of a day of the week.
+    These requirements are then used to report every time in the calendar's 
+    month where a department is understaffed.
+    """
+
+    DAYS_TO_NUM = {'Sunday':6, 'Monday':0, 'Tuesday':1, 'Wednesday':2,
+                   'Thursday':3, 'Friday':4, 'Saturday':5}
+
+    def __init__(self, master, session, calendar_page):
+        """Initialize StaffingPage and the different composite widgets."""
+        self.master = master
+        self.session = session
+        self.cal = calendar_page
+        
+        self.page_frame = tk.Frame(self.master, borderwidth=1, 
+                                   relief=tk.RIDGE)
+        self.page_frame.pack()
+        
+        self.title = tk.Label(self.page_frame, 
+                              text="Minimum Staffing Requirements",
+                              font=MEDIUM_FONT)
+        self.title.pack()
+        
+        self.requirement_lb = tk.Listbox(self.page_frame, 
+                                         height=22, width=45, 
+                                         font=MEDIUM_FONT)
+        self.requirement_lb.pack()
+        
+        self.remove_requirement_b = ttk.Button(self.page_frame, 
+                                               text='Remove Requirement',  
+                                               command=self.remove_requirement)
+        self.remove_requirement_b.pack(pady=8)
+        
+        # Widgets for adding a staffing requirement
+        self.add_frame = ttk.LabelFrame(self.page_frame, 
+                                        text='Add Requirement')
+        self.add_frame.pack(pady=12)
+        
+        self.dep_label = tk.Label(self.add_frame, 
+                                  text="Department: ", 
+                                  font=MEDIUM_FONT)
+        self.dep_label.grid(row=0, column=0)
+        dep_list = self.cal.read_cache.get('departments')
+        self.dep_var = tk.StringVar(self.add_frame)
+        self.dep_var.set(dep_list[0])
+        self.dep_cb = ttk.Combobox(self.add_frame, 
+                                   textvariable=self.dep_var,
+                                   values=dep_list,
+                                   width=12,
+                                   state='readonly')
+        self.dep_cb.grid(row=0, column=1)
+        
+        self.weekday_label = tk.Label(self.add_frame, 
+                                      text="Weekday: ", 
+                                      font=MEDIUM_FONT)
+        self.weekday_label.grid(row=1, column=0)
+        self.weekday_var = tk.StringVar(self.add_frame)
+        self.weekday_var.set('Saturday')
+        self.weekday_cb = ttk.Combobox(self.add_frame, 
+                                       textvariable=self.weekday_var,
+                                       values=('Sunday', 'Monday', 
+                                               'Tuesday', 'Wednesday',
+                                               'Thursday', 'Friday', 
+                                               'Saturday'),
+                                       width=12,
+                                       state='readonly')
+        self.weekday_cb.grid(row=1, column=1)
+        
+        self.start_label = tk.Label(self.add_frame, 
+                                    text="Start Time: ", 
+                                    font=MEDIUM_FONT)
+        self.start_label.grid(row=2, column=0)
+        self.start_te = TimeEntry(self.add_frame)
+        self.start_te.grid(row=2, column=1)
+        
+        self.end_label = tk.Label(self.add_frame, 
+                                  text="End Time: ", 
+                                  font=MEDIUM_FONT)
+        self.end_label.grid(row=3, column=0)
+        self.end_te = TimeEntry(self.add_frame)
+        self.end_te.grid(row=3, column=1)
+        
+        self.needed_label = tk.Label(self.add_frame, 
+                                     text="Employees Needed: ", 
+                                     font=MEDIUM_FONT)
+        self.needed_label.grid(row=4, column=0)
+        self.needed_var = tk.StringVar(self.add_frame)
+        self.needed_sb = tk.Spinbox(self.add_frame, from_=1, to=50, 
+                                    width=4,
+                                    font=MEDIUM_FONT, 
+                                    textvariable=self.needed_var)
+        self.needed_sb.grid(row=4, column=1, sticky=tk.W)
+        
+        self.add_requirement_b = ttk.Button(self.add_frame, 
+                                            text='Add Requirement',  
+                                            command=self.add_requirement)
+        self.add_requirement_b.grid(row=5, column=0, columnspan=2, pady=12)
+        
+        # Parallel list to the requirements in the listbox
+        self.requirements = []
+        self.load_requirements()
+        
+        
+    def load_requirements(self):
+        """Load requirements from database into listbox and parallel list."""
+        self.requirement_lb.delete(0, tk.END)
+        requirements = self.session.query(StaffingRequirement).all()
+        requirements.sort(key=lambda r: r.start_time)
+        requirements.sort(key=lambda r: r.weekday)
+        requirements.sort(key=lambda r: r.department)
+        for r in requirements:
+            self.requirement_lb.insert(tk.END, r.get_str())
+        self.requirements = [r.id for r in requirements]
+        
+        
+    def add_requirement(self):
+        """Queue requirement in the widgets to the database, list once saved.
+        
+        An end time of 12:00 AM is midnight at the end of the day.
+        """
+        
+        start_time = self.start_te.get_time()
+        end_time = self.end_te.get_time()
+        needed = int(self.needed_var.get())
+        if start_time < end_time or end_time == datetime.time(0, 0):
+            weekday = self.DAYS_TO_NUM[self.weekday_var.get()]
+            department = self.dep_var.get()
+            
+            def write(session):
+                session.add(StaffingRequirement(department, weekday,
+                                                start_time, end_time, 
+                                                needed))
+                
+            self.cal.write_queue.submit(write, self.requirements_saved,
+                                        self.save_failed)
+        
+        
+    def remove_requirement(self):
+        """Queue removal of selected requirement, list once removed."""
+        if self.requirement_lb.curselection() == ():
+            return
+        index = self.requirement_lb.curselection()[0]
+        requirement_id = self.requirements[index]
+        
+        def write(session):
+            (session.query(StaffingRequirement)
+                    .filter(StaffingRequirement.id == requirement_id)
+                    .delete(synchronize_session=False))
+                    
+        self.cal.write_queue.submit(write, self.requirements_saved,
+                                    self.save_failed)
+        
+        
+    def requirements_saved(self, result):
+        """Show the requirements in the database once a write is committed."""
+        self.load_requirements()
+        
+        self.cal.read_cache.invalidate('staffing_requirements')
+        self.cal.update_staffing_gaps()
+        
+        
+    def save_failed(self, error):
+        """Tell the user the requirement could not be saved."""
+        tkMessageBox.showerror("Could Not Save Requirement", str(error))
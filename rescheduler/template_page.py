@@ -0,0 +1,235 @@
+"""
+Module for the weekly shift templates page.
+"""
+
+import Tkinter as tk
+import ttk
+import tkMessageBox
+import datetime
+from datetime_widgets import TimeEntry, DateEntry
+from orm_models import ShiftTemplate
+from shift_templates import skip_template_date
+
+MEDIUM_FONT = ('Tahoma', 12, tk.NORMAL)
+
+class TemplatePage:
+    """
+    Template page acts as a simple add and remove listbox. It adds shifts
+    that a department works every week to the database, which are expanded
+    into schedules for each month the calendar displays. A shift can be
+    skipped on a single date, such as a holiday, which also removes its
+    schedule of that date if its month has already been expanded.
+    """
+
+    WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+                'Saturday', 'Sunday']
+
+    def __init__(self, master, session, calendar_page):
+        """Initialize TemplatePage and the different composite widgets."""
+        self.master = master
+        self.session = session
+        self.cal = calendar_page
+
+        self.page_frame = tk.Frame(self.master, borderwidth=1,
+                                   relief=tk.RIDGE)
+        self.page_frame.pack()
+
+        self.title = tk.Label(self.page_frame,
+                              text="Weekly Shift Templates",
+                              font=MEDIUM_FONT)
+        self.title.pack()
+
+        self.template_lb = tk.Listbox(self.page_frame,
+                                      height=16, width=50,
+                                      font=MEDIUM_FONT)
+        self.template_lb.pack()
+
+        self.remove_template_b = ttk.Button(self.page_frame,
+                                            text='Remove Template',
+                                            command=self.remove_template)
+        self.remove_template_b.pack(pady=8)
+
+        # Widgets for skipping the selected template on a date
+        self.skip_frame = ttk.LabelFrame(self.page_frame,
+                                         text='Skip Selected Template')
+        self.skip_frame.pack(pady=6)
+        self.skip_label = tk.Label(self.skip_frame,
+                                   text="Date: ",
+                                   font=MEDIUM_FONT)
+        self.skip_label.grid(row=0, column=0)
+        self.skip_date = DateEntry(self.skip_frame,
+                                   font=MEDIUM_FONT,
+                                   border=0)
+        self.skip_date.grid(row=0, column=1, sticky=tk.W)
+        self.skip_b = ttk.Button(self.skip_frame,
+                                 text='Skip Date',
+                                 command=self.skip_template_date)
+        self.skip_b.grid(row=0, column=2, padx=8)
+
+        # Widgets for adding a shift template
+        self.add_frame = ttk.LabelFrame(self.page_frame,
+                                        text='Add Template')
+        self.add_frame.pack(pady=12)
+
+        self.dep_label = tk.Label(self.add_frame,
+                                  text="Department: ",
+                                  font=MEDIUM_FONT)
+        self.dep_label.grid(row=0, column=0)
+        dep_list = self.cal.read_cache.get('departments')
+        self.dep_var = tk.StringVar(self.add_frame)
+        self.dep_var.set(dep_list[0])
+        self.dep_cb = ttk.Combobox(self.add_frame,
+                                   textvariable=self.dep_var,
+                                   values=dep_list,
+                                   width=12,
+                                   state='readonly')
+        self.dep_cb.grid(row=0, column=1, columnspan=7, sticky=tk.W)
+
+        self.weekday_label = tk.Label(self.add_frame,
+                                      text="Weekdays: ",
+                                      font=MEDIUM_FONT)
+        self.weekday_label.grid(row=1, column=0)
+        self.weekday_vars = []
+        for i, day in enumerate(self.WEEKDAYS):
+            weekday_var = tk.BooleanVar(self.add_frame)
+            weekday_cb = ttk.Checkbutton(self.add_frame,
+                                         onvalue=True,
+                                         offvalue=False,
+                                         variable=weekday_var,
+                                         text=day[:3])
+            weekday_cb.grid(row=1, column=i + 1)
+            self.weekday_vars.append(weekday_var)
+
+        self.start_label = tk.Label(self.add_frame,
+                                    text="Start Time: ",
+                                    font=MEDIUM_FONT)
+        self.start_label.grid(row=2, column=0)
+        self.start_te = TimeEntry(self.add_frame)
+        self.start_te.grid(row=2, column=1, columnspan=7, sticky=tk.W)
+
+        self.end_label = tk.Label(self.add_frame,
+                                  text="End Time: ",
+                                  font=MEDIUM_FONT)
+        self.end_label.grid(row=3, column=0)
+        self.end_te = TimeEntry(self.add_frame)
+        self.end_te.grid(row=3, column=1, columnspan=7, sticky=tk.W)
+
+        self.start_date_label = tk.Label(self.add_frame,
+                                         text="First Date: ",
+                                         font=MEDIUM_FONT)
+        self.start_date_label.grid(row=4, column=0)
+        self.start_date = DateEntry(self.add_frame,
+                                    font=MEDIUM_FONT,
+                                    border=0)
+        self.start_date.grid(row=4, column=1, columnspan=7, sticky=tk.W)
+
+        self.add_template_b = ttk.Button(self.add_frame,
+                                         text='Add Template',
+                                         command=self.add_template)
+        self.add_template_b.grid(row=5, column=0, columnspan=8, pady=12)
+
+        # Parallel list to the templates in the listbox
+        self.templates = []
+        self.load_templates()
+
+
+    def get_date(self, date_entry):
+        """Return datetime.date of a DateEntry, None if it is not valid."""
+        month, day, year = date_entry.get()
+        try:
+            return datetime.date(int(year), int(month), int(day))
+        except ValueError:
+            return None
+
+
+    def load_templates(self):
+        """Load templates from database into listbox and parallel list."""
+        self.template_lb.delete(0, tk.END)
+        templates = self.session.query(ShiftTemplate).all()
+        templates.sort(key=lambda t: t.start_time)
+        templates.sort(key=lambda t: t.department)
+        for t in templates:
+            self.template_lb.insert(tk.END, t.get_str())
+        self.templates = [t.id for t in templates]
+
+
+    def add_template(self):
+        """Queue template in the widgets to the database, list once saved.
+
+        The calendar is drawn again once the template is saved, which
+        expands it for the calendar's month.
+        """
+
+        start_time = self.start_te.get_time()
+        end_time = self.end_te.get_time()
+        start_date = self.get_date(self.start_date)
+        weekdays = 0
+        for i, weekday_var in enumerate(self.weekday_vars):
+            if weekday_var.get():
+                weekdays |= 1 << i
+        if start_time < end_time and weekdays and start_date:
+            department = self.dep_var.get()
+
+            def write(session):
+                session.add(ShiftTemplate(department, weekdays, start_time,
+                                          end_time, start_date))
+
+            def on_success(result):
+                self.load_templates()
+                self.cal.reload_calendar()
+
+            self.cal.write_queue.submit(write, on_success, self.save_failed)
+
+
+    def skip_template_date(self):
+        """Skip the selected template on the date in the widgets.
+
+        The calendar is drawn again if a schedule of the template was
+        deleted, and the user is told if the date cannot be skipped.
+        """
+
+        if self.template_lb.curselection() == ():
+            return
+        date = self.get_date(self.skip_date)
+        if date:
+            index = self.template_lb.curselection()[0]
+            template_id = self.templates[index]
+
+            def write(session):
+                return skip_template_date(session, template_id, date)
+
+            def on_success(deleted):
+                if deleted:
+                    self.cal.reload_calendar()
+
+            def on_error(error):
+                tkMessageBox.showerror("Could Not Skip Date", str(error))
+
+            self.cal.write_queue.submit(write, on_success, on_error)
+
+
+    def save_failed(self, error):
+        """Tell the user the template could not be saved."""
+        tkMessageBox.showerror("Could Not Save Template", str(error))
+
+
+    def remove_template(self):
+        """Queue removal of selected template, list once removed.
+
+        Schedules already created from the template are kept.
+        """
+
+        if self.template_lb.curselection() == ():
+            return
+        index = self.template_lb.curselection()[0]
+        template_id = self.templates[index]
+
+        def write(session):
+            template = session.query(ShiftTemplate).get(template_id)
+            if template:
+                session.delete(template)
+
+        def on_success(result):
+            self.load_templates()
+
+        self.cal.write_queue.submit(write, on_success, self.save_failed)
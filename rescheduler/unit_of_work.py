@@ -0,0 +1,302 @@
+"""
+Module for grouping database changes into units of work
+
+Sessions are created with expire_on_commit=False, so a commit does not make
+every loaded employee and schedule reload on next access. Instead, the few
+things a commit can make stale are kept up to date here: deleted rows are
+removed from the collections of their employee when flushed, and bulk
+statements that bypass the session expire only what they change.
+
+An interactive edit is made inside a transaction block and committed when
+the block exits. Blocks can be nested, an inner block is a savepoint that is
+rolled back on its own if it fails, so a bulk operation like autofill can
+be one transaction of many small steps.
+
+Sessions are kept short-lived so that their identity maps stay small. A
+write is made in a session of its own with session_scope, and the GUI's
+session is closed whenever the calendar changes month, see 
+close_idle_session.
+"""
+
+import contextlib
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import attributes
+from orm_models import (Schedule, Vacation, UnavailableTime, Employee, 
+                        Department, StaffingRequirement, ShiftTemplate,
+                        ShiftOverride, TemplateExpansion)
+
+DEPTH_KEY = 'transaction_depth'
+
+# Employee collection each kind of row of an employee belongs to
+EMPLOYEE_COLLECTIONS = {Schedule: 'schedules',
+                        Vacation: 'unavailable_schedules',
+                        UnavailableTime: 'unav_time_schedules'}
+# Columns of the departments an employee can work in
+DEPARTMENT_COLUMNS = ['primary_department', 'alternate1_department', 
+                      'alternate2_department']
+
+
+@contextlib.contextmanager
+def transaction(session):
+    """Commit changes made in the block together, or none if it fails.
+
+    The outermost block commits when it exits and rolls back if an
+    exception is raised. A block inside another is a savepoint, so if it
+    fails only its own changes are rolled back before the exception is
+    raised to the enclosing block.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+    """
+
+    depth = session.info.get(DEPTH_KEY, 0)
+    session.info[DEPTH_KEY] = depth + 1
+    try:
+        if depth == 0:
+            try:
+                yield session
+                session.commit()
+            except:
+                session.rollback()
+                raise
+        else:
+            savepoint = session.begin_nested()
+            try:
+                yield session
+                savepoint.commit()
+            except:
+                savepoint.rollback()
+                raise
+    finally:
+        session.info[DEPTH_KEY] = depth
+
+
+@contextlib.contextmanager
+def session_scope(session_factory):
+    """Make a new session for the block and close it afterwards.
+
+    The block is a transaction, committed when it exits or rolled back if 
+    an exception is raised.
+
+    Args:
+        session_factory: sessionmaker configured by configure_session_factory.
+    """
+
+    session = session_factory()
+    try:
+        with transaction(session):
+            yield session
+    finally:
+        session.close()
+
+
+def close_idle_session(session):
+    """Close a session unless it has changes or is inside a block.
+
+    Closing releases every object of the identity map, which are detached 
+    but keep their loaded attributes. The session can still be used and
+    loads objects again as needed.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+    Returns:
+        True if the session was closed, False otherwise.
+    """
+
+    if (session.info.get(DEPTH_KEY, 0) 
+        or session.new or session.dirty or session.deleted):
+        return False
+    session.close()
+    return True
+
+
+def commit(session):
+    """Commit the session unless inside a transaction block.
+
+    Inside a block the changes are only flushed, they are committed or
+    rolled back with the block.
+    """
+
+    if session.info.get(DEPTH_KEY, 0):
+        session.flush()
+    else:
+        session.commit()
+
+
+def get_loaded_employees(session, employee_ids=None):
+    """Return employees in the session's identity map.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        employee_ids: Collection of primary keys of employees to return, 
+            None to return every loaded employee.
+    """
+
+    return [obj for obj in session.identity_map.values()
+            if isinstance(obj, Employee)
+            and (employee_ids is None or obj.id in employee_ids)]
+
+
+def expire_employee_schedules(session, employee_ids=None):
+    """Expire loaded schedule collections after a bulk schedule statement.
+
+    Only the schedules collection is expired, and it is only reloaded for
+    an employee when next accessed.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        employee_ids: Collection of primary keys of employees whose 
+            schedules changed, None for every employee.
+    """
+
+    for employee in get_loaded_employees(session, employee_ids):
+        session.expire(employee, ['schedules'])
+
+
+def expunge_schedules(session, ids):
+    """Remove schedules deleted by a bulk statement from the session.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        ids: Collection of primary keys of the deleted schedules.
+    """
+
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Schedule) and obj.id in ids:
+            session.expunge(obj)
+
+
+def expire_employee_rows(session, model, employee_id, deleted_ids=()):
+    """Show a write of another session to the rows of an employee.
+
+    Rows deleted are removed from the session and the employee's loaded
+    collection of the model is expired, to be reloaded when next accessed.
+
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        model: Schedule, Vacation or UnavailableTime, the class of the rows.
+        employee_id: Primary key of the employee of the rows.
+        deleted_ids: Collection of primary keys of the deleted rows.
+    """
+
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, model) and inspect(obj).identity[0] in deleted_ids:
+            session.expunge(obj)
+    for employee in get_loaded_employees(session, [employee_id]):
+        session.expire(employee, [EMPLOYEE_COLLECTIONS[model]])
+        if model is UnavailableTime:
+            employee.invalidate_unav_masks()
+
+
+def expunge_employee(session, employee_id):
+    """Remove an employee deleted by bulk statements from the session.
+    
+    The employee's vacations and repeating unavailability, deleted with 
+    it, are removed too. Its loaded schedules, which were unassigned, are
+    set as unassigned without loading anything.
+    
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        employee_id: Primary key of the deleted employee.
+    """
+    
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Employee):
+            if inspect(obj).identity == (employee_id,):
+                session.expunge(obj)
+        elif obj.__dict__.get('employee_id') != employee_id:
+            continue
+        elif isinstance(obj, Schedule):
+            attributes.set_committed_value(obj, 'employee_id', None)
+            attributes.set_committed_value(obj, 'employee', None)
+        elif isinstance(obj, (Vacation, UnavailableTime)):
+            session.expunge(obj)
+            
+            
+def expunge_department(session, department_id, department=None):
+    """Remove a department deleted by bulk statements from the session.
+    
+    If the rows of the department were deleted too, its schedules, 
+    staffing requirements and shift templates with their overrides and 
+    expansions are removed, and loaded employees who could work in the
+    department are set as no longer working in it.
+    
+    Args:
+        session: An sqlalchemy session object using sqlite3.
+        department_id: Primary key of the deleted department.
+        department: String name of the department if its rows were deleted,
+            None if only the department was.
+    """
+    
+    template_ids = set()
+    for obj in list(session.identity_map.values()):
+        if (isinstance(obj, ShiftTemplate) and department != None
+            and obj.__dict__.get('department') == department):
+            template_ids.add(inspect(obj).identity[0])
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Department):
+            if inspect(obj).identity == (department_id,):
+                session.expunge(obj)
+        elif department == None:
+            continue
+        elif isinstance(obj, Employee):
+            for column in DEPARTMENT_COLUMNS:
+                if obj.__dict__.get(column) == department:
+                    attributes.set_committed_value(obj, column, "None")
+        elif isinstance(obj, (ShiftOverride, TemplateExpansion)):
+            if obj.__dict__.get('template_id') in template_ids:
+                session.expunge(obj)
+        elif isinstance(obj, (Schedule, StaffingRequirement, ShiftTemplate)):
+            if obj.__dict__.get('department') == department:
+                session.expunge(obj)
+                
+                
+def remove_deleted_from_collections(session, flush_context):
+    """Remove rows deleted in a flush from the collections of employees.
+
+    Without expire on commit, a deleted schedule, vacation or repeating
+    unavailability would otherwise stay in the loaded collection of its
+    employee. The collection is replaced without history so that nothing
+    more is flushed.
+    """
+
+    deleted = [obj for obj in session.deleted
+               if type(obj) in EMPLOYEE_COLLECTIONS]
+    if deleted == []:
+        return
+    employees = dict((e.id, e) for e in get_loaded_employees(session))
+    for obj in deleted:
+        # Read without loading, the row of an expired object is gone
+        employee = employees.get(obj.__dict__.get('employee_id'))
+        collection = EMPLOYEE_COLLECTIONS[type(obj)]
+        if employee is None or collection not in employee.__dict__:
+            continue
+        items = [o for o in getattr(employee, collection) if o is not obj]
+        attributes.set_committed_value(employee, collection, items)
+        if isinstance(obj, UnavailableTime):
+            employee.invalidate_unav_masks()
+
+
+def configure_session_factory(session_factory):
+    """Set up a sessionmaker to make sessions for units of work."""
+    session_factory.configure(expire_on_commit=False)
+    event.listen(session_factory, 'after_flush',
+                 remove_deleted_from_collections)
+
+
+def enable_savepoints(engine):
+    """Let SQLAlchemy rather than pysqlite begin transactions on an engine.
+
+    pysqlite does not begin a transaction until the first insert or update
+    and commits before a SAVEPOINT, which breaks nested transactions. The
+    driver's transaction handling is turned off and BEGIN is emitted when
+    SQLAlchemy begins a transaction instead.
+    """
+
+    @event.listens_for(engine, 'connect')
+    def disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def emit_begin(connection):
+        connection.execute('BEGIN')
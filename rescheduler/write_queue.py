@@ -0,0 +1,178 @@
+"""
+Module for writing to the database without blocking the GUI
+
+Writes are queued and run one at a time by a worker thread with its own
+session, and so its own sqlite connection. The GUI updates its own objects
+straight away and is told the outcome of each write by a callback, which is
+called from the Tk main loop since Tk widgets may only be used from the
+thread running it.
+"""
+
+import Queue
+import threading
+import traceback
+from sqlalchemy.orm import sessionmaker, attributes
+from unit_of_work import (DEPTH_KEY, configure_session_factory, 
+                          session_scope, transaction)
+
+POLL_MS = 50
+
+
+class WriteQueue(object):
+    """Queue of database writes run by a worker thread.
+
+    A write is a function that takes a session and makes changes with it,
+    which are committed in one transaction after it returns. Without a widget
+    to poll results from, or while the GUI session is inside a transaction
+    block such as during autofill, a write is instead run straight away
+    within the GUI session.
+
+    Attributes:
+        session: The sqlalchemy session of the GUI.
+        widget: Tk widget whose after method polls for finished writes, None
+            to run every write straight away.
+        session_factory: sessionmaker of the worker's sessions.
+        requests: Queue of (write, on_success, on_error) waiting to be run.
+        results: Queue of (callback, result) of finished writes.
+        worker: The threading.Thread running the writes.
+    """
+
+    def __init__(self, session, widget=None, session_factory=None):
+        """Initialize the queues and start the worker thread.
+
+        Args:
+            session: The sqlalchemy session of the GUI.
+            widget: Tk widget to poll for finished writes with, None to run
+                every write straight away.
+            session_factory: sessionmaker of the worker's sessions, None to
+                make one bound to the engine of session.
+        """
+
+        self.session = session
+        self.widget = widget
+        self.session_factory = session_factory
+        if self.session_factory is None:
+            self.session_factory = sessionmaker(bind=session.bind)
+            configure_session_factory(self.session_factory)
+        self.requests = Queue.Queue()
+        self.results = Queue.Queue()
+        self.worker = None
+        if self.widget:
+            self.worker = threading.Thread(target=self.run_writes)
+            self.worker.daemon = True
+            self.worker.start()
+            self.widget.after(POLL_MS, self.poll)
+
+
+    def submit(self, write, on_success=None, on_error=None):
+        """Queue a write to the database.
+
+        Args:
+            write: Function taking a session to make the changes with, its
+                return value is passed to on_success.
+            on_success: Function called with the result of the write once it
+                is committed, or None.
+            on_error: Function called with the exception if the write fails
+                and is rolled back, or None.
+        """
+
+        if self.worker is None or self.session.info.get(DEPTH_KEY, 0):
+            self.run_now(write, on_success, on_error)
+        else:
+            self.release_session()
+            self.requests.put((write, on_success, on_error))
+
+
+    def run_now(self, write, on_success, on_error):
+        """Run a write within the GUI session and call its callback."""
+        try:
+            with transaction(self.session):
+                result = write(self.session)
+        except Exception as error:
+            traceback.print_exc()
+            if on_error:
+                on_error(error)
+        else:
+            if on_success:
+                on_success(result)
+
+
+    def run_writes(self):
+        """Run queued writes in the worker thread until None is queued."""
+        while True:
+            request = self.requests.get()
+            if request is None:
+                self.requests.task_done()
+                return
+            write, on_success, on_error = request
+            try:
+                with session_scope(self.session_factory) as session:
+                    result = write(session)
+                self.results.put((on_success, result))
+            except Exception as error:
+                traceback.print_exc()
+                self.results.put((on_error, error))
+            finally:
+                self.requests.task_done()
+
+
+    def release_session(self):
+        """End the GUI session's transaction if it has nothing to write.
+
+        A transaction only reading still holds a lock that keeps the worker
+        from committing. Since sessions do not expire on commit this does not
+        reload anything.
+        """
+
+        session = self.session
+        if (not session.info.get(DEPTH_KEY, 0)
+            and not (session.new or session.dirty or session.deleted)):
+            session.commit()
+
+
+    def process_results(self):
+        """Call the callbacks of every finished write."""
+        while True:
+            try:
+                callback, result = self.results.get_nowait()
+            except Queue.Empty:
+                return
+            if callback:
+                callback(result)
+
+
+    def poll(self):
+        """Call callbacks of finished writes then poll again after a while."""
+        # Released first so the callbacks read what the writes committed
+        self.release_session()
+        self.process_results()
+        self.widget.after(POLL_MS, self.poll)
+
+
+    def close(self):
+        """Wait for queued writes to finish and stop the worker thread.
+        
+        Callbacks of writes that finish are not called, as the GUI may 
+        already be destroyed, call process_results to call them.
+        """
+        
+        if self.worker:
+            self.requests.put(None)
+            self.worker.join()
+            self.worker = None
+
+
+
+def set_committed_values(obj, values):
+    """Set attributes of an object as if they had been loaded from the db.
+
+    This lets the GUI show a change a queued write is making without the
+    GUI session writing the change itself when it next flushes.
+
+    Args:
+        obj: An ORM object of the GUI session.
+        values: dict of attribute names to values.
+    """
+
+    for key, value in values.iteritems():
+        attributes.set_committed_value(obj, key, value)
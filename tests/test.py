@@ -11,8 +11,42 @@ sys.path.append(os.path.split(sys.argv[0])[0])
 import unittest
 import orm_models as orm
 import datetime
-from test_doubles import DayModelDummy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateTable
+from test_doubles import DayModelDummy, CalendarDisplayDummy, WidgetDummy
 from calendar_page import EligableModel
+from conflict_report import (find_conflicts, get_overlapping_schedules,
+                             find_vacation_conflicts)
+from schedule_metrics import (MonthCoverage, find_staffing_gaps, 
+                              get_staffing_gaps, get_gap_overlaps,
+                              get_day_percentages)
+from bulk_operations import (create_schedules, get_affected_days, 
+                             clone_schedules, delete_schedules,
+                             remove_employee, remove_department,
+                             count_department_rows)
+from shift_templates import (expand_templates, skip_template_date,
+                             has_unexpanded_templates)
+from unit_of_work import (transaction, commit, session_scope, 
+                          close_idle_session, enable_savepoints,
+                          expire_employee_rows)
+from read_cache import ReadModelCache
+from snapshots import (MonthSnapshot, ScheduleSnapshot, 
+                       get_schedule_snapshot)
+from month_columns import MonthColumns
+from archive import archive_months, get_archive_path, get_archive_table
+from history_file import export_history, import_history, HistoryReader
+from schedule_metrics import get_monthly_costs
+from month_file import (save_month_file, load_month_file, 
+                        remove_month_file, load_read_models, 
+                        get_month_file_path, get_db_path,
+                        is_month_file_current)
+from core_reads import (select_schedules, select_schedule_columns,
+                        select_month_minutes, select_week_minutes,
+                        select_department_costs)
+from write_queue import WriteQueue
+from migrations import upgrade_database, MIGRATIONS
 
 
 def create_department(session, dep):
@@ -138,6 +172,20 @@ def get_overlapping_schedule(session, schedule, time_delta, overlap_style):
         
     else:
         print "Error: Invalid input for overlap_style parameter."
+        
+        
+def create_schedule_object(department):
+    """Return a new schedule object on Feb 14th 2017 from 9 to 5."""
+    return orm.Schedule(datetime.datetime(2017, 2, 14, 9, 0),
+                        datetime.datetime(2017, 2, 14, 17, 0),
+                        False, False, department)
+
+
+def clear_database(session):
+    """Remove every row of every table from the database."""
+    for table in reversed(orm.Base.metadata.sorted_tables):
+        session.execute(table.delete())
+    session.commit()
 
 
         
@@ -267,7 +315,7 @@ class VacationConflictTest(AvailabilityTest):
         start = datetime.datetime(2017, 2, 14, 0, 0, 0)
         end = datetime.datetime(2017, 2, 14, 23, 59, 59)
         vacation = create_vacation(self.session, start, end, 
-                                   self.employee.employee_id)
+                                   self.employee.id)
         availability = self.employee.get_availability(self.schedule)
         self.assertEqual(availability, '(V)', msg='Vacation conflict failed')
           
@@ -283,16 +331,110 @@ class UnavailableConflictTest(AvailabilityTest):
         end_time = datetime.time(16, 0)
         weekday = 1 # Tuesday
         unavailable = create_unavailable(self.session, start_time, end_time, 
-                                         weekday, self.employee.employee_id)
+                                         weekday, self.employee.id)
                                          
         availability = self.employee.get_availability(self.schedule)
         self.assertEqual(availability, '(U)', msg='Unavailable repeat failed')
+        
+        
+    def test_unavailable_mask_invalidation(self):
+        """Unavailable repeat masks are rebuilt when a repeat is added."""
+        weekday = 1 # Tuesday
+        create_unavailable(self.session, datetime.time(13, 0), 
+                           datetime.time(16, 0), weekday, 
+                           self.employee.id)
+        availability = self.employee.get_availability(self.schedule)
+        self.assertEqual(availability, '(A)', msg='Back to back repeat failed')
+        
+        unavailable = orm.UnavailableTime(datetime.time(12, 45), 
+                                          datetime.time(13, 0), weekday,
+                                          self.employee.id)
+        self.employee.add_unav_time(unavailable)
+        self.session.commit()
+        availability = self.employee.get_availability(self.schedule)
+        self.assertEqual(availability, '(U)', msg='Mask invalidation failed')
+        
+        
+    def test_overnight_unavailable_conflict(self):
+        """Assert a schedule past midnight conflicts on the day it ends."""
+        weekday = 1 # Tuesday
+        create_unavailable(self.session, datetime.time(12, 0),
+                           datetime.time(16, 0), weekday, self.employee.id)
+        schedule = create_schedule(self.session, 
+                                   datetime.datetime(2017, 2, 13, 22, 0),
+                                   datetime.datetime(2017, 2, 14, 12, 15),
+                                   self.department.name)
+        availability = self.employee.get_availability(schedule)
+        self.assertEqual(availability, '(U)', msg='Overnight repeat failed')
+        read_cache = ReadModelCache(sessionmaker(bind=self.session.bind))
+        snapshot = MonthSnapshot(self.session, read_cache, 
+                                 datetime.date(2017, 2, 1), 
+                                 self.department.name)
+        employee = read_cache.get('employees')[self.employee.id]
+        self.assertEqual(snapshot.get_availabilities(
+                             [employee], snapshot.schedules[schedule.id]),
+                         ['(U)'])
 
      
         
 class OvertimeConflictTest(AvailabilityTest):
-    """calculate_weekly_hours method has not yet been implemented."""
-    pass
+    """Tests where availability results in an overtime conflict."""
+    
+    def setUp(self):
+        """Assign 6 8-hour schedules in the week of February 14th, 2017."""
+        super(OvertimeConflictTest, self).setUp()
+        self.employee.overtime = 48
+        # The week starts on Sunday the 12th, the 19th starts the next week
+        for day in [12, 13, 15, 16, 17, 18, 19]:
+            schedule = create_schedule(self.session, 
+                                       datetime.datetime(2017, 2, day, 9, 0),
+                                       datetime.datetime(2017, 2, day, 17, 0),
+                                       self.department.name)
+            assign_schedule(self.session, self.employee, schedule)
+            
+            
+    def test_overtime(self):
+        """Assert the schedule puts the employee over 48 hours."""
+        self.assertEqual(self.employee.calculate_weekly_hours(self.schedule),
+                         50)
+        self.assertEqual(self.employee.get_availability(self.schedule), 
+                         '(O)')
+        
+        
+    def test_assigned_schedule(self):
+        """Assert a schedule assigned to the employee is counted once."""
+        assign_schedule(self.session, self.employee, self.schedule)
+        self.assertEqual(self.employee.calculate_weekly_hours(self.schedule),
+                         50)
+        self.employee.overtime = 50
+        self.session.commit()
+        self.assertEqual(self.employee.get_availability(self.schedule), 
+                         '(A)')
+        
+        
+    def test_week_minutes(self):
+        """Assert preloaded minutes of the week are used without a query."""
+        week_start = orm.get_week_start(self.schedule.schedule_date)
+        week_minutes = select_week_minutes(self.session, week_start)
+        # Load the employee's vacations and repeating unavailability
+        self.employee.get_availability(self.schedule, {})
+        statements = []
+        
+        def on_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+            
+        event.listen(self.session.bind, 'before_cursor_execute', on_execute)
+        try:
+            self.assertEqual(self.employee.get_availability(self.schedule, 
+                                                            week_minutes),
+                             '(O)')
+            self.assertEqual(self.employee.calculate_weekly_hours(
+                                 self.schedule, {}), 
+                             2)
+        finally:
+            event.remove(self.session.bind, 'before_cursor_execute', 
+                         on_execute)
+        self.assertEqual(statements, [])
         
         
         
@@ -377,9 +519,6 @@ class GetEligablesTest(unittest.TestCase):
         self.end = self.dt + self.schedule_length
         self.schedule = create_schedule(self.session, self.start, self.end, 
                                         self.dep1.name)
-    
-        self.eligable_model = EligableModel(self.session, self.schedule.id, 
-                                            self.dep1.name, DayModelDummy)
         
         # Create employees
         for i in range(0, 4):
@@ -398,17 +537,17 @@ class GetEligablesTest(unittest.TestCase):
         start_time = datetime.time(12, 0)
         end_time = datetime.time(16, 0)
         unavailable1 = create_unavailable(self.session, start_time, end_time, 
-                                          1, self.employees[1].employee_id)                           
+                                          1, self.employees[1].id)                           
         unavailable2 = create_unavailable(self.session, start_time, end_time, 
-                                          1, self.employees[5].employee_id)
+                                          1, self.employees[5].id)
                                           
         # Create vacation conflicts
         v_start = datetime.datetime(2017, 2, 14, 0, 0, 0)
         v_end = datetime.datetime(2017, 2, 14, 23, 59, 59)
         vacation1 = create_vacation(self.session, v_start, v_end, 
-                                    self.employees[2].employee_id)
+                                    self.employees[2].id)
         vacation2 = create_vacation(self.session, v_start, v_end, 
-                                    self.employees[6].employee_id)
+                                    self.employees[6].id)
                                     
         # Create schedule conflicts
         t_delta = datetime.timedelta(0, 900) # 15 minutes
@@ -420,6 +559,14 @@ class GetEligablesTest(unittest.TestCase):
                                                 t_delta, 'START')
         assign_schedule(self.session, self.employees[3], overlap_sch1)
         assign_schedule(self.session, self.employees[7], overlap_sch2)
+        
+        # Eligables are found from the snapshot of the schedule's month
+        read_cache = ReadModelCache(sessionmaker(bind=self.session.bind))
+        snapshot = MonthSnapshot(self.session, read_cache, self.start.date(),
+                                 self.dep1.name)
+        day_model = DayModelDummy(CalendarDisplayDummy(snapshot))
+        self.eligable_model = EligableModel(self.session, self.schedule.id, 
+                                            self.dep1.name, day_model)
                                     
         
     def testGetEligables(self):
@@ -431,7 +578,7 @@ class GetEligablesTest(unittest.TestCase):
         
         Assert that eligable_model.eligable_id_list is correct, this represents
         a sorted order reference to the database employee entries by their
-        employee_id field.
+        primary keys.
         """
         
         expected_lb_list = [u'A', u'E', u'(U) B', u'(U) F', u'(V) C', u'(V) G', u'(S) D', u'(S) H']
@@ -439,7 +586,8 @@ class GetEligablesTest(unittest.TestCase):
         self.assertEqual(expected_lb_list, eligable_list, 
                          msg='Eligable listbox list not correct.')
         
-        expected_id_list = [0, 4, 1, 5, 2, 6, 3, 7]
+        expected_id_list = [self.employees[i].id 
+                            for i in [0, 4, 1, 5, 2, 6, 3, 7]]
         eligable_id_list = self.eligable_model.eligable_id_list
         self.assertEqual(expected_id_list, eligable_id_list, 
                          msg='Eligable id list is not correct.')
@@ -470,5 +618,1719 @@ class GetEligablesTest(unittest.TestCase):
 
 
         
+class MonthCoverageTest(unittest.TestCase):
+    """
+    Tests for counting schedules in each 15 minute slot of a month.
+    
+    February 14th, 2017 has an assigned schedule from 9 am to 5 pm and an
+    unassigned schedule from 12 pm to 1:30 pm in the 'Front' department, and
+    there is a schedule in the 'Office' department that should be ignored.
+    """
+    
+    def setUp(self):
+        """Create schedules and the coverage for February 2017."""
+        self.session = orm.start_db('35', True)
+        self.employee = create_employee(self.session, 1)
+        self.date = datetime.date(2017, 2, 1)
+        
+        self.sch1 = create_schedule(self.session,
+                                    datetime.datetime(2017, 2, 14, 9, 0),
+                                    datetime.datetime(2017, 2, 14, 17, 0),
+                                    'Front')
+        self.sch2 = create_schedule(self.session,
+                                    datetime.datetime(2017, 2, 14, 12, 0),
+                                    datetime.datetime(2017, 2, 14, 13, 30),
+                                    'Front')
+        create_schedule(self.session, datetime.datetime(2017, 2, 14, 9, 0),
+                        datetime.datetime(2017, 2, 14, 17, 0), 'Office')
+        assign_schedule(self.session, self.employee, self.sch1)
+        self.coverage = MonthCoverage(self.session, self.date, 'Front')
+        
+        
+    def test_day_coverage(self):
+        """Assert slots are counted from start slot up to end slot."""
+        assigned, unassigned = self.coverage.get_day_coverage(13)
+        self.assertEqual(len(assigned), 96)
+        self.assertEqual(assigned[35], 0)
+        self.assertEqual(assigned[36], 1)
+        self.assertEqual(assigned[67], 1)
+        self.assertEqual(assigned[68], 0)
+        self.assertEqual(sum(unassigned), 6)
+        self.assertEqual(unassigned[48:54], [1] * 6)
+        
+        
+    def test_incremental_updates(self):
+        """Assert changes to schedules match reloading the coverage."""
+        self.coverage.get_day_coverage(13)
+        assign_schedule(self.session, self.employee, self.sch2)
+        self.coverage.update_schedule(self.sch2)
+        self.coverage.remove_schedule(self.sch1.id)
+        remove_schedule(self.session, self.sch1)
+        sch3 = create_schedule(self.session, 
+                               datetime.datetime(2017, 2, 20, 8, 0),
+                               datetime.datetime(2017, 2, 20, 9, 0),
+                               'Front')
+        self.coverage.add_schedule(sch3)
+        
+        reloaded = MonthCoverage(self.session, self.date, 'Front')
+        for i in range(28):
+            self.assertEqual(self.coverage.get_day_coverage(i),
+                             reloaded.get_day_coverage(i))
+
+
+    def test_load_columns(self):
+        """Assert coverage counted from columns matches the database."""
+        read_cache = ReadModelCache(sessionmaker(bind=self.session.bind))
+        snapshot = MonthSnapshot(self.session, read_cache, self.date, 'Front')
+        coverage = MonthCoverage(self.session, self.date, 'Front',
+                                 snapshot.columns)
+        self.assertEqual(coverage.assigned_diffs, 
+                         self.coverage.assigned_diffs)
+        self.assertEqual(coverage.unassigned_diffs, 
+                         self.coverage.unassigned_diffs)
+        self.assertEqual(coverage.schedule_slots, 
+                         self.coverage.schedule_slots)
+        
+        
+    def test_overnight_schedules(self):
+        """Assert schedules past midnight count on both days they are on."""
+        overnight = create_schedule(self.session,
+                                    datetime.datetime(2017, 2, 14, 22, 0),
+                                    datetime.datetime(2017, 2, 15, 2, 0),
+                                    'Front')
+        create_schedule(self.session, datetime.datetime(2017, 1, 31, 23, 0),
+                        datetime.datetime(2017, 2, 1, 1, 0), 'Front')
+        create_schedule(self.session, datetime.datetime(2017, 2, 28, 23, 0),
+                        datetime.datetime(2017, 3, 1, 1, 0), 'Front')
+        coverage = MonthCoverage(self.session, self.date, 'Front')
+        unassigned = coverage.get_day_coverage(13)[1]
+        self.assertEqual(unassigned[88:], [1] * 8)
+        unassigned = coverage.get_day_coverage(14)[1]
+        self.assertEqual(unassigned[:9], [1] * 8 + [0])
+        self.assertEqual(coverage.get_day_coverage(0)[1][:5], [1] * 4 + [0])
+        self.assertEqual(coverage.get_day_coverage(27)[1][91:], [0] + [1] * 4)
+
+        self.assertEqual(self.coverage.add_schedule(overnight), [13, 14])
+        assign_schedule(self.session, self.employee, overnight)
+        self.assertEqual(self.coverage.update_schedule(overnight), [13, 14])
+        self.assertEqual(self.coverage.get_day_coverage(14)[0][:9],
+                         [1] * 8 + [0])
+        self.assertEqual(self.coverage.remove_schedule(overnight.id),
+                         [13, 14])
+        self.assertEqual(self.coverage.get_day_coverage(14)[0], [0] * 96)
+
+
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class StaffingGapTest(unittest.TestCase):
+    """
+    Tests for finding times below minimum staffing requirements.
+    
+    'Front' needs 2 employees from 10 am to 6 pm on Saturdays. On Saturday
+    February 18th, 2017 one employee works 9 am to 2 pm and another works 
+    12 pm to 5 pm, so 'Front' is short from 10 am to 12 pm and from 2 pm to 
+    6 pm. Every other Saturday of the month has nobody scheduled.
+    """
+    
+    def setUp(self):
+        """Create the requirement, employees and their schedules."""
+        self.session = orm.start_db('35', True)
+        requirement = orm.StaffingRequirement('Front', 5, 
+                                              datetime.time(10, 0),
+                                              datetime.time(18, 0), 2)
+        self.session.add(requirement)
+        self.session.commit()
+        self.date = datetime.date(2017, 2, 1)
+        
+        for i, hours in enumerate([(9, 14), (12, 17)]):
+            employee = create_employee(self.session, i)
+            schedule = create_schedule(self.session, 
+                                       datetime.datetime(2017, 2, 18, 
+                                                         hours[0], 0),
+                                       datetime.datetime(2017, 2, 18, 
+                                                         hours[1], 0),
+                                       'Front')
+            assign_schedule(self.session, employee, schedule)
+        self.unassigned = create_schedule(self.session,
+                                          datetime.datetime(2017, 2, 18, 
+                                                            16, 0),
+                                          datetime.datetime(2017, 2, 18, 
+                                                            20, 0),
+                                          'Front')
+            
+            
+    def test_find_staffing_gaps(self):
+        """Assert only times with fewer than 2 employees are gaps."""
+        gaps = find_staffing_gaps(self.session, self.date, 'Front')
+        gaps_18th = [g for g in gaps if g.date.day == 18]
+        expected = [(datetime.time(10, 0), datetime.time(12, 0), 1),
+                    (datetime.time(14, 0), datetime.time(17, 0), 1),
+                    (datetime.time(17, 0), datetime.time(18, 0), 0)]
+        self.assertEqual([(g.start_time, g.end_time, g.employees_scheduled)
+                          for g in gaps_18th], expected)
+        # The 4th, 11th and 25th are entirely unstaffed
+        other_days = [g.date.day for g in gaps if g.date.day != 18]
+        self.assertEqual(other_days, [4, 11, 25])
+        self.assertEqual(find_staffing_gaps(self.session, self.date, 
+                                            'Office'), [])
+        
+        
+    def test_gap_overlaps(self):
+        """Assert unassigned schedules are scored by gaps they cover."""
+        gaps = find_staffing_gaps(self.session, self.date, 'Front')
+        overlaps = get_gap_overlaps(self.session, self.date, 'Front', gaps)
+        # 1 hour missing 1 employee and 1 hour missing 2 employees
+        self.assertEqual(overlaps, {self.unassigned.id: 60 + 120})
+
+
+    def test_overnight_schedules(self):
+        """Assert schedules past midnight staff the morning after."""
+        requirement = orm.StaffingRequirement('Front', 6,
+                                              datetime.time(0, 0),
+                                              datetime.time(3, 0), 1)
+        self.session.add(requirement)
+        self.session.commit()
+        employee = create_employee(self.session, 3)
+        schedule = create_schedule(self.session,
+                                   datetime.datetime(2017, 2, 18, 22, 0),
+                                   datetime.datetime(2017, 2, 19, 2, 0),
+                                   'Front')
+        assign_schedule(self.session, employee, schedule)
+        unassigned = create_schedule(self.session,
+                                     datetime.datetime(2017, 2, 25, 23, 0),
+                                     datetime.datetime(2017, 2, 26, 1, 0),
+                                     'Front')
+        gaps = find_staffing_gaps(self.session, self.date, 'Front')
+        sunday_gaps = [(g.date.day, g.start_time, g.end_time)
+                       for g in gaps if g.date.weekday() == 6]
+        self.assertEqual(sunday_gaps,
+                         [(5, datetime.time(0, 0), datetime.time(3, 0)),
+                          (12, datetime.time(0, 0), datetime.time(3, 0)),
+                          (19, datetime.time(2, 0), datetime.time(3, 0)),
+                          (26, datetime.time(0, 0), datetime.time(3, 0))])
+        overlaps = get_gap_overlaps(self.session, self.date, 'Front', gaps)
+        self.assertEqual(overlaps[unassigned.id], 60)
+        self.assertEqual(self.get_snapshot_gaps(), gaps)
+        
+        
+    def test_requirement_until_midnight(self):
+        """Assert a requirement ending at 00:00 lasts until midnight."""
+        requirement = orm.StaffingRequirement('Front', 6,
+                                              datetime.time(20, 0),
+                                              datetime.time(0, 0), 1)
+        self.session.add(requirement)
+        self.session.commit()
+        employee = create_employee(self.session, 3)
+        schedule = create_schedule(self.session,
+                                   datetime.datetime(2017, 2, 19, 20, 0),
+                                   datetime.datetime(2017, 2, 19, 23, 0),
+                                   'Front')
+        assign_schedule(self.session, employee, schedule)
+        unassigned = create_schedule(self.session,
+                                     datetime.datetime(2017, 2, 26, 23, 0),
+                                     datetime.datetime(2017, 2, 27, 1, 0),
+                                     'Front')
+        gaps = find_staffing_gaps(self.session, self.date, 'Front')
+        sunday_gaps = [(g.date.day, g.start_minute, g.end_minute)
+                       for g in gaps if g.date.weekday() == 6]
+        self.assertEqual(sunday_gaps, [(5, 1200, 1440), (12, 1200, 1440),
+                                       (19, 1380, 1440), (26, 1200, 1440)])
+        self.assertEqual(gaps[-1].end_time, datetime.time(0, 0))
+        overlaps = get_gap_overlaps(self.session, self.date, 'Front', gaps)
+        self.assertEqual(overlaps[unassigned.id], 60)
+        self.assertEqual(self.get_snapshot_gaps(), gaps)
+        
+        
+    def test_snapshot_gaps(self):
+        """Assert gaps found from a snapshot match those of the database."""
+        self.assertEqual(self.get_snapshot_gaps(),
+                         find_staffing_gaps(self.session, self.date, 'Front'))
+        
+        
+    def get_snapshot_gaps(self):
+        """Return gaps of 'Front' found from a snapshot of the month."""
+        read_cache = ReadModelCache(sessionmaker(bind=self.session.bind))
+        snapshot = MonthSnapshot(self.session, read_cache, self.date, 'Front')
+        requirements = read_cache.get('staffing_requirements')['Front']
+        return get_staffing_gaps(self.date, requirements,
+                                 snapshot.columns.get_day_intervals('Front'))
+
+
+
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class AggregateTest(unittest.TestCase):
+    """
+    Tests for the aggregate tables of hours and costs kept by triggers.
+    
+    Front schedules of 4 and a half hours are worked from Sunday February 
+    26th, 2017 to Wednesday March 1st, all in one week. Costs count whole 
+    hours like schedule_cost, so each costs 4 hours of wage.
+    """
+    
+    def setUp(self):
+        """Get a session, create 2 employees and the schedules."""
+        self.session = orm.start_db('35', True)
+        self.employee1 = create_employee(self.session, 1, wage=10)
+        self.employee2 = create_employee(self.session, 2, wage=20)
+        starts = [datetime.datetime(2017, 2, 26, 9, 0) 
+                  + datetime.timedelta(days=i) for i in range(4)]
+        self.schedules = create_schedules(self.session,
+                                          [(s, s + datetime.timedelta(
+                                                       hours=4.5),
+                                            False, False, 'Front')
+                                           for s in starts])
+        self.feb = datetime.date(2017, 2, 1)
+        self.mar = datetime.date(2017, 3, 1)
+        self.week = datetime.date(2017, 2, 26)
+        
+        
+    def get_costs(self):
+        """Return dict of (month, department) to cost of the aggregates."""
+        return dict(((c, d), cost) for c, d, cost 
+                    in select_department_costs(self.session, self.feb, 
+                                               self.mar))
+                                               
+                                               
+    def assert_aggregates(self, feb_minutes, mar_minutes, week_minutes, 
+                          costs):
+        """Assert the aggregates equal the given dicts, ignoring zeros."""
+        for aggregates, expected in [
+                (select_month_minutes(self.session, self.feb), feb_minutes),
+                (select_month_minutes(self.session, self.mar), mar_minutes),
+                (select_week_minutes(self.session, self.week), week_minutes),
+                (self.get_costs(), costs)]:
+            self.assertEqual(dict((k, v) for k, v in aggregates.iteritems()
+                                  if v),
+                             expected)
+                             
+                             
+    def test_assignments(self):
+        """Assert assigning, changing and deleting schedules are counted."""
+        e1, e2 = self.employee1.id, self.employee2.id
+        for s in self.schedules:
+            assign_schedule(self.session, self.employee1, s)
+        self.assert_aggregates({e1: 810}, {e1: 270}, {e1: 1080},
+                               {(self.feb, 'Front'): 120,
+                                (self.mar, 'Front'): 40})
+        assign_schedule(self.session, self.employee2, self.schedules[0])
+        self.schedules[1].department = 'Office'
+        self.session.commit()
+        self.assert_aggregates({e1: 540, e2: 270}, {e1: 270}, 
+                               {e1: 810, e2: 270},
+                               {(self.feb, 'Front'): 120,
+                                (self.feb, 'Office'): 40,
+                                (self.mar, 'Front'): 40})
+        remove_schedule(self.session, self.schedules[0])
+        self.employee1.wage = 15
+        self.session.commit()
+        self.assert_aggregates({e1: 540}, {e1: 270}, {e1: 810},
+                               {(self.feb, 'Front'): 60,
+                                (self.feb, 'Office'): 60,
+                                (self.mar, 'Front'): 60})
+        self.assertEqual(get_monthly_costs(self.session, 2017)[1:3], 
+                         [120, 60])
+        
+        
+    def test_backfill(self):
+        """Assert migrating adds the schedules already in the database."""
+        for s in self.schedules[:3]:
+            assign_schedule(self.session, self.employee1, s)
+        assign_schedule(self.session, self.employee2, self.schedules[3])
+        # Schema version 1 had no triggers or aggregates
+        for name in ['schedules_aggregates_insert', 
+                     'schedules_aggregates_delete',
+                     'schedules_aggregates_update_old', 
+                     'schedules_aggregates_update_new',
+                     'employee_aggregates_wage']:
+            self.session.execute("DROP TRIGGER %s" % name)
+        for model in [orm.EmployeeMonthHours, orm.EmployeeWeekHours,
+                      orm.DepartmentMonthCost]:
+            self.session.execute(model.__table__.delete())
+        self.session.execute("PRAGMA user_version = 1")
+        self.session.commit()
+        self.assert_aggregates({}, {}, {}, {})
+        self.session.commit()
+        applied = upgrade_database(self.session.bind, 1)
+        self.assertEqual([m.version for m in applied], [2, 3, 4])
+        e1, e2 = self.employee1.id, self.employee2.id
+        self.assert_aggregates({e1: 810}, {e2: 270}, {e1: 810, e2: 270},
+                               {(self.feb, 'Front'): 120,
+                                (self.mar, 'Front'): 80})
+        assign_schedule(self.session, self.employee2, self.schedules[0])
+        self.assert_aggregates({e1: 540, e2: 270}, {e2: 270}, 
+                               {e1: 540, e2: 540},
+                               {(self.feb, 'Front'): 160,
+                                (self.mar, 'Front'): 80})
+        
+        
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class ConflictReportTest(unittest.TestCase):
+    """
+    Tests for the month-wide report of scheduling conflicts.
+    
+    Employee 1 works February 14th, 2017 from 9 am to 5 pm and from 4 pm to
+    8 pm, and also February 15th from 9 am to 5 pm while on vacation. 
+    Employee 2 is unavailable Tuesdays 12 pm to 4 pm and works February 14th
+    from 9 am to 1 pm, then 1 pm to 3 pm on the 16th, back to back with 
+    nothing.
+    """
+    
+    def setUp(self):
+        """Create employees, their schedules and unavailabilities."""
+        self.session = orm.start_db('35', True)
+        self.employee1 = create_employee(self.session, 1)
+        self.employee2 = create_employee(self.session, 2)
+        
+        def assigned(employee, day, start, end):
+            schedule = create_schedule(self.session, 
+                                       datetime.datetime(2017, 2, day, 
+                                                         start, 0),
+                                       datetime.datetime(2017, 2, day, 
+                                                         end, 0),
+                                       'Front')
+            assign_schedule(self.session, employee, schedule)
+            return schedule
+            
+        self.double1 = assigned(self.employee1, 14, 9, 17)
+        self.double2 = assigned(self.employee1, 14, 16, 20)
+        self.on_vacation = assigned(self.employee1, 15, 9, 17)
+        self.unavailable = assigned(self.employee2, 14, 9, 13)
+        assigned(self.employee2, 16, 13, 15)
+        self.vacation = create_vacation(self.session,
+                                        datetime.datetime(2017, 2, 15, 0, 0),
+                                        datetime.datetime(2017, 2, 15, 23, 59),
+                                        1)
+        self.unav_time = create_unavailable(self.session, 
+                                            datetime.time(12, 0),
+                                            datetime.time(16, 0), 1, 2)
+            
+            
+    def test_find_conflicts(self):
+        """Assert every conflict is reported and nothing else."""
+        conflicts = find_conflicts(self.session, datetime.date(2017, 2, 1),
+                                   datetime.date(2017, 2, 28))
+        found = set((c.flag, c.schedule_id, c.conflict_id) 
+                    for c in conflicts)
+        expected = set([('(S)', self.double1.id, self.double2.id),
+                        ('(S)', self.double2.id, self.double1.id),
+                        ('(V)', self.on_vacation.id, self.vacation.id),
+                        ('(U)', self.unavailable.id, self.unav_time.id)])
+        self.assertEqual(found, expected)
+        self.assertEqual(len(conflicts), 4)
+        
+        
+    def test_date_range(self):
+        """Assert schedules outside the date range are not reported."""
+        conflicts = find_conflicts(self.session, datetime.date(2017, 2, 15),
+                                   datetime.date(2017, 2, 28))
+        self.assertEqual([c.flag for c in conflicts], ['(V)'])
+        
+        
+    def test_overlapping_schedules(self):
+        """Assert only schedules of the employee in the period are found."""
+        start = datetime.datetime(2017, 2, 14, 18, 0)
+        end = datetime.datetime(2017, 2, 15, 10, 0)
+        schedules = get_overlapping_schedules(self.session, 1, start, end)
+        self.assertEqual([s.id for s in schedules], 
+                         [self.double2.id, self.on_vacation.id])
+        schedules = get_overlapping_schedules(self.session, 2, start, end)
+        self.assertEqual(schedules, [])
+        
+        
+    def test_vacation_conflicts(self):
+        """Assert bulk check matches checking each vacation on its own."""
+        vacations = [(1, datetime.datetime(2017, 2, 13, 0, 0),
+                      datetime.datetime(2017, 2, 16, 0, 0)),
+                     (2, datetime.datetime(2017, 2, 16, 0, 0),
+                      datetime.datetime(2017, 2, 16, 23, 59)),
+                     (1, datetime.datetime(2017, 2, 14, 17, 0),
+                      datetime.datetime(2017, 2, 14, 18, 0)),
+                     (2, datetime.datetime(2017, 3, 1, 0, 0),
+                      datetime.datetime(2017, 3, 2, 0, 0))]
+        conflicts = find_vacation_conflicts(self.session, vacations)
+        for i, v in enumerate(vacations):
+            expected = get_overlapping_schedules(self.session, *v)
+            self.assertEqual(conflicts[i], [s.id for s in expected])
+        self.assertEqual(conflicts[2], [self.double2.id])
+        self.assertEqual(conflicts[3], [])
+
+
+    def test_vacation_after_shorter_schedule(self):
+        """Assert a vacation overlapping a longer schedule is not reported
+        for a shorter schedule within it that ends before the vacation."""
+        long_schedule = create_schedule(self.session,
+                                        datetime.datetime(2017, 2, 20, 8, 0),
+                                        datetime.datetime(2017, 2, 20, 20, 0),
+                                        'Front')
+        assign_schedule(self.session, self.employee2, long_schedule)
+        short_schedule = create_schedule(self.session,
+                                         datetime.datetime(2017, 2, 20, 9, 0),
+                                         datetime.datetime(2017, 2, 20, 10, 0),
+                                         'Front')
+        assign_schedule(self.session, self.employee2, short_schedule)
+        vacation = create_vacation(self.session,
+                                   datetime.datetime(2017, 2, 20, 12, 0),
+                                   datetime.datetime(2017, 2, 20, 13, 0), 2)
+        conflicts = find_conflicts(self.session, datetime.date(2017, 2, 20),
+                                   datetime.date(2017, 2, 20))
+        found = [(c.schedule_id, c.conflict_id) for c in conflicts
+                 if c.flag == '(V)']
+        self.assertEqual(found, [(long_schedule.id, vacation.id)])
+        
+        
+    def test_overnight_conflicts(self):
+        """Assert schedules past midnight conflict on the day they end."""
+        # February 27th is a Monday, employee 2 is unavailable Tuesdays
+        unavailable = create_schedule(self.session,
+                                      datetime.datetime(2017, 2, 27, 22, 0),
+                                      datetime.datetime(2017, 2, 28, 13, 0),
+                                      'Front')
+        assign_schedule(self.session, self.employee2, unavailable)
+        on_vacation = create_schedule(self.session,
+                                      datetime.datetime(2017, 2, 28, 22, 0),
+                                      datetime.datetime(2017, 3, 1, 6, 0),
+                                      'Front')
+        assign_schedule(self.session, self.employee1, on_vacation)
+        vacation = create_vacation(self.session,
+                                   datetime.datetime(2017, 3, 1, 0, 0),
+                                   datetime.datetime(2017, 3, 3, 0, 0), 1)
+        conflicts = find_conflicts(self.session, datetime.date(2017, 2, 27),
+                                   datetime.date(2017, 2, 28))
+        found = set((c.flag, c.schedule_id, c.conflict_id) 
+                    for c in conflicts)
+        self.assertEqual(found, set([('(U)', unavailable.id, 
+                                      self.unav_time.id),
+                                     ('(V)', on_vacation.id, vacation.id)]))
+
+
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class BulkScheduleTest(unittest.TestCase):
+    """Tests for creating many schedules in one transaction."""
+    
+    def setUp(self):
+        """Get a session and a week of schedules to create."""
+        self.session = orm.start_db('35', True)
+        self.schedule_tuples = []
+        for day in range(12, 19):
+            for dep in ['Front', 'Drivers']:
+                start = datetime.datetime(2017, 2, day, 9, 0)
+                end = datetime.datetime(2017, 2, day, 17, 0)
+                self.schedule_tuples.append((start, end, False, day == 18,
+                                             dep))
+        
+        
+    def test_create_schedules(self):
+        """Assert schedules are created with the same fields as one by one."""
+        schedules = create_schedules(self.session, self.schedule_tuples)
+        self.assertEqual(len(schedules), len(self.schedule_tuples))
+        for s, t in zip(schedules, self.schedule_tuples):
+            expected = orm.Schedule(*t)
+            for c in orm.Schedule.__table__.columns:
+                if c.name != 'id':
+                    self.assertEqual(getattr(s, c.name), 
+                                     getattr(expected, c.name))
+        days = get_affected_days(schedules)
+        self.assertEqual(len(days), 14)
+        self.assertIn((datetime.date(2017, 2, 18), 'Drivers'), days)
+        
+        
+    def test_invalid_schedules(self):
+        """Assert no schedules are created if any schedule is invalid."""
+        start = datetime.datetime(2017, 2, 20, 9, 0)
+        self.schedule_tuples.append((start, start, False, False, 'Front'))
+        self.assertRaises(ValueError, create_schedules, self.session,
+                          self.schedule_tuples)
+        self.assertEqual(self.session.query(orm.Schedule).count(), 0)
+        
+        
+    def test_clone_schedules(self):
+        """Assert a week is copied weekday aligned with its assignments."""
+        schedules = create_schedules(self.session, self.schedule_tuples)
+        employee = create_employee(self.session, 1)
+        for s in schedules[:2]:
+            assign_schedule(self.session, employee, s)
+        # February 12th is a Sunday, March 10th a Friday, so the week is
+        # moved 4 weeks to March 12th and the last 2 days 3 weeks instead.
+        clones, conflicts = clone_schedules(self.session, 'Front', 
+                                            datetime.date(2017, 2, 12),
+                                            datetime.date(2017, 2, 18),
+                                            datetime.date(2017, 3, 10),
+                                            True)
+        self.assertEqual([s.schedule_date.day for s in clones], 
+                         [10, 11, 12, 13, 14, 15, 16])
+        for s in clones:
+            self.assertEqual(s.department, 'Front')
+            self.assertEqual(s.calendar_date, datetime.date(2017, 3, 1))
+            self.assertEqual(s.start_datetime.weekday(), 
+                             s.schedule_date.weekday())
+            self.assertEqual(s.start_datetime.date(), s.schedule_date)
+            self.assertEqual(s.start_time, datetime.time(9, 0))
+        self.assertEqual(clones[2].employee_id, 1)
+        self.assertEqual(clones[3].employee_id, None)
+        self.assertEqual(conflicts, [])
+        # The Drivers copy of the 12th is assigned during the vacation and
+        # at the same time as the Front copy of the 12th
+        create_vacation(self.session, datetime.datetime(2017, 3, 12, 0, 0),
+                        datetime.datetime(2017, 3, 12, 23, 59), 1)
+        clones, conflicts = clone_schedules(self.session, 'Drivers', 
+                                            datetime.date(2017, 2, 12),
+                                            datetime.date(2017, 2, 12),
+                                            datetime.date(2017, 3, 12),
+                                            True)
+        self.assertEqual(len(clones), 1)
+        self.assertEqual(sorted(c.flag for c in conflicts), ['(S)', '(V)'])
+        
+        
+    def test_clone_month(self):
+        """Assert every day of a month is copied into the next month."""
+        schedule_tuples = []
+        for day in range(1, 32):
+            start = datetime.datetime(2017, 1, day, 9, 0)
+            end = datetime.datetime(2017, 1, day, 17, 0)
+            schedule_tuples.append((start, end, False, False, 'Front'))
+        create_schedules(self.session, schedule_tuples)
+        # January 1st is a Sunday and February 1st a Wednesday, so the 1st
+        # to the 3rd are moved 5 weeks rather than 4 to stay in the range.
+        clones, conflicts = clone_schedules(self.session, 'Front', 
+                                            datetime.date(2017, 1, 1),
+                                            datetime.date(2017, 1, 31),
+                                            datetime.date(2017, 2, 1))
+        self.assertEqual(len(clones), 31)
+        for s in clones:
+            self.assertTrue(datetime.date(2017, 2, 1) <= s.schedule_date 
+                            <= datetime.date(2017, 3, 3))
+            self.assertEqual(s.start_datetime.date(), s.schedule_date)
+        self.assertEqual(sorted(s.schedule_date.weekday() for s in clones),
+                         sorted(t[0].weekday() for t in schedule_tuples))
+        
+        
+    def test_delete_schedules(self):
+        """Assert only schedules of the department and range are deleted."""
+        schedules = create_schedules(self.session, self.schedule_tuples)
+        employee = create_employee(self.session, 1)
+        # Assign the Front schedule of February 13th
+        assign_schedule(self.session, employee, schedules[2])
+        ids = [s.id for s in schedules]
+        deleted = delete_schedules(self.session, 'Front', 
+                                   datetime.date(2017, 2, 13),
+                                   datetime.date(2017, 2, 15), True)
+        self.assertEqual([d.id for d in deleted], [ids[4], ids[6]])
+        self.assertEqual(get_affected_days(deleted),
+                         set([(datetime.date(2017, 2, 14), 'Front'),
+                              (datetime.date(2017, 2, 15), 'Front')]))
+        deleted = delete_schedules(self.session, 'Front', 
+                                   datetime.date(2017, 2, 12),
+                                   datetime.date(2017, 2, 18))
+        self.assertEqual(len(deleted), 5)
+        remaining = self.session.query(orm.Schedule).all()
+        self.assertEqual(len(remaining), 7)
+        self.assertEqual(set(s.department for s in remaining), 
+                         set(['Drivers']))
+        self.assertEqual(employee.schedules, [])
+        
+        
+    def test_remove_employee(self):
+        """Assert an employee's schedules are unassigned and rows deleted."""
+        schedules = create_schedules(self.session, self.schedule_tuples)
+        employee = create_employee(self.session, 1)
+        other = create_employee(self.session, 2)
+        assign_schedule(self.session, employee, schedules[0])
+        assign_schedule(self.session, other, schedules[1])
+        create_vacation(self.session, datetime.datetime(2017, 3, 1, 0, 0),
+                        datetime.datetime(2017, 3, 2, 0, 0), employee.id)
+        create_unavailable(self.session, datetime.time(9, 0), 
+                           datetime.time(12, 0), 0, employee.id)
+        employee_id, schedule_id = employee.id, schedules[0].id
+        unassigned = remove_employee(self.session, employee_id)
+        self.assertEqual([u.id for u in unassigned], [schedule_id])
+        self.assertEqual(schedules[0].employee_id, None)
+        self.assertEqual(schedules[1].employee_id, other.id)
+        self.assertEqual(self.session.query(orm.Employee).count(), 1)
+        self.assertEqual(self.session.query(orm.Vacation).count(), 0)
+        self.assertEqual(self.session.query(orm.UnavailableTime).count(), 0)
+        self.assertEqual(self.session.query(orm.Schedule).count(), 
+                         len(self.schedule_tuples))
+        
+        
+    def test_remove_department(self):
+        """Assert a department's rows are deleted and employees moved."""
+        create_department(self.session, 'Front')
+        drivers = create_department(self.session, 'Drivers')
+        schedules = create_schedules(self.session, self.schedule_tuples)
+        employee = create_employee(self.session, 1, p_dep='Front',
+                                   alt1_dep='Drivers')
+        assign_schedule(self.session, employee, schedules[1])
+        template = orm.ShiftTemplate('Drivers', 1, datetime.time(7, 0),
+                                     datetime.time(15, 0),
+                                     datetime.date(2017, 2, 1))
+        self.session.add_all([template,
+                              orm.StaffingRequirement('Drivers', 0,
+                                                      datetime.time(7, 0),
+                                                      datetime.time(15, 0),
+                                                      2)])
+        self.session.commit()
+        self.session.add(orm.ShiftOverride(template.id, 
+                                           datetime.date(2017, 2, 6)))
+        self.session.commit()
+        self.assertEqual(count_department_rows(self.session, drivers.id),
+                         (7, 1, 1))
+        deleted = remove_department(self.session, drivers.id)
+        self.assertEqual(len(deleted), 7)
+        self.assertEqual(set(d.department for d in deleted), 
+                         set(['Drivers']))
+        self.assertEqual([d.employee_id for d in deleted if d.employee_id],
+                         [employee.id])
+        self.assertEqual(set(s.department for s 
+                             in self.session.query(orm.Schedule)),
+                         set(['Front']))
+        for model in [orm.StaffingRequirement, orm.ShiftTemplate, 
+                      orm.ShiftOverride]:
+            self.assertEqual(self.session.query(model).count(), 0)
+        self.assertEqual(employee.primary_department, 'Front')
+        self.assertEqual(employee.alternate1_department, 'None')
+        self.assertEqual(employee.schedules, [])
+        self.assertEqual([d.name for d 
+                          in self.session.query(orm.Department)], ['Front'])
+        
+        
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class ShiftTemplateTest(unittest.TestCase):
+    """
+    Tests for expanding weekly shift templates into schedules.
+    
+    Drivers work 7 am to 3 pm Monday to Friday from February 1st, 2017, and
+    the Front works 9 am to 5 pm Saturdays from February 15th. February 2017
+    starts on a Wednesday.
+    """
+    
+    def setUp(self):
+        """Get a session and create the shift templates."""
+        self.session = orm.start_db('35', True)
+        self.drivers = orm.ShiftTemplate('Drivers', 0b0011111, 
+                                         datetime.time(7, 0), 
+                                         datetime.time(15, 0),
+                                         datetime.date(2017, 2, 1))
+        self.front = orm.ShiftTemplate('Front', 0b0100000, 
+                                       datetime.time(9, 0), 
+                                       datetime.time(17, 0),
+                                       datetime.date(2017, 2, 15))
+        self.session.add_all([self.drivers, self.front])
+        self.session.commit()
+        self.feb = datetime.date(2017, 2, 1)
+        
+        
+    def test_expand_templates(self):
+        """Assert a month is expanded once into a schedule per shift."""
+        self.assertTrue(has_unexpanded_templates(self.session, self.feb))
+        schedules = expand_templates(self.session, self.feb)
+        self.assertFalse(has_unexpanded_templates(self.session, self.feb))
+        driver_schedules = [s for s in schedules if s.department == 'Drivers']
+        front_schedules = [s for s in schedules if s.department == 'Front']
+        self.assertEqual(len(driver_schedules), 20)
+        self.assertEqual([s.schedule_date.day for s in front_schedules],
+                         [18, 25])
+        self.assertEqual(driver_schedules[0].start_datetime,
+                         datetime.datetime(2017, 2, 1, 7, 0))
+        # Removed schedules are not created again
+        self.session.delete(driver_schedules[0])
+        self.session.commit()
+        self.assertEqual(expand_templates(self.session, self.feb), [])
+        self.assertEqual(self.session.query(orm.Schedule).count(), 21)
+        # The Front template does not start until after January
+        jan = datetime.date(2017, 1, 1)
+        self.assertEqual(expand_templates(self.session, jan, 'Front'), [])
+        self.assertEqual(self.session.query(orm.TemplateExpansion).count(), 
+                         2)
+        
+        
+    def test_overrides(self):
+        """Assert overrides skip or change the times of a single shift."""
+        skip = orm.ShiftOverride(self.drivers.id, datetime.date(2017, 2, 20))
+        late = orm.ShiftOverride(self.drivers.id, datetime.date(2017, 2, 21),
+                                 datetime.time(10, 0), datetime.time(18, 0))
+        self.session.add_all([skip, late])
+        self.session.commit()
+        schedules = expand_templates(self.session, self.feb, 'Drivers')
+        days = dict((s.schedule_date.day, s) for s in schedules)
+        self.assertEqual(len(schedules), 19)
+        self.assertNotIn(20, days)
+        self.assertEqual(days[21].start_time, datetime.time(10, 0))
+        self.assertEqual(days[21].end_time, datetime.time(18, 0))
+        
+        
+    def test_skip_expanded_date(self):
+        """Assert skipping a date of an expanded month deletes its shift."""
+        schedules = expand_templates(self.session, self.feb, 'Drivers')
+        employee = create_employee(self.session, 1)
+        # February 20th is a Monday
+        day = datetime.date(2017, 2, 20)
+        create_schedule(self.session, datetime.datetime(2017, 2, 20, 7, 0),
+                        datetime.datetime(2017, 2, 20, 15, 0), 'Drivers')
+        assign_schedule(self.session, employee, 
+                        [s for s in schedules if s.schedule_date == day][0])
+        deleted = skip_template_date(self.session, self.drivers.id, day)
+        self.assertEqual(len(deleted), 1)
+        self.assertEqual(deleted[0][3], None)
+        # Skipping the date again neither deletes nor adds anything
+        self.assertEqual(skip_template_date(self.session, self.drivers.id,
+                                            day), [])
+        self.assertEqual(self.session.query(orm.ShiftOverride).count(), 1)
+        self.assertEqual(self.session.query(orm.Schedule)
+                             .filter(orm.Schedule.schedule_date == day)
+                             .one().employee_id, employee.id)
+        # Sundays are not worked, and the 21st has no shift once removed
+        self.assertRaises(ValueError, skip_template_date, self.session,
+                          self.drivers.id, datetime.date(2017, 2, 19))
+        (self.session.query(orm.Schedule)
+                     .filter(orm.Schedule.schedule_date 
+                             == datetime.date(2017, 2, 21))
+                     .delete())
+        self.session.commit()
+        self.assertRaises(ValueError, skip_template_date, self.session,
+                          self.drivers.id, datetime.date(2017, 2, 21))
+        
+        
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class UnitOfWorkTest(unittest.TestCase):
+    """Tests for transaction blocks and sessions without expire on commit."""
+    
+    def setUp(self):
+        """Get a session, create an employee and a schedule."""
+        self.session = orm.start_db('35', True)
+        self.employee = create_employee(self.session, 1)
+        self.schedule = create_schedule(self.session, 
+                                        datetime.datetime(2017, 2, 14, 9, 0),
+                                        datetime.datetime(2017, 2, 14, 17, 0),
+                                        'Front')
+        
+        
+    def test_savepoints(self):
+        """Assert a failed inner block only rolls back its own changes."""
+        start = datetime.datetime(2017, 2, 15, 9, 0)
+        end = datetime.datetime(2017, 2, 15, 17, 0)
+        with transaction(self.session):
+            self.employee.add_schedule(self.schedule)
+            commit(self.session)
+            try:
+                with transaction(self.session):
+                    schedule = orm.Schedule(start, end, False, False, 
+                                            'Front')
+                    self.session.add(schedule)
+                    commit(self.session)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.session.close()
+        schedules = self.session.query(orm.Schedule).all()
+        self.assertEqual(len(schedules), 1)
+        self.assertEqual(schedules[0].employee_id, 1)
+        
+        
+    def test_no_expire_on_commit(self):
+        """Assert commits keep objects loaded and collections up to date."""
+        assign_schedule(self.session, self.employee, self.schedule)
+        self.assertIn('first_name', self.employee.__dict__)
+        self.assertEqual(self.schedule.employee, self.employee)
+        remove_schedule(self.session, self.schedule)
+        self.assertEqual(self.employee.schedules, [])
+        
+        
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class WriteQueueTest(unittest.TestCase):
+    """Tests for running database writes in the write queue's worker."""
+    
+    def setUp(self):
+        """Get a session, a write queue with a worker and an employee."""
+        self.session = orm.start_db('35', True)
+        self.employee = create_employee(self.session, 1)
+        self.write_queue = WriteQueue(self.session, WidgetDummy())
+        self.results = []
+        self.errors = []
+        
+        
+    def wait_for_writes(self):
+        """Wait for the worker to run queued writes and call callbacks."""
+        self.write_queue.requests.join()
+        self.write_queue.release_session()
+        self.write_queue.process_results()
+        
+        
+    def test_write_in_worker(self):
+        """Assert a queued write is committed and its callback called."""
+        def write(session):
+            schedule = orm.Schedule(datetime.datetime(2017, 2, 14, 9, 0),
+                                    datetime.datetime(2017, 2, 14, 17, 0),
+                                    False, False, 'Front')
+            session.add(schedule)
+            session.flush()
+            return schedule.id
+            
+        self.write_queue.submit(write, self.results.append)
+        self.wait_for_writes()
+        self.assertEqual(len(self.results), 1)
+        schedule = self.session.query(orm.Schedule).get(self.results[0])
+        self.assertEqual(schedule.department, 'Front')
+        
+        
+    def test_failed_write(self):
+        """Assert a failed write is rolled back and its error returned."""
+        def write(session):
+            session.add(create_schedule_object('Front'))
+            session.flush()
+            raise ValueError
+            
+        self.write_queue.submit(write, self.results.append, 
+                                self.errors.append)
+        self.wait_for_writes()
+        self.assertEqual(self.results, [])
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.session.query(orm.Schedule).count(), 0)
+        
+        
+    def test_write_in_transaction_block(self):
+        """Assert writes inside a transaction block are run straight away."""
+        def write(session):
+            session.add(create_schedule_object('Front'))
+            
+        with transaction(self.session):
+            self.write_queue.submit(write, self.results.append)
+            self.assertEqual(self.results, [None])
+        self.assertEqual(self.session.query(orm.Schedule).count(), 1)
+        
+        
+    def tearDown(self):
+        """Stop the worker and remove everything from the database."""
+        self.write_queue.close()
+        clear_database(self.session)
+        
+        
+        
+class SessionScopeTest(unittest.TestCase):
+    """Tests for short-lived sessions and the read model cache."""
+    
+    def setUp(self):
+        """Get a session factory and a session of it."""
+        self.session_factory = orm.create_session_factory('35', True)
+        self.session = self.session_factory()
+        
+        
+    def test_session_scope(self):
+        """Assert a scoped session commits its changes and is closed."""
+        with session_scope(self.session_factory) as session:
+            session.add(orm.Department('Front'))
+        self.assertEqual(len(session.identity_map), 0)
+        self.assertEqual(self.session.query(orm.Department).count(), 1)
+        
+        
+    def test_expire_employee_rows(self):
+        """Assert rows another session writes show in loaded collections."""
+        employee = create_employee(self.session, 1)
+        self.assertEqual(employee.get_unav_masks()[1], 0)
+        with session_scope(self.session_factory) as session:
+            unav_time = orm.UnavailableTime(datetime.time(9, 0),
+                                            datetime.time(12, 0), 1, 
+                                            employee.id)
+            session.add(unav_time)
+        # Released like the write queue does, to read what was committed
+        self.session.commit()
+        expire_employee_rows(self.session, orm.UnavailableTime, employee.id)
+        self.assertNotEqual(employee.get_unav_masks()[1], 0)
+        with session_scope(self.session_factory) as session:
+            (session.query(orm.UnavailableTime)
+                    .delete(synchronize_session=False))
+        self.session.commit()
+        expire_employee_rows(self.session, orm.UnavailableTime, employee.id,
+                             [unav_time.id])
+        self.assertEqual(employee.get_unav_masks()[1], 0)
+        self.assertFalse([obj for obj in self.session.identity_map.values()
+                          if isinstance(obj, orm.UnavailableTime)])
+        
+        
+    def test_close_idle_session(self):
+        """Assert only a session without changes is closed."""
+        create_employee(self.session, 1)
+        self.assertTrue(close_idle_session(self.session))
+        self.assertEqual(len(self.session.identity_map), 0)
+        employee = self.session.query(orm.Employee).first()
+        employee.first_name = "Jane"
+        self.assertFalse(close_idle_session(self.session))
+        self.assertIn(employee, self.session)
+        self.session.rollback()
+        
+        
+    def test_read_model_cache(self):
+        """Assert read models are plain values kept until invalidated."""
+        read_cache = ReadModelCache(self.session_factory)
+        self.session.add(orm.Department('Front'))
+        self.session.add(orm.MonthSales(datetime.date(2017, 2, 1), 1000))
+        self.session.commit()
+        self.assertEqual(read_cache.get('departments'), ['Front'])
+        self.assertEqual(read_cache.get('monthly_sales'), 
+                         [(datetime.date(2017, 2, 1), 1000)])
+        self.session.add(orm.Department('Office'))
+        self.session.commit()
+        self.assertEqual(read_cache.get('departments'), ['Front'])
+        read_cache.invalidate('departments')
+        self.assertEqual(read_cache.get('departments'), ['Front', 'Office'])
+        self.session.add(orm.StaffingRequirement('Front', 5, 
+                                                 datetime.time(10, 0),
+                                                 datetime.time(18, 0), 2))
+        self.session.commit()
+        self.assertEqual(read_cache.get('staffing_requirements'),
+                         {'Front': [(5, 600, 1080, 2)]})
+        
+        
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class MonthSnapshotTest(unittest.TestCase):
+    """Tests for the read-only snapshots a calendar renders from."""
+    
+    def setUp(self):
+        """Create an employee and 2 overlapping schedules in February."""
+        self.session_factory = orm.create_session_factory('35', True)
+        self.session = self.session_factory()
+        self.employee = create_employee(self.session, 1, wage=10)
+        self.schedule1 = create_schedule(self.session, 
+                                         datetime.datetime(2017, 2, 14, 9, 0),
+                                         datetime.datetime(2017, 2, 14, 13, 0),
+                                         'Front')
+        self.schedule2 = create_schedule(self.session, 
+                                         datetime.datetime(2017, 2, 14, 12, 0),
+                                         datetime.datetime(2017, 2, 14, 16, 0),
+                                         'Front')
+        self.read_cache = ReadModelCache(self.session_factory)
+        self.snapshot = MonthSnapshot(self.session, self.read_cache,
+                                      datetime.date(2017, 2, 1), 'Front')
+        
+        
+    def test_snapshots_are_read_only(self):
+        """Assert a snapshot can only be changed by replacing it."""
+        schedule = self.snapshot.schedules[self.schedule1.id]
+        with self.assertRaises(AttributeError):
+            schedule.employee_id = 1
+        self.assertFalse(hasattr(schedule, '__dict__'))
+        assigned = schedule.replace(employee_id=1)
+        self.assertEqual(assigned.employee_id, 1)
+        self.assertEqual(schedule.employee_id, None)
+        
+        
+    def test_set_employee(self):
+        """Assert assigning a snapshot updates its cost and availability."""
+        employee = self.snapshot.get_employees()[1]
+        schedule2 = self.snapshot.schedules[self.schedule2.id]
+        self.assertEqual(self.snapshot.get_availability(employee, schedule2),
+                         '(A)')
+        schedule1 = self.snapshot.set_employee(self.schedule1.id, 1)
+        self.assertEqual(schedule1.cost(), 40)
+        self.assertEqual(self.snapshot.get_availability(employee, schedule1),
+                         '(A)')
+        self.assertEqual(self.snapshot.get_availability(employee, schedule2),
+                         '(S)')
+        self.snapshot.set_employee(self.schedule1.id, None)
+        self.assertEqual(self.snapshot.get_availability(employee, schedule2),
+                         '(A)')
+        
+        
+    def test_employee_directory(self):
+        """Assert display strings and wages are read from the directory."""
+        schedule1 = self.snapshot.set_employee(self.schedule1.id, 1)
+        self.assertEqual(schedule1.wage, 10)
+        self.assertEqual(self.snapshot.get_schedule_str(schedule1),
+                         "09:00 - 01:00  John")
+        directory = self.read_cache.get('employee_directory')
+        self.assertEqual(directory[1].get_name(), "John Doe")
+        # Changing vacations or unavailability only reloads the employees
+        self.read_cache.invalidate('employees')
+        self.read_cache.invalidate('vacations')
+        self.assertIs(self.read_cache.get('employee_directory'), directory)
+        
+        
+    def test_set_employee_wage(self):
+        """Assert a new wage prices the employee's schedules again."""
+        self.snapshot.set_employee(self.schedule1.id, 1)
+        self.snapshot.set_employee_wage(1, 12)
+        self.assertEqual(self.snapshot.schedules[self.schedule1.id].cost(), 
+                         48)
+        self.assertEqual(self.snapshot.columns.get_department_costs(),
+                         {'Front': 48})
+        
+        
+    def test_overtime(self):
+        """Assert hours of the week and month are read from aggregates."""
+        schedule3 = create_schedule(self.session, 
+                                    datetime.datetime(2017, 2, 15, 9, 0),
+                                    datetime.datetime(2017, 2, 15, 13, 0),
+                                    'Front')
+        self.employee.overtime = 6
+        assign_schedule(self.session, self.employee, self.schedule1)
+        self.snapshot.load_schedules()
+        employee = self.snapshot.get_employees()[1]
+        schedule1 = self.snapshot.schedules[self.schedule1.id]
+        schedule3 = self.snapshot.schedules[schedule3.id]
+        self.assertEqual(self.snapshot.get_availability(employee, schedule1),
+                         '(A)')
+        self.assertEqual(self.snapshot.get_availability(employee, schedule3),
+                         '(O)')
+        self.assertEqual(self.snapshot.get_month_hours(), {1: 4})
+        
+        
+    def test_queued_assignment(self):
+        """Assert hours include assignments not yet written."""
+        schedule3 = create_schedule(self.session, 
+                                    datetime.datetime(2017, 2, 15, 9, 0),
+                                    datetime.datetime(2017, 2, 15, 13, 0),
+                                    'Front')
+        self.employee.overtime = 6
+        self.session.commit()
+        self.snapshot.load_schedules()
+        employee = self.snapshot.get_employees()[1]
+        schedule3 = self.snapshot.schedules[schedule3.id]
+        self.snapshot.set_employee(self.schedule1.id, 1)
+        self.assertEqual(self.snapshot.get_availability(employee, schedule3),
+                         '(O)')
+        self.assertEqual(self.snapshot.get_month_hours(), {1: 4})
+        self.snapshot.set_employee(self.schedule1.id, None)
+        self.assertEqual(self.snapshot.get_availability(employee, schedule3),
+                         '(A)')
+        self.assertEqual(self.snapshot.get_month_hours(), {})
+        
+        
+    def test_reload_day(self):
+        """Assert a day is read again from the database when reloaded."""
+        assign_schedule(self.session, self.employee, self.schedule1)
+        day = datetime.date(2017, 2, 14)
+        self.assertEqual(self.snapshot.get_day_schedules(day)[0].employee_id,
+                         None)
+        self.snapshot.reload_day(day)
+        schedules = self.snapshot.get_day_schedules(day)
+        self.assertEqual([s.id for s in schedules], 
+                         [self.schedule1.id, self.schedule2.id])
+        self.assertEqual(schedules[0].employee_id, 1)
+
+
+    def test_created_schedules(self):
+        """Assert schedules created in bulk are added without a reload."""
+        start = datetime.datetime(2017, 2, 20, 9, 0)
+        end = start + datetime.timedelta(hours=4)
+        created = create_schedules(self.session,
+                                   [(start, end, True, False, 'Front')])
+        self.snapshot.set_schedule(get_schedule_snapshot(created[0]))
+        day = datetime.date(2017, 2, 20)
+        reloaded = MonthSnapshot(self.session, self.read_cache,
+                                 datetime.date(2017, 2, 1), 'Front')
+        self.assertEqual(self.snapshot.get_day_schedules(day),
+                         reloaded.get_day_schedules(day))
+        self.assertEqual(len(self.snapshot.get_day_schedules(day)), 1)
+
+
+    def test_deleted_schedules(self):
+        """Assert schedules deleted in bulk are removed without a reload."""
+        day = datetime.date(2017, 2, 14)
+        for d in delete_schedules(self.session, 'Front', day, day):
+            self.snapshot.remove_schedule(d.id)
+        self.assertEqual(self.snapshot.get_day_schedules(day), [])
+        self.assertEqual(len(self.snapshot.columns), 0)
+
+
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class MonthColumnsTest(unittest.TestCase):
+    """Tests for the columns of the schedules around a month."""
+    
+    def setUp(self):
+        """Append 3 schedules of February and 1 of the day before it."""
+        self.columns = MonthColumns(datetime.date(2017, 2, 1))
+        self.columns.append(self.create_snapshot(1, 14, 9, 'Front', 1, 10))
+        self.columns.append(self.create_snapshot(2, 14, 8, 'Front'))
+        self.columns.append(self.create_snapshot(3, 15, 9, 'Office', 2, 20))
+        self.columns.append(self.create_snapshot(4, 0, 22, 'Front', 2, 20))
+        
+        
+    def create_snapshot(self, id, day, hour, dep, employee_id=None, 
+                        wage=None):
+        """Return a ScheduleSnapshot of 4 hours from hour on a day."""
+        start = (datetime.datetime(2017, 2, 1, hour) 
+                 + datetime.timedelta(days=day - 1))
+        end = start + datetime.timedelta(hours=4)
+        calendar_date = datetime.date(start.year, start.month, 1)
+        return ScheduleSnapshot(id, calendar_date, start.date(), start, end,
+                                start.time(), end.time(), dep, False, False, 
+                                employee_id, wage)
+        
+        
+    def test_costs(self):
+        """Assert only schedules of the month are added to its costs."""
+        self.assertEqual(self.columns.get_department_costs(),
+                         {'Front': 40, 'Office': 80})
+        day_costs = self.columns.get_day_costs('Front', 28)
+        self.assertEqual(day_costs[13], 40)
+        self.assertEqual(sum(day_costs), 40)
+        
+        
+    def test_day_percentages(self):
+        """Assert each day's cost is relative to 1/28th of the revenue."""
+        percentages = get_day_percentages(
+                          self.columns.get_day_costs('Front', 28), 2800)
+        self.assertEqual(percentages[13], 40)
+        self.assertEqual(percentages[14], 0)
+        
+        
+    def test_day_ids(self):
+        """Assert a day's schedules are sorted by start time."""
+        self.assertEqual(self.columns.get_day_ids('Front', 13), [2, 1])
+        self.assertEqual(self.columns.get_day_ids('Office', 13), [])
+        
+        
+    def test_busy_employees(self):
+        """Assert employees working at a time are found in every department."""
+        start = datetime.datetime(2017, 2, 15, 12, 0)
+        end = datetime.datetime(2017, 2, 15, 14, 0)
+        self.assertEqual(self.columns.get_busy_employees(start, end), 
+                         set([2]))
+        self.assertEqual(self.columns.get_busy_employees(start, end, 3), 
+                         set())
+        start = datetime.datetime(2017, 2, 1, 0, 0)
+        self.assertEqual(self.columns.get_busy_employees(start, end), 
+                         set([1, 2]))
+        
+        
+    def test_delete(self):
+        """Assert deleting a row moves the last row into its place."""
+        self.assertTrue(self.columns.delete(1))
+        self.assertFalse(self.columns.delete(1))
+        self.assertEqual(len(self.columns), 3)
+        self.assertEqual(self.columns.rows[4], 0)
+        self.assertEqual(list(self.columns.ids), [4, 2, 3])
+        self.assertEqual(self.columns.get_department_costs(),
+                         {'Front': 0, 'Office': 80})
+        self.columns.append(self.create_snapshot(2, 14, 8, 'Front', 1, 10))
+        self.assertEqual(list(self.columns.ids), [4, 3, 2])
+        self.assertEqual(self.columns.get_department_costs()['Front'], 40)
+        
+        
+    def test_unassign_employee(self):
+        """Assert every schedule of an employee is unassigned at no cost."""
+        self.assertEqual(self.columns.unassign_employee(2), [3, 4])
+        self.assertEqual(self.columns.unassign_employee(5), [])
+        self.assertEqual(self.columns.get_department_costs(),
+                         {'Front': 40, 'Office': 0})
+        start = datetime.datetime(2017, 2, 1, 0, 0)
+        end = datetime.datetime(2017, 2, 28, 0, 0)
+        self.assertEqual(self.columns.get_busy_employees(start, end), 
+                         set([1]))
+        
+        
+    def test_set_employee_wage(self):
+        """Assert every schedule of an employee is priced at a new wage."""
+        self.assertEqual(self.columns.set_employee_wage(2, 25), [3, 4])
+        self.assertEqual(self.columns.set_employee_wage(5, 25), [])
+        self.assertEqual(self.columns.get_department_costs(),
+                         {'Front': 40, 'Office': 100})
+        
+        
+    def test_delete_department(self):
+        """Assert every schedule of a department is deleted."""
+        self.assertEqual(self.columns.delete_department('Front'), [1, 2, 4])
+        self.assertEqual(self.columns.delete_department('Drivers'), [])
+        self.assertEqual(list(self.columns.ids), [3])
+        self.assertEqual(self.columns.rows, {3: 0})
+        self.assertEqual(self.columns.get_day_ids('Office', 14), [3])
+        self.assertEqual(self.columns.get_department_costs(), 
+                         {'Front': 0, 'Office': 80})
+        
+        
+        
+class MonthFileTest(unittest.TestCase):
+    """Tests for saving a month to a file and opening it again."""
+    
+    def setUp(self):
+        """Create a snapshot of a month with an assigned schedule."""
+        self.session_factory = orm.create_session_factory('35', True)
+        self.session = self.session_factory()
+        employee = create_employee(self.session, 1, wage=10)
+        self.schedule1 = create_schedule(self.session, 
+                                         datetime.datetime(2017, 2, 14, 9, 0),
+                                         datetime.datetime(2017, 2, 14, 13, 0),
+                                         'Front', s_undet=True)
+        self.schedule2 = create_schedule(self.session, 
+                                         datetime.datetime(2017, 2, 14, 12, 0),
+                                         datetime.datetime(2017, 2, 14, 16, 0),
+                                         'Front')
+        assign_schedule(self.session, employee, self.schedule1)
+        self.date = datetime.date(2017, 2, 1)
+        self.snapshot = MonthSnapshot(self.session, 
+                                      ReadModelCache(self.session_factory),
+                                      self.date, 'Front')
+        self.path = get_month_file_path(get_db_path(self.session))
+        
+        
+    def test_reopen(self):
+        """Assert a saved month is opened with the same schedules."""
+        self.session.close()
+        self.assertTrue(save_month_file(self.snapshot))
+        read_cache = ReadModelCache(self.session_factory)
+        snapshot = load_month_file(self.session, read_cache, self.date, 
+                                   'Front')
+        self.assertEqual(snapshot.schedules, self.snapshot.schedules)
+        self.assertEqual(list(snapshot.columns.ids), 
+                         list(self.snapshot.columns.ids))
+        self.assertEqual(snapshot.get_views(), self.snapshot.get_views())
+        self.assertEqual(snapshot.get_availability(
+                             read_cache.get('employees')[1],
+                             snapshot.schedules[self.schedule2.id]), 
+                         '(S)')
+        self.assertIsNone(load_month_file(self.session, read_cache, 
+                                          self.date, 'Office'))
+        self.assertTrue(os.path.exists(self.path))
+        
+        
+    def test_stale_file(self):
+        """Assert a month file is deleted once the database changes."""
+        self.session.close()
+        save_month_file(self.snapshot)
+        create_schedule(self.session, datetime.datetime(2017, 2, 15, 9, 0),
+                        datetime.datetime(2017, 2, 15, 13, 0), 'Front')
+        read_cache = ReadModelCache(self.session_factory)
+        self.assertIsNone(load_month_file(self.session, read_cache, 
+                                          self.date, 'Front'))
+        self.assertFalse(os.path.exists(self.path))
+        
+        
+    def test_no_queries(self):
+        """Assert a current month file opens without querying the database."""
+        self.session.close()
+        save_month_file(self.snapshot)
+        statements = []
+        
+        def on_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+            
+        event.listen(self.session.bind, 'before_cursor_execute', on_execute)
+        try:
+            read_cache = ReadModelCache(self.session_factory)
+            self.assertTrue(load_read_models(self.session, read_cache))
+            self.assertEqual(read_cache.get('departments'), [])
+            self.assertEqual(read_cache.get('staffing_requirements'), {})
+            snapshot = load_month_file(self.session, read_cache, self.date, 
+                                       'Front')
+            coverage = MonthCoverage(self.session, self.date, 'Front',
+                                     snapshot.columns)
+            employee = read_cache.get('employees')[1]
+            schedule2 = snapshot.schedules[self.schedule2.id]
+            self.assertEqual(snapshot.get_availabilities([employee], 
+                                                         schedule2), 
+                             ['(S)'])
+            self.assertEqual(snapshot.get_month_hours(), {1: 4})
+        finally:
+            event.remove(self.session.bind, 'before_cursor_execute', 
+                         on_execute)
+        self.assertEqual(statements, [])
+        self.assertEqual(coverage.get_day_coverage(13)[0][40], 1)
+        
+        
+    def test_damaged_file(self):
+        """Assert a month file that cannot be parsed is deleted."""
+        self.session.close()
+        save_month_file(self.snapshot)
+        with open(self.path, 'rb') as month_file:
+            data = month_file.read()
+        with open(self.path, 'wb') as month_file:
+            month_file.write(data[:-10])
+        read_cache = ReadModelCache(self.session_factory)
+        self.assertFalse(load_read_models(self.session, read_cache))
+        self.assertIsNone(load_month_file(self.session, read_cache, 
+                                          self.date, 'Front'))
+        self.assertFalse(os.path.exists(self.path))
+        
+        
+    def test_current_startup(self):
+        """Assert startup only reads the schema version of a current file."""
+        self.session.close()
+        save_month_file(self.snapshot)
+        statements = []
+        
+        def on_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+            
+        event.listen(Engine, 'before_cursor_execute', on_execute)
+        try:
+            session_factory = orm.create_session_factory('35', True)
+            session_factory.kw['bind'].dispose()
+        finally:
+            event.remove(Engine, 'before_cursor_execute', on_execute)
+        self.assertEqual(statements, ["PRAGMA user_version"])
+        self.assertTrue(is_month_file_current(get_db_path(self.session)))
+        
+        
+    def test_remove_month_file(self):
+        """Assert only a month file of the month changed is deleted."""
+        self.session.close()
+        save_month_file(self.snapshot)
+        remove_month_file(self.session, datetime.date(2017, 3, 1))
+        self.assertTrue(os.path.exists(self.path))
+        remove_month_file(self.session, datetime.date(2017, 2, 14))
+        self.assertFalse(os.path.exists(self.path))
+        
+        
+    def tearDown(self):
+        """Remove everything from the database and the month file."""
+        clear_database(self.session)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        
+        
+        
+class ArchiveTest(unittest.TestCase):
+    """Tests for archiving schedules of closed months by year."""
+    
+    def setUp(self):
+        """Create an assigned schedule in each of 3 months of 2 years."""
+        self.session = orm.start_db('35', True)
+        employee = create_employee(self.session, 1, wage=10)
+        for start in [datetime.datetime(2016, 3, 2, 9, 0),
+                      datetime.datetime(2016, 12, 2, 9, 0),
+                      datetime.datetime(2017, 3, 2, 9, 0)]:
+            schedule = create_schedule(self.session, start, 
+                                       start + datetime.timedelta(hours=4),
+                                       'Front')
+            assign_schedule(self.session, employee, schedule)
+        self.db_path = self.session.bind.url.database
+        
+        
+    def test_archive_months(self):
+        """Assert closed months are moved and still read by reports."""
+        moved = archive_months(self.session, datetime.date(2017, 1, 1))
+        self.assertEqual(moved, {2016: 2})
+        self.assertTrue(os.path.exists(get_archive_path(self.db_path, 2016)))
+        self.assertEqual(self.session.query(orm.Schedule).count(), 1)
+        costs = get_monthly_costs(self.session, 2016)
+        self.assertEqual(costs[2], 40)
+        self.assertEqual(costs[11], 40)
+        self.assertEqual(get_monthly_costs(self.session, 2017)[2], 40)
+        self.assertEqual(archive_months(self.session, 
+                                        datetime.date(2017, 1, 1)), {})
+        
+        
+    def test_archive_greatest_key(self):
+        """Assert the schedule of the greatest key is archived too."""
+        last = create_schedule(self.session, 
+                               datetime.datetime(2016, 6, 2, 9, 0),
+                               datetime.datetime(2016, 6, 2, 13, 0), 'Front')
+        moved = archive_months(self.session, datetime.date(2017, 1, 1))
+        self.assertEqual(moved, {2016: 3})
+        self.assertEqual(self.session.query(orm.Schedule)
+                                     .filter(orm.Schedule.id == last.id)
+                                     .count(), 0)
+        # A new schedule is not given the key of the archived one
+        schedule = create_schedule(self.session, 
+                                   datetime.datetime(2017, 4, 2, 9, 0),
+                                   datetime.datetime(2017, 4, 2, 13, 0), 
+                                   'Front')
+        self.assertGreater(schedule.id, last.id)
+        
+        
+    def tearDown(self):
+        """Remove everything from the database and the archive."""
+        self.session.close()
+        self.session.bind.dispose()
+        clear_database(self.session)
+        path = get_archive_path(self.db_path, 2016)
+        if os.path.exists(path):
+            os.remove(path)
+        
+        
+        
+class EmployeeKeyMigrationTest(unittest.TestCase):
+    """Tests for keying rows of employees on Employee.id."""
+    
+    def setUp(self):
+        """Create rows keyed on employee_id as schema version 0 had them."""
+        self.session = orm.start_db('35', True)
+        self.employee1 = create_employee(self.session, 7)
+        self.employee2 = create_employee(self.session, 9)
+        schedule = create_schedule(self.session, 
+                                   datetime.datetime(2017, 2, 14, 9, 0),
+                                   datetime.datetime(2017, 2, 14, 13, 0),
+                                   'Front')
+        create_vacation(self.session, datetime.datetime(2017, 2, 1), 
+                        datetime.datetime(2017, 2, 2), 7)
+        self.session.execute(orm.Schedule.__table__.update()
+                                .values(employee_id=9))
+        self.session.execute("PRAGMA user_version = 0")
+        self.session.commit()
+        self.session.close()
+        self.session.bind.dispose()
+        
+        
+    def test_migrate_employee_keys(self):
+        """Assert rows refer to the primary key of their employee."""
+        self.session = orm.start_db('35', True)
+        schedule = self.session.query(orm.Schedule).one()
+        self.assertEqual(schedule.employee_id, self.employee2.id)
+        vacation = self.session.query(orm.Vacation).one()
+        self.assertEqual(vacation.employee_id, self.employee1.id)
+        self.assertEqual(orm.get_schema_version(self.session), 
+                         orm.SCHEMA_VERSION)
+        
+        
+    def test_change_employee_id(self):
+        """Assert changing an employee_id keeps the employee's schedules."""
+        self.session = orm.start_db('35', True)
+        employee = self.session.query(orm.Employee).get(self.employee2.id)
+        employee.employee_id = 10
+        self.session.commit()
+        self.assertEqual(len(employee.schedules), 1)
+        
+        
+    def test_resume_migration(self):
+        """Assert a migration interrupted between batches is resumed."""
+        engine = orm.create_db_engine('35', True)
+        enable_savepoints(engine)
+        
+        def interrupt(message):
+            raise ValueError(message)
+            
+        self.assertRaises(ValueError, upgrade_database, engine, 1, interrupt)
+        self.assertEqual(engine.scalar("PRAGMA user_version"), 0)
+        self.assertEqual(engine.scalar("SELECT COUNT(*) FROM schedules"), 1)
+        applied = upgrade_database(engine, 1)
+        self.assertEqual(applied, MIGRATIONS)
+        self.assertEqual(MIGRATIONS[-1].version, orm.SCHEMA_VERSION)
+        tables = engine.table_names()
+        self.assertNotIn('schedules_old', tables)
+        self.assertNotIn('unavailable_old', tables)
+        self.assertEqual(engine.scalar("SELECT employee_id FROM unavailable"),
+                         self.employee1.id)
+        engine.dispose()
+        self.session = orm.start_db('35', True)
+        schedule = self.session.query(orm.Schedule).one()
+        self.assertEqual(schedule.employee_id, self.employee2.id)
+        
+        
+    def tearDown(self):
+        """Remove everything from the database."""
+        self.session.close()
+        clear_database(self.session)
+        
+        
+        
+class ScheduleKeyMigrationTest(unittest.TestCase):
+    """Tests for giving schedules keys that are never reused."""
+    
+    def setUp(self):
+        """Create schedules in a table without AUTOINCREMENT keys."""
+        self.session = orm.start_db('35', True)
+        for day in [14, 15]:
+            create_schedule(self.session, 
+                            datetime.datetime(2017, 2, day, 9, 0),
+                            datetime.datetime(2017, 2, day, 13, 0), 'Front')
+        self.session.close()
+        engine = self.session.bind
+        # The table of schema version 3 had the columns of archives
+        with engine.begin() as connection:
+            orm.drop_aggregate_triggers(connection)
+            connection.execute("ALTER TABLE schedules RENAME TO plain")
+            connection.execute(CreateTable(get_archive_table(None)))
+            connection.execute("INSERT INTO schedules SELECT * FROM plain")
+            connection.execute("DROP TABLE plain")
+            orm.set_schema_version(connection, 3)
+        
+        
+    def test_rebuild_schedules(self):
+        """Assert the rows are kept and a deleted key is not reused."""
+        engine = self.session.bind
+        applied = upgrade_database(engine, 1)
+        self.assertEqual([m.version for m in applied], [4])
+        self.assertIn('AUTOINCREMENT', 
+                      engine.scalar("SELECT sql FROM sqlite_master "
+                                    "WHERE name = 'schedules'"))
+        self.assertEqual(engine.scalar("SELECT COUNT(*) FROM schedules"), 2)
+        max_id = engine.scalar("SELECT MAX(id) FROM schedules")
+        engine.execute("DELETE FROM schedules WHERE id = ?", max_id)
+        schedule = create_schedule(self.session, 
+                                   datetime.datetime(2017, 2, 16, 9, 0),
+                                   datetime.datetime(2017, 2, 16, 13, 0), 
+                                   'Front')
+        self.assertGreater(schedule.id, max_id)
+        
+        
+    def tearDown(self):
+        """Remove everything from the database."""
+        self.session.close()
+        clear_database(self.session)
+        
+        
+        
+class HistoryFileTest(unittest.TestCase):
+    """Tests for exporting and importing a year of schedules."""
+    
+    def setUp(self):
+        """Create an assigned schedule in each of 2 months of 2016."""
+        self.session = orm.start_db('35', True)
+        employee = create_employee(self.session, 1, wage=10)
+        for start in [datetime.datetime(2016, 3, 2, 9, 0),
+                      datetime.datetime(2016, 12, 2, 9, 0)]:
+            schedule = create_schedule(self.session, start, 
+                                       start + datetime.timedelta(hours=4),
+                                       'Front')
+            assign_schedule(self.session, employee, schedule)
+        self.db_path = self.session.bind.url.database
+        self.history_path = get_archive_path(self.db_path, 2016) + '.history'
+        
+        
+    def test_history_round_trip(self):
+        """Assert live and archived schedules of a year are read back."""
+        archive_months(self.session, datetime.date(2016, 12, 1))
+        self.assertEqual(export_history(self.session, 2016, 
+                                        self.history_path, batch_size=1), 2)
+        reader = HistoryReader(self.history_path)
+        self.assertEqual((reader.year, reader.rows), (2016, 2))
+        batches = list(reader)
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(batches[1].start_datetimes, 
+                         [datetime.datetime(2016, 12, 2, 9, 0)])
+        self.assertEqual(batches[1].end_datetimes, 
+                         [datetime.datetime(2016, 12, 2, 13, 0)])
+        self.assertEqual(batches[0].employee_ids, [1])
+        self.assertEqual(batches[0].departments, ['Front'])
+        
+        self.session.query(orm.Schedule).delete()
+        self.session.commit()
+        connection = self.session.bind.connect()
+        self.assertEqual(import_history(connection, self.history_path), 2)
+        connection.close()
+        self.assertEqual(get_monthly_costs(self.session, 2016)[11], 40)
+        schedule = (self.session.query(orm.Schedule)
+                                .filter_by(id=batches[1].ids[0]).one())
+        self.assertEqual(schedule.start_time, datetime.time(9, 0))
+        self.assertEqual(schedule.calendar_date, datetime.date(2016, 12, 1))
+        
+        
+    def tearDown(self):
+        """Remove everything from the database, archive and history file."""
+        self.session.close()
+        self.session.bind.dispose()
+        clear_database(self.session)
+        for path in [get_archive_path(self.db_path, 2016), self.history_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        
+        
+        
+class CoreReadsTest(unittest.TestCase):
+    """Tests for reading columns of schedules without the ORM."""
+    
+    def setUp(self):
+        """Create an employee assigned to 1 of 2 schedules."""
+        self.session = orm.start_db('35', True)
+        self.employee = create_employee(self.session, 1, wage=10)
+        self.schedule1 = create_schedule(self.session, 
+                                         datetime.datetime(2017, 2, 14, 9, 0),
+                                         datetime.datetime(2017, 2, 14, 13, 0),
+                                         'Front')
+        self.schedule2 = create_schedule(self.session, 
+                                         datetime.datetime(2017, 2, 15, 9, 0),
+                                         datetime.datetime(2017, 2, 15, 13, 0),
+                                         'Front')
+        assign_schedule(self.session, self.employee, self.schedule1)
+        
+        
+    def test_select_schedules(self):
+        """Assert rows have the columns asked for and the wage last."""
+        rows = select_schedules(self.session, ['id', 'employee_id'],
+                                [orm.Schedule.department == 'Front'],
+                                wage=True, order_by=['start_datetime'])
+        self.assertEqual([tuple(row) for row in rows], 
+                         [(self.schedule1.id, 1, 10), 
+                          (self.schedule2.id, None, None)])
+        self.assertEqual(rows[0].wage, 10)
+        
+        
+    def test_select_schedule_columns(self):
+        """Assert columns are returned as parallel lists."""
+        ids, employee_ids = select_schedule_columns(
+                                self.session, ['id', 'employee_id'],
+                                [orm.Schedule.employee_id != None])
+        self.assertEqual(ids, [self.schedule1.id])
+        self.assertEqual(employee_ids, [1])
+        self.assertEqual(select_schedule_columns(self.session, ['id'],
+                                                 [orm.Schedule.id == -1],
+                                                 wage=True),
+                         ([], []))
+        
+        
+    def tearDown(self):
+        """Remove everything from the database."""
+        clear_database(self.session)
+        
+        
+        
+class PerformanceProfileTest(unittest.TestCase):
+    """Tests for setting the PRAGMAs of a performance profile."""
+    
+    def test_profile_pragmas(self):
+        """Assert each PRAGMA of the profile is set on the connection."""
+        session = orm.start_db('35', True, 'fast')
+        profile = orm.PERFORMANCE_PROFILES['fast']
+        self.assertEqual(session.execute("PRAGMA journal_mode").scalar(), 
+                         'wal')
+        self.assertEqual(session.execute("PRAGMA synchronous").scalar(), 1)
+        self.assertEqual(session.execute("PRAGMA cache_size").scalar(),
+                         profile['cache_size'])
+        self.assertEqual(session.execute("PRAGMA temp_store").scalar(), 2)
+        session.close()
+        
+        
+    def test_invalid_profile(self):
+        """Assert unknown PRAGMAs and values that are not words are refused."""
+        self.assertRaises(ValueError, orm.start_db, '35', True, 
+                          {'page_size': 4096})
+        self.assertRaises(ValueError, orm.start_db, '35', True, 
+                          {'synchronous': 'OFF; DROP TABLE schedules'})
+        
+        
+        
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -3,10 +3,17 @@ Python module for test doubles: dummies, fakes, stubs, and mocks.
 """
 
 
+class CalendarDisplayDummy:
+
+    def __init__(self, snapshot=None):
+        self.snapshot = snapshot
+        
+        
+        
 class DayModelDummy:
 
-    def __init__(self):
-        pass
+    def __init__(self, cal=None):
+        self.cal = cal
         
         
     def update_costs(self):
@@ -14,4 +21,15 @@ class DayModelDummy:
         
         
     def get_schedule_str(self, str):
+        pass
+        
+        
+        
+class WidgetDummy:
+
+    def __init__(self):
+        pass
+        
+        
+    def after(self, ms, func):
         pass
\ No newline at end of file